@@ -1,15 +1,31 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import Flask, Response, request, jsonify, session, send_file, stream_with_context
 from flask_cors import CORS
 import os
-import pandas as pd
 import requests
 from groq import Groq
 from datetime import timedelta
+from functools import partial
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from io import BytesIO
 from PIL import Image
 import base64
-import detection
+import json
+import hashlib
+import vision
+import modelos
+import orquestador
+import trabajos
+import conversaciones
+import catalogo
+import recuperacion
+import galeria
+import derivados
+import cache_analisis
+import calidad
+import prompts
+import contexto
+from hechos import HechosSesion
 import httpx
 import logging
 
@@ -31,7 +47,29 @@ app.config.update(
 # Configuración para subir imágenes
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB máximo
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Guardar copia de cada imagen subida solo en modo depuración (GUARDAR_SUBIDAS=1)
+app.config['GUARDAR_SUBIDAS'] = os.environ.get(
+    "GUARDAR_SUBIDAS", "0").lower() in ("1", "true", "si", "sí")
+if app.config['GUARDAR_SUBIDAS']:
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# Pool acotado para el análisis de imágenes: ANALISIS_WORKERS análisis a la vez y
+# hasta ANALISIS_COLA_MAX en espera; por encima se responde 503 (ocupado). El
+# estado de los trabajos se comparte entre workers (ver trabajos.py)
+cola_analisis = trabajos.crear_cola(
+    max_workers=int(os.environ.get("ANALISIS_WORKERS", 1)),
+    max_pendientes=int(os.environ.get("ANALISIS_COLA_MAX", 4))
+)
+# Resultados del análisis por contenido de la imagen (ver cache_analisis.py)
+cache_resultados = cache_analisis.crear_cache()
+
+# Cache HTTP de /imagenes: un año para las URLs con hash, unos minutos para el resto
+CACHE_INMUTABLE_SEGUNDOS = 365 * 24 * 3600
+CACHE_IMAGENES_SEGUNDOS = int(os.environ.get("CACHE_IMAGENES_SEGUNDOS", 300))
+# Máximo de fotos por petición en /subir-imagenes
+ANALISIS_LOTE_MAX = int(os.environ.get("ANALISIS_LOTE_MAX", 6))
+ESPERA_ANALISIS_SEGUNDOS = 280  # por debajo del timeout de gunicorn (-t 300)
+REINTENTAR_TRAS_SEGUNDOS = 10
 
 # Configura CORS para permitir solicitudes desde distintos orígenes
 frontend_urls = [
@@ -41,9 +79,45 @@ frontend_urls = [
 ]
 CORS(app, supports_credentials=True, origins=frontend_urls)
 
-# Diccionario global para almacenar el historial de conversación por cada sesión
-# NOTA: Ahora usamos un almacenamiento en memoria en lugar de cookies para historiales largos
-historial_conversaciones = {}
+# Perfil dividido (MODO_SERVIDOR=dividido, ver arrancar.sh): con VISION_URL este
+# proceso solo atiende el chat y reenvía el análisis de imágenes al proceso de
+# visión, el único que importa torch/TensorFlow/MediaPipe y carga los modelos.
+# Ambos comparten el historial (CONVERSACIONES_BACKEND=sqlite) y SECRET_KEY.
+VISION_URL = os.environ.get("VISION_URL", "").rstrip("/")
+RUTAS_VISION = ("/subir-imagen", "/trabajos/")
+# Cabeceras que no se reenvían (de salto o que recalcula cada extremo)
+CABECERAS_EXCLUIDAS = {"connection", "keep-alive", "transfer-encoding", "te",
+                       "upgrade", "proxy-authorization", "proxy-authenticate",
+                       "host", "content-length", "content-encoding"}
+
+
+@app.before_request
+def reenviar_a_vision():
+    if not VISION_URL or request.method == "OPTIONS" or not request.path.startswith(RUTAS_VISION):
+        return None
+
+    cabeceras = {k: v for k, v in request.headers.items()
+                 if k.lower() not in CABECERAS_EXCLUIDAS}
+    cabeceras["X-Forwarded-For"] = request.remote_addr or ""
+    try:
+        remota = requests.request(
+            request.method, f"{VISION_URL}{request.full_path}", headers=cabeceras,
+            data=request.get_data(), stream=True, allow_redirects=False,
+            timeout=(5, ESPERA_ANALISIS_SEGUNDOS + 15))
+    except requests.RequestException as e:
+        logging.error(f"❌ Proceso de visión no disponible: {e}")
+        return respuesta_cola_llena()
+
+    # CORS lo añade este proceso (flask_cors), no se copia el del proceso de visión
+    cabeceras = [(k, v) for k, v in remota.raw.headers.items()
+                 if k.lower() not in CABECERAS_EXCLUIDAS
+                 and not k.lower().startswith("access-control-")]
+    return Response(stream_with_context(remota.iter_content(chunk_size=None)),
+                    status=remota.status_code, headers=cabeceras)
+
+# Almacén del historial de conversación por cada sesión (memoria LRU+TTL o SQLite
+# compartido entre workers, ver conversaciones.crear_almacen)
+historial_conversaciones = conversaciones.crear_almacen()
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 http_client = httpx.Client(proxies=None)  # fuerza que no pase proxies
 client = Groq(api_key=GROQ_API_KEY, http_client=http_client)
@@ -51,18 +125,28 @@ client = Groq(api_key=GROQ_API_KEY, http_client=http_client)
 
 # Variable global para almacenar los vestidos cargados
 vestidos_formateados = ""
+catalogo_vestidos = catalogo.Catalogo([])
 
-# Carga la base de vestidos al inicio
+# Carga la base de vestidos al inicio (instantánea compilada si está vigente)
 try:
-    base_vestidos = pd.read_excel('base_vestidos.xlsx')
-    vestidos_formateados = "\n\n".join([  # Formatea la base de datos de vestidos
-        f"DISEÑO: {row['DISEÑO']}\nDESCRIPCIÓN: {row['DESCRIPCION']}\nCOLORES: {row['COLORES']}\nMATERIAL: {row['MATERIAL']}\nORIGEN: {row['ORIGEN']}"
-        for _, row in base_vestidos.iterrows()
-    ])
+    catalogo_vestidos = catalogo.cargar_catalogo()
+    vestidos_formateados = catalogo_vestidos.texto_prompt()
 except Exception as e:
     print(f"Error cargando base de vestidos: {e}")
     vestidos_formateados = "Base de vestidos no disponible"
 
+# Con CATALOGO_RECUPERACION=1 (por defecto) el prompt no incluye el catálogo:
+# cada petición añade solo los vestidos relevantes (ver recuperacion.py). Con un
+# catálogo que no supera la selección máxima se envía entero en el prompt.
+RECUPERACION_CATALOGO = recuperacion.compensa(catalogo_vestidos) and os.environ.get(
+    "CATALOGO_RECUPERACION", "1").lower() in ("1", "true", "si", "sí")
+indice_catalogo = recuperacion.IndiceCatalogo(catalogo_vestidos)
+# Imágenes de cada diseño, indexadas una vez para resolver [MOSTRAR_IMAGEN: ...]
+galeria_imagenes = galeria.Galeria(catalogo_vestidos)
+if RECUPERACION_CATALOGO:
+    vestidos_formateados = ("En cada turno recibirás un mensaje con los diseños disponibles "
+                            "y el detalle de los vestidos más relevantes para la conversación.")
+
 # Definir el prompt base para el asistente
 prompt_base = f"""
 Eres Alzárea, asesora de estilo digital de un exclusivo ATELIER de moda artesanal. Tu tono debe ser:
@@ -129,25 +213,56 @@ Base de vestidos y colores disponibles:
 {vestidos_formateados}
 """
 
+# El prompt se interna una sola vez; las sesiones guardan solo su versión
+PROMPT_VERSION = prompts.registrar_prompt(prompt_base)
+
 # Ruta para servir imágenes estáticas
 
 
 @app.route('/imagenes/<path:filename>')
 def servir_imagenes(filename):
-    # Intenta servir desde la carpeta 'imagenes' en el directorio actual
-    imagenes_dir = os.path.join(os.path.dirname(
-        os.path.abspath(__file__)), 'imagenes')
-    if os.path.exists(imagenes_dir):
-        return send_from_directory(imagenes_dir, filename)
-
-    # Si no existe, intenta servir desde 'static/imagenes'
-    static_imagenes_dir = os.path.join(os.path.dirname(
-        os.path.abspath(__file__)), 'static', 'imagenes')
-    if os.path.exists(static_imagenes_dir):
-        return send_from_directory(static_imagenes_dir, filename)
-
-    # Si no encuentra la imagen en ningún lugar, devuelve 404
-    return "Imagen no encontrada", 404
+    """Sirve una imagen del manifiesto (ver galeria.py) o, si el navegador
+    acepta WebP/AVIF o pide un ancho (?w=640), su derivado (ver derivados.py).
+
+    Las URLs con el hash del contenido (SOPHIE.<hash>.jpg) se marcan como
+    inmutables; el resto se revalida con ETag / If-None-Match (304).
+    """
+    archivo, versionada = galeria_imagenes.buscar(filename)
+    if archivo is None:
+        return "Imagen no encontrada", 404
+
+    ruta, tipo, etag = archivo["ruta"], archivo["tipo"], archivo["hash"]
+    derivado = derivados.negociar(ruta, request.headers.get("Accept"),
+                                  request.args.get("w", type=int))
+    if derivado:
+        ruta, tipo = derivado
+        etag = f"{archivo['hash']}-{os.path.basename(ruta)}"
+
+    respuesta = send_file(ruta, mimetype=tipo, etag=etag, conditional=True,
+                          max_age=CACHE_INMUTABLE_SEGUNDOS if versionada else CACHE_IMAGENES_SEGUNDOS)
+    respuesta.cache_control.public = True
+    if versionada:
+        respuesta.cache_control.immutable = True
+    respuesta.vary.add("Accept")
+    return respuesta
+
+# Consulta del catálogo compilado: /catalogo?color=rosa&material=seda&origen=italia
+
+
+@app.route('/catalogo', methods=['GET'])
+def consultar_catalogo():
+    vestidos = catalogo_vestidos.vestidos
+    filtros = {
+        "color": catalogo_vestidos.por_color,
+        "material": catalogo_vestidos.por_material,
+        "origen": catalogo_vestidos.por_origen
+    }
+    for parametro, buscar in filtros.items():
+        valor = request.args.get(parametro)
+        if valor:
+            encontrados = {v["diseno"] for v in buscar(valor)}
+            vestidos = [v for v in vestidos if v["diseno"] in encontrados]
+    return jsonify({"vestidos": vestidos})
 
 # Ruta para reiniciar el historial
 
@@ -160,77 +275,410 @@ def home():
 @app.route('/reiniciar', methods=['POST'])
 def reiniciar_historial():
     session_id = request.json.get('sessionId')
-    if session_id and session_id in historial_conversaciones:
-        del historial_conversaciones[session_id]
+    if session_id:
+        historial_conversaciones.eliminar(session_id)
     session.clear()
     return jsonify({"status": "ok"})
 
 # Ruta para manejar el chat
 
 
-@app.route('/chat', methods=['POST'])
-def chat():
+MENSAJE_ERROR_CHAT = "Lo siento, estamos teniendo algunos inconvenientes. Por favor, intenta nuevamente más tarde."
+
+
+def parametros_groq(mensajes, max_tokens=150, stream=False):
+    """Argumentos comunes de las llamadas a Groq (cliente síncrono o asíncrono)."""
+    return {
+        "messages": mensajes,
+        "model": "llama-3.3-70b-versatile",
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "top_p": 1,
+        "stream": stream
+    }
+
+
+def datos_respuesta(respuesta):
+    """Cuerpo de la respuesta del chat: el texto de la IA, los diseños de sus
+    etiquetas [MOSTRAR_IMAGEN: ...] y las imágenes ya resueltas (URL, tamaño y
+    variantes)."""
+    disenos = galeria.extraer_disenos(respuesta)
+    return {
+        "reply": respuesta,
+        "texto": galeria.quitar_etiquetas(respuesta),
+        "disenos": disenos,
+        "imagenes": galeria_imagenes.resolver_todos(disenos)
+    }
+
+
+def nueva_sesion():
+    """Sesión vacía que apunta al prompt de sistema actual.
+
+    La sesión solo guarda sus propios turnos y la versión del prompt; el texto
+    del prompt se añade al construir cada petición (ver construir_mensajes).
+    """
+    return {"prompt": PROMPT_VERSION, "turnos": []}
+
+
+def construir_mensajes(sesion):
+    """Payload para la IA: prompt de sistema internado, datos conocidos de la
+    sesión (si los hay) y turnos de la sesión."""
+    mensajes = [{"role": "system", "content": prompts.obtener_prompt(sesion["prompt"])}]
+    datos = HechosSesion.desde_sesion(sesion)
+    if RECUPERACION_CATALOGO:
+        mensajes.append(mensaje_catalogo(sesion, datos))
+
+    # El texto de los datos se regenera solo si cambiaron desde la última vez
+    mensaje_datos = datos.mensaje()
+    datos.guardar_en(sesion)
+    if mensaje_datos:
+        mensajes.append(mensaje_datos)
+    return mensajes + sesion["turnos"]
+
+
+def consulta_catalogo(sesion, datos):
+    """Texto con el que se eligen los vestidos relevantes: preferencias y
+    características conocidas más los últimos mensajes de la conversación."""
+    partes = [datos.evento or "", " ".join(datos.estilo), " ".join(datos.colores)]
+    partes.extend(str(v) for v in datos.caracteristicas.values())
+    partes.extend(t["content"] for t in sesion["turnos"][-4:]
+                  if t.get("role") in ("user", "assistant"))
+    return " ".join(partes)
+
+
+def mensaje_catalogo(sesion, datos):
+    """Selección del catálogo para el turno actual.
+
+    compactar_sesion la necesita para reservar sus tokens y construir_mensajes
+    para enviarla: se guarda en la sesión junto a la firma de la consulta y
+    solo se vuelve a calcular si la consulta cambió.
+    """
+    consulta = consulta_catalogo(sesion, datos)
+    firma = hashlib.sha1(consulta.encode("utf-8")).hexdigest()
+    guardada = sesion.get("catalogo") or {}
+    if guardada.get("firma") != firma:
+        guardada = {"firma": firma, "mensaje": indice_catalogo.mensaje(consulta)}
+        sesion["catalogo"] = guardada
+    return guardada["mensaje"]
+
+
+def compactar_sesion(sesion):
+    """Ajusta la sesión al presupuesto de tokens (CONTEXTO_MAX_TOKENS)."""
+    tokens_sistema = prompts.estimar_tokens(
+        len(prompts.obtener_prompt(sesion["prompt"])))
+    if RECUPERACION_CATALOGO:
+        # La selección del catálogo también se envía en cada petición
+        tokens_sistema += contexto.tokens_mensaje(
+            mensaje_catalogo(sesion, HechosSesion.desde_sesion(sesion)))
+    plegados = contexto.compactar(sesion, tokens_fijos=tokens_sistema)
+    if plegados:
+        logging.info(
+            f"🗜️ {len(plegados)} turnos plegados en el resumen de la sesión")
+    return sesion
+
+
+def tokens_prompt(chat_completion):
+    uso = getattr(chat_completion, "usage", None)
+    return getattr(uso, "prompt_tokens", None)
+
+
+def preparar_historial_chat(session_id, mensaje_usuario):
+    """Inicializa la sesión y le agrega el mensaje del usuario."""
+    # Características físicas de la cookie si la sesión aún no las tiene
+    # (p. ej. la imagen se analizó antes de que caducara el historial)
+    caracteristicas = session.get('caracteristicas_usuario')
+
+    def agregar(sesion):
+        # Inicializa la sesión si no existe (en el almacén, no en la cookie de sesión)
+        sesion = sesion or nueva_sesion()
+        datos = HechosSesion.desde_sesion(sesion)
+        if caracteristicas and not datos.caracteristicas:
+            datos.actualizar(caracteristicas=caracteristicas)
+
+        # Nombre, evento, estilo y colores mencionados en el mensaje (o en la
+        # respuesta a la última pregunta de la asistente)
+        anterior = next((t["content"] for t in reversed(sesion["turnos"])
+                         if t.get("role") == "assistant"), None)
+        contexto.registrar_mensaje_usuario(datos, mensaje_usuario, anterior)
+        datos.guardar_en(sesion)
+
+        # Agregar el mensaje del usuario al historial
+        sesion["turnos"].append({"role": "user", "content": mensaje_usuario})
+        return compactar_sesion(sesion)
+
+    return historial_conversaciones.actualizar(session_id, agregar)
+
+
+def registrar_respuesta(session_id, respuesta):
+    """Añade la respuesta de la IA a la sesión tal como está ahora, no a la
+    copia con la que se hizo la petición: otra petición de la misma sesión
+    pudo añadir turnos o características durante la llamada a la IA."""
+    def agregar(sesion):
+        sesion = sesion or nueva_sesion()
+        sesion["turnos"].append({"role": "assistant", "content": respuesta})
+        # Mantener el historial dentro del presupuesto de tokens
+        return compactar_sesion(sesion)
+
+    historial_conversaciones.actualizar(session_id, agregar)
+
+
+def leer_mensaje_chat():
+    """Devuelve (mensaje, session_id) o (None, None) si la petición no es válida."""
     data = request.json
     if not data or 'mensaje' not in data:
-        return jsonify({"reply": "Lo siento, estamos teniendo algunos inconvenientes. Por favor, intenta nuevamente más tarde."}), 200
+        return None, None
 
     mensaje_usuario = data['mensaje'].strip()
     session_id = data.get('sessionId', 'default_session')
-
     if not mensaje_usuario:
-        return jsonify({"reply": "Lo siento, estamos teniendo algunos inconvenientes. Por favor, intenta nuevamente más tarde."}), 200
+        return None, None
+    return mensaje_usuario, session_id
 
-    # Inicializa historial si no existe (en memoria, no en sesión)
-    if session_id not in historial_conversaciones:
-        historial_conversaciones[session_id] = [
-            {"role": "system", "content": prompt_base}
-        ]
 
-    historial = historial_conversaciones[session_id]
-    caracteristicas = session.get('caracteristicas_usuario')
-
-    # Agregar características físicas si están disponibles y no se han agregado aún
-    if caracteristicas and not any("Características físicas detectadas" in h.get("content", "") for h in historial):
-        descripcion = ", ".join(
-            [f"{k}: {v}" for k, v in caracteristicas.items()])
-        historial.append({
-            "role": "system",
-            "content": f"Características físicas detectadas del usuario: {descripcion}"
-        })
+@app.route('/chat', methods=['POST'])
+def chat():
+    mensaje_usuario, session_id = leer_mensaje_chat()
+    if not mensaje_usuario:
+        return jsonify({"reply": MENSAJE_ERROR_CHAT}), 200
 
-    # Agregar el mensaje del usuario al historial
-    historial.append({"role": "user", "content": mensaje_usuario})
+    sesion = preparar_historial_chat(session_id, mensaje_usuario)
+    mensajes = construir_mensajes(sesion)
 
     try:
         # Llama a la API de Groq para obtener una respuesta
         chat_completion = client.chat.completions.create(
-            messages=historial,
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=150,
-            top_p=1,
-            stream=False
-        )
+            **parametros_groq(mensajes))
+        prompts.registrar_uso(mensajes, tokens_prompt(chat_completion))
         response = chat_completion.choices[0].message.content
+        registrar_respuesta(session_id, response)
 
-        # Agregar la respuesta de la IA al historial
-        historial.append({"role": "assistant", "content": response})
-
-        # Limitar el tamaño del historial para evitar problemas de memoria
-        if len(historial) > 20:  # Mantener solo los últimos 20 mensajes
-            # Conservar el primer mensaje (system) y los últimos 19
-            historial = [historial[0]] + historial[-19:]
-            historial_conversaciones[session_id] = historial
-
-        return jsonify({"reply": response})
+        return jsonify(datos_respuesta(response))
 
     except Exception as e:
         print(f"Error al llamar a la API de Groq: {e}")
-        return jsonify({"reply": "Lo siento, estamos teniendo algunos inconvenientes. Por favor, intenta nuevamente más tarde."}), 200
+        return jsonify({"reply": MENSAJE_ERROR_CHAT}), 200
+
+
+def evento_sse(evento, datos):
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+def eventos_fragmento(filtro, texto):
+    """Eventos SSE de un fragmento de la IA: el texto visible (sin etiquetas) y,
+    en cuanto se cierra una etiqueta, sus imágenes resueltas para que el
+    navegador las pida mientras sigue llegando el texto."""
+    visible, disenos = filtro.alimentar(texto)
+    eventos = []
+    if visible:
+        eventos.append(evento_sse("token", {"texto": visible}))
+    if disenos:
+        eventos.append(evento_sse(
+            "imagenes", {"imagenes": galeria_imagenes.resolver_todos(disenos)}))
+    return eventos
+
+
+def eventos_cierre(filtro, respuesta):
+    eventos = []
+    # Una etiqueta sin cerrar (respuesta cortada) no se muestra como texto
+    disenos = filtro.cerrar()
+    if disenos:
+        eventos.append(evento_sse(
+            "imagenes", {"imagenes": galeria_imagenes.resolver_todos(disenos)}))
+    eventos.append(evento_sse("fin", datos_respuesta(respuesta)))
+    return eventos
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Variante de /chat que reenvía los tokens de Groq según llegan (SSE).
+
+    Eventos: "token" ({"texto"}) por cada fragmento, sin las etiquetas
+    [MOSTRAR_IMAGEN: ...]; "imagenes" ({"imagenes"}) al cerrarse cada etiqueta y
+    "fin" (mismo cuerpo que /chat) con el mensaje completo. Si falla la llamada
+    se emite "error" ({"reply"}).
+    """
+    mensaje_usuario, session_id = leer_mensaje_chat()
+    if not mensaje_usuario:
+        return jsonify({"reply": MENSAJE_ERROR_CHAT}), 200
+
+    sesion = preparar_historial_chat(session_id, mensaje_usuario)
+    mensajes = construir_mensajes(sesion)
+
+    def generar():
+        partes = []
+        filtro = galeria.FiltroEtiquetas()
+        try:
+            stream = client.chat.completions.create(
+                **parametros_groq(mensajes, stream=True))
+            prompts.registrar_uso(mensajes)
+            for chunk in stream:
+                texto = chunk.choices[0].delta.content if chunk.choices else None
+                if texto:
+                    partes.append(texto)
+                    yield from eventos_fragmento(filtro, texto)
+        except Exception as e:
+            print(f"Error al llamar a la API de Groq (stream): {e}")
+            yield evento_sse("error", {"reply": MENSAJE_ERROR_CHAT})
+            return
+
+        respuesta = "".join(partes)
+        registrar_respuesta(session_id, respuesta)
+        yield from eventos_cierre(filtro, respuesta)
+
+    return Response(stream_with_context(generar()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Ruta para subir imagen y detectar características
 
 
+def analizar_imagen(imagen, session_id=None):
+    """detection.detect_facial_features con caché: una foto ya analizada (o una
+    copia recomprimida subida en la misma sesión) devuelve sus resultados sin
+    volver a pasar por los modelos.
+    `imagen` son los bytes subidos o el fotograma ya decodificado."""
+    try:
+        img_bgr = vision.decodificar_imagen(imagen)
+    except ValueError as e:
+        logging.error(f"❌ Imagen no válida: {e}")
+        return {"Rostro Detectado": False}
+
+    resultados = cache_resultados.obtener(img_bgr, session_id)
+    if resultados is not None:
+        logging.info("⚡ Análisis recuperado de la caché")
+        return resultados
+
+    resultados = vision.detect_facial_features(img_bgr)
+    # Solo se guardan los análisis completos: un fallo puede ser transitorio
+    if resultados.get("Rostro Detectado"):
+        cache_resultados.guardar(img_bgr, resultados, session_id)
+    return resultados
+
+
+def procesar_imagen(session_id, imagen, avisos=None):
+    """Detecta características, actualiza el historial y pide la respuesta a la IA.
+
+    Se ejecuta dentro del pool de análisis, fuera del contexto de la petición,
+    por lo que devuelve (cuerpo, código, resultados) en lugar de una respuesta Flask.
+    `avisos` (del control de calidad) se añade a la respuesta.
+    """
+    # Detectar características faciales
+    try:
+        resultados = analizar_imagen(imagen, session_id)
+        logging.info(f"✅ Resultados brutos detection: {resultados}")
+
+    except Exception:
+        logging.error(
+            "❌ Falló detection.detect_facial_features", exc_info=True)
+        return {"reply": "Error interno en la detección facial."}, 500, None
+
+    print("Características detectadas:", resultados)
+    return responder_con_caracteristicas(session_id, resultados, extra=cuerpo_avisos(avisos))
+
+
+def responder_con_caracteristicas(session_id, resultados, extra=None):
+    """Guarda las características en la sesión y pide la respuesta a la IA.
+
+    Devuelve (cuerpo, código, resultados); `extra` se añade al cuerpo.
+    """
+    extra = extra or {}
+    try:
+        def agregar(sesion):
+            # Inicializa la sesión si no existe
+            sesion = sesion or nueva_sesion()
+
+            # Reemplaza las características físicas previas de la sesión (O(1),
+            # sin recorrer el historial)
+            datos = HechosSesion.desde_sesion(sesion)
+            datos.actualizar(caracteristicas=resultados)
+            datos.guardar_en(sesion)
+
+            # Simular un mensaje del usuario para que la IA continúe el flujo
+            sesion["turnos"].append({"role": "user", "content": "Ya subí mi imagen"})
+            return compactar_sesion(sesion)
+
+        sesion = historial_conversaciones.actualizar(session_id, agregar)
+        mensajes = construir_mensajes(sesion)
+
+        # Llama a la API para obtener una respuesta
+        chat_completion = client.chat.completions.create(
+            **parametros_groq(mensajes, max_tokens=300))
+        prompts.registrar_uso(mensajes, tokens_prompt(chat_completion))
+        respuesta_ia = chat_completion.choices[0].message.content
+
+        if respuesta_ia:
+            registrar_respuesta(session_id, respuesta_ia)
+            return dict(extra, reply=respuesta_ia), 200, resultados
+
+        else:
+            return dict(extra, reply="Imagen recibida y analizada. Ya tengo tus características para ayudarte mejor."), 200, resultados
+
+    except Exception:
+        logging.error("❌ Error inesperado en /subir-imagen", exc_info=True)
+        return dict(extra, reply="Recibí la imagen, pero hubo un problema al procesarla."), 200, resultados
+
+
+def procesar_imagenes(session_id, imagenes, descartadas=None, avisos=None):
+    """Como procesar_imagen, pero con varias fotos de la misma persona: se
+    analizan en lote y a la sesión llega el consenso ponderado por confianza.
+    `descartadas` (fotos rechazadas por el control de calidad) y `avisos` se
+    añaden a la respuesta."""
+    try:
+        lote = vision.detect_facial_features_lote(imagenes)
+        logging.info(f"✅ Consenso de {len(imagenes)} imágenes: {lote['consenso']}")
+    except Exception:
+        logging.error(
+            "❌ Falló detection.detect_facial_features_lote", exc_info=True)
+        return {"reply": "Error interno en la detección facial."}, 500, None
+
+    extra = dict(cuerpo_avisos(avisos), imagenes=lote["imagenes"], confianza=lote["confianza"])
+    if descartadas:
+        extra["descartadas"] = descartadas
+    return responder_con_caracteristicas(session_id, lote["consenso"], extra=extra)
+
+
+def respuesta_cola_llena():
+    respuesta = jsonify({
+        "reply": "Estamos analizando muchas imágenes en este momento. Por favor, inténtalo de nuevo en unos segundos.",
+        "estado": "ocupado"
+    })
+    respuesta.headers["Retry-After"] = str(REINTENTAR_TRAS_SEGUNDOS)
+    return respuesta, 503
+
+
+def revisar_calidad(image_bytes):
+    """Decodifica la foto y pasa el control de calidad (ver calidad.py).
+
+    Devuelve (img_bgr, evaluacion); img_bgr es None si no se pudo decodificar.
+    Así el análisis recibe la imagen ya decodificada y una foto inservible se
+    rechaza sin pasar por la cola ni por los modelos.
+    """
+    try:
+        img_bgr = vision.decodificar_imagen(image_bytes)
+    except ValueError as e:
+        logging.error(f"❌ Imagen no válida: {e}")
+        return None, {"apta": False, "avisos": [], "problemas": [
+            "No pudimos abrir el archivo: sube una foto en formato JPG o PNG."]}
+    if not calidad.ACTIVADA:
+        return img_bgr, {"apta": True, "problemas": [], "avisos": []}
+    evaluacion = calidad.evaluar(img_bgr)
+    logging.info(f"🔎 Calidad de la imagen: {evaluacion}")
+    return img_bgr, evaluacion
+
+
+def cuerpo_avisos(avisos):
+    """Avisos del control de calidad de una foto que sí se analiza ("calidad"
+    en la respuesta, como en las rechazadas)."""
+    return {"calidad": {"avisos": avisos}} if avisos else {}
+
+
+def respuesta_calidad(evaluacion, problemas=None):
+    return jsonify({
+        "reply": calidad.mensaje(problemas or evaluacion["problemas"]),
+        "calidad": evaluacion,
+        "estado": "rechazada"
+    }), 422
+
+
 @app.route('/subir-imagen', methods=['POST'])
 def subir_imagen():
     print("📸 Imagen recibida en el backend")
@@ -239,6 +687,9 @@ def subir_imagen():
 
     imagen = request.files['imagen']
     session_id = request.form.get('sessionId', 'default_session')
+    # Con asincrono=1 se devuelve 202 y el id del trabajo en lugar de esperar
+    asincrono = request.form.get(
+        'asincrono', request.args.get('asincrono', '0')) in ('1', 'true')
 
     # Verificar que se haya seleccionado un archivo
     if imagen.filename == '':
@@ -248,74 +699,144 @@ def subir_imagen():
         # Leer y procesar la imagen
         image_bytes = imagen.read()
 
-        # Guardar la imagen temporalmente (opcional, para debugging)
-        filename = secure_filename(imagen.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(filepath, 'wb') as f:
-            f.write(image_bytes)
+        # Guardar la imagen solo si está activado el modo depuración
+        if app.config['GUARDAR_SUBIDAS']:
+            filename = secure_filename(imagen.filename)
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            with open(filepath, 'wb') as f:
+                f.write(image_bytes)
 
         # 🔍 Debug: Verifica tamaño de la imagen
         logging.info(f"📏 Imagen recibida: {len(image_bytes)} bytes")
 
-        # Detectar características faciales
-        try:
-            resultados = detection.detect_facial_features(image_bytes)
-            logging.info(f"✅ Resultados brutos detection: {resultados}")
-
-        except Exception as det_err:
-            logging.error(
-                "❌ Falló detection.detect_facial_features", exc_info=True)
-            return jsonify({"reply": "Error interno en la detección facial."}), 500
-
-        # Reemplaza siempre las características previas en la sesión
-        session['caracteristicas_usuario'] = resultados
-        print("Características detectadas:", resultados)
-
-        # Inicializa historial si no existe
-        if session_id not in historial_conversaciones:
-            historial_conversaciones[session_id] = [
-                {"role": "system", "content": prompt_base}
-            ]
-
-        historial = historial_conversaciones[session_id]
-
-        # Reemplaza o agrega la entrada de características físicas en el historial
-        descripcion = ", ".join([f"{k}: {v}" for k, v in resultados.items()])
-        caracteristicas_entry = {
-            "role": "system",
-            "content": f"Características físicas detectadas del usuario: {descripcion}"
-        }
+        img_bgr, evaluacion = revisar_calidad(image_bytes)
+        if not evaluacion["apta"]:
+            return respuesta_calidad(evaluacion)
+        return encolar_analisis(partial(procesar_imagen, avisos=evaluacion["avisos"]),
+                                session_id, img_bgr, asincrono, evaluacion["avisos"])
 
-        # Elimina cualquier entrada anterior de características detectadas
-        historial = [
-            h for h in historial if "Características físicas detectadas" not in h.get("content", "")]
-        historial.append(caracteristicas_entry)
-        historial_conversaciones[session_id] = historial
+    except Exception:
+        logging.error("❌ Error inesperado en /subir-imagen", exc_info=True)
+        return jsonify({"reply": "Recibí la imagen, pero hubo un problema al procesarla."})
 
-        # Simular un mensaje del usuario para que la IA continúe el flujo
-        historial.append({"role": "user", "content": "Ya subí mi imagen"})
 
-        # Llama a la API para obtener una respuesta
-        chat_completion = client.chat.completions.create(
-            messages=historial,
-            model="llama-3.3-70b-versatile",
-            temperature=0.7,
-            max_tokens=300,
-            top_p=1,
-            stream=False
-        )
-        respuesta_ia = chat_completion.choices[0].message.content
+def encolar_analisis(funcion, session_id, datos, asincrono, avisos=None):
+    """Envía el análisis al pool y responde 202 (asíncrono), el resultado
+    (síncrono) o 503 si la cola está llena. Los `avisos` de calidad van ya en
+    el 202; en el resultado los añade `funcion`."""
+    try:
+        trabajo_id = cola_analisis.enviar(funcion, session_id, datos)
+    except trabajos.ColaLlena:
+        logging.warning("⏳ Cola de análisis llena, se rechaza la imagen")
+        return respuesta_cola_llena()
+
+    if asincrono:
+        return jsonify(dict(
+            cuerpo_avisos(avisos),
+            jobId=trabajo_id,
+            estado=trabajos.PENDIENTE,
+            url=f"/trabajos/{trabajo_id}",
+            eventos=f"/trabajos/{trabajo_id}/eventos"
+        )), 202
+
+    # Modo síncrono (compatibilidad): se espera al trabajo en el pool acotado
+    cola_analisis.esperar(trabajo_id, timeout=ESPERA_ANALISIS_SEGUNDOS)
+    return respuesta_trabajo(cola_analisis.obtener(trabajo_id))
+
+
+@app.route('/subir-imagenes', methods=['POST'])
+def subir_imagenes():
+    """Varias fotos de la misma persona (campo "imagenes", hasta
+    ANALISIS_LOTE_MAX) en un solo análisis por lotes. Devuelve lo mismo que
+    /subir-imagen más "imagenes" (resultados de cada foto) y "confianza"."""
+    archivos = [f for f in request.files.getlist('imagenes') if f.filename]
+    session_id = request.form.get('sessionId', 'default_session')
+    asincrono = request.form.get(
+        'asincrono', request.args.get('asincrono', '0')) in ('1', 'true')
 
-        if respuesta_ia:
-            historial.append({"role": "assistant", "content": respuesta_ia})
-            return jsonify({"reply": respuesta_ia})
+    if not archivos:
+        return jsonify({"reply": "No se recibió ninguna imagen."}), 400
+    if len(archivos) > ANALISIS_LOTE_MAX:
+        return jsonify({"reply": f"Puedes subir hasta {ANALISIS_LOTE_MAX} imágenes a la vez."}), 400
 
+    try:
+        lista_bytes = [archivo.read() for archivo in archivos]
+        logging.info(f"📏 Lote recibido: {len(lista_bytes)} imágenes, "
+                     f"{sum(len(b) for b in lista_bytes)} bytes")
+
+        # Solo las fotos que pasan el control de calidad llegan al análisis
+        aptas, descartadas, avisos = [], [], []
+        for indice, image_bytes in enumerate(lista_bytes):
+            img_bgr, evaluacion = revisar_calidad(image_bytes)
+            if evaluacion["apta"]:
+                aptas.append(img_bgr)
+                avisos.extend(evaluacion["avisos"])
+            else:
+                descartadas.append({"indice": indice, "archivo": archivos[indice].filename,
+                                    "problemas": evaluacion["problemas"]})
+        if not aptas:
+            problemas = list(dict.fromkeys(
+                p for descartada in descartadas for p in descartada["problemas"]))
+            return respuesta_calidad({"apta": False, "descartadas": descartadas}, problemas)
+
+        avisos = list(dict.fromkeys(avisos))
+        return encolar_analisis(partial(procesar_imagenes, descartadas=descartadas, avisos=avisos),
+                                session_id, aptas, asincrono, avisos)
+
+    except Exception:
+        logging.error("❌ Error inesperado en /subir-imagenes", exc_info=True)
+        return jsonify({"reply": "Recibí las imágenes, pero hubo un problema al procesarlas."})
+
+
+def respuesta_trabajo(trabajo):
+    """Traduce el estado de un trabajo de análisis a una respuesta HTTP."""
+    if trabajo is None:
+        return jsonify({"reply": "No encontramos ese análisis. Por favor, sube la imagen de nuevo.", "estado": "desconocido"}), 404
+
+    if trabajo["estado"] == trabajos.COMPLETADO:
+        cuerpo, codigo, resultados = trabajo["resultado"]
+        if resultados is not None:
+            # Reemplaza siempre las características previas en la sesión
+            session['caracteristicas_usuario'] = resultados
+        return jsonify(dict(cuerpo, estado=trabajo["estado"])), codigo
+
+    if trabajo["estado"] == trabajos.ERROR:
+        return jsonify({"reply": "Recibí la imagen, pero hubo un problema al procesarla.", "estado": trabajo["estado"]})
+
+    return jsonify({"estado": trabajo["estado"], "jobId": trabajo["id"]}), 202
+
+
+@app.route('/trabajos/<trabajo_id>', methods=['GET'])
+def estado_trabajo(trabajo_id):
+    return respuesta_trabajo(cola_analisis.obtener(trabajo_id))
+
+
+@app.route('/trabajos/<trabajo_id>/eventos', methods=['GET'])
+def eventos_trabajo(trabajo_id):
+    # Server-sent events: un evento "estado" mientras se procesa y un
+    # evento "resultado" con la respuesta final
+    if cola_analisis.obtener(trabajo_id) is None:
+        return respuesta_trabajo(None)
+
+    def generar():
+        while not cola_analisis.esperar(trabajo_id, timeout=10):
+            trabajo = cola_analisis.obtener(trabajo_id)
+            if trabajo is None:
+                return
+            yield evento_sse("estado", {"estado": trabajo["estado"]})
+
+        trabajo = cola_analisis.obtener(trabajo_id)
+        if trabajo is None:
+            return
+        if trabajo["estado"] == trabajos.COMPLETADO:
+            cuerpo = dict(trabajo["resultado"][0], estado=trabajo["estado"])
         else:
-            return jsonify({"reply": "Imagen recibida y analizada. Ya tengo tus características para ayudarte mejor."})
+            cuerpo = {"reply": "Recibí la imagen, pero hubo un problema al procesarla.",
+                      "estado": trabajo["estado"]}
+        yield evento_sse("resultado", cuerpo)
 
-    except Exception as e:
-        logging.error("❌ Error inesperado en /subir-imagen", exc_info=True)
-        return jsonify({"reply": "Recibí la imagen, pero hubo un problema al procesarla."})
+    return Response(stream_with_context(generar()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 # Ruta para servir imágenes subidas (opcional, para debugging)
@@ -323,14 +844,35 @@ def subir_imagen():
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Ruta absoluta: se guardan relativas al directorio de trabajo (ver subir_imagen)
+    ruta = safe_join(os.path.abspath(app.config['UPLOAD_FOLDER']), filename)
+    if not ruta or not os.path.isfile(ruta):
+        return "Imagen no encontrada", 404
+    # El nombre se puede reutilizar: la copia en caché se revalida por contenido
+    respuesta = send_file(ruta, etag=galeria.hash_contenido(ruta), conditional=True)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
 
 # Ruta para verificar el estado del servidor
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "ok"})
+    # "status" indica que el proceso responde; "modelos_listos" que la visión ya
+    # está cargada y /subir-imagen no pagará el arranque en frío
+    return jsonify({
+        "status": "ok",
+        "vision": VISION_URL or vision.estado(),
+        "modelos_listos": vision.modelos_listos(),
+        "modelos": modelos.estado_modelos(),
+        "analisis": cola_analisis.estadisticas(),
+        "etapas": orquestador.estadisticas(),
+        "cache_analisis": cache_resultados.estadisticas(),
+        "calidad": calidad.estadisticas(),
+        "conversaciones": historial_conversaciones.estadisticas(),
+        "prompt": prompts.metricas()
+    })
 
 # Función para detección de características faciales
 
@@ -338,7 +880,7 @@ def health_check():
 def detect_facial_features(image_bytes):
     try:
         # Usa tu función de detection.py
-        resultados = detection.detect_facial_features(image_bytes)
+        resultados = vision.detect_facial_features(image_bytes)
 
         # Si no se detectó un rostro, devuelve valores por defecto
         if not resultados.get("Rostro Detectado", False):
@@ -383,5 +925,7 @@ def detect_facial_features(image_bytes):
 
 
 if __name__ == '__main__':
+    if modelos.precarga_activada():
+        modelos.precargar_en_segundo_plano()
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
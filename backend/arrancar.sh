@@ -0,0 +1,35 @@
+#!/bin/sh
+# Arranque del contenedor según MODO_SERVIDOR:
+#   wsgi     (por defecto) gunicorn con workers síncronos: chat y visión en los mismos procesos
+#   asgi     workers de uvicorn: /chat multiplexa las esperas a Groq en un event loop
+#   dividido un proceso de visión interno (modelos precargados) y workers de chat
+#            ligeros que nunca importan torch/TensorFlow/MediaPipe (ver vision.py)
+#   pool     un pool de procesos de visión con los modelos compartidos
+#            (procesos_vision.py) al que todos los workers web envían los análisis
+set -e
+
+case "$MODO_SERVIDOR" in
+asgi)
+    exec gunicorn -k uvicorn.workers.UvicornWorker -w 2 -t 300 --bind "0.0.0.0:${PORT:-8080}" asgi:app
+    ;;
+dividido)
+    # El historial se comparte entre ambos procesos
+    export CONVERSACIONES_BACKEND="${CONVERSACIONES_BACKEND:-sqlite}"
+    PRECARGAR_MODELOS=1 gunicorn -w "${VISION_WORKERS:-1}" -t 300 \
+        --bind 127.0.0.1:8081 app:app &
+    VISION_URL=http://127.0.0.1:8081 PRECARGAR_MODELOS=0 exec gunicorn \
+        -w "${CHAT_WORKERS:-2}" -t 300 --bind "0.0.0.0:${PORT:-8080}" app:app
+    ;;
+pool)
+    export VISION_SOCKET="${VISION_SOCKET:-/tmp/alzarea-vision.sock}"
+    export CONVERSACIONES_BACKEND="${CONVERSACIONES_BACKEND:-sqlite}"
+    # Clave del socket compartida por el pool y los workers (procesos_vision.py
+    # no arranca sin ella); si no se indica, una aleatoria por arranque
+    export VISION_CLAVE="${VISION_CLAVE:-$(od -An -N32 -tx1 /dev/urandom | tr -d ' \n')}"
+    python procesos_vision.py &
+    exec gunicorn -w "${WEB_WORKERS:-4}" -t 300 --bind "0.0.0.0:${PORT:-8080}" app:app
+    ;;
+*)
+    exec gunicorn -w 2 -t 300 --bind "0.0.0.0:${PORT:-8080}" app:app
+    ;;
+esac
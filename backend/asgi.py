@@ -0,0 +1,200 @@
+"""Modo de servicio ASGI para la API de Alzárea.
+
+/chat y /chat/stream se atienden de forma nativa con el cliente asíncrono de
+Groq, así que las conversaciones que esperan a la IA comparten un único event
+loop en lugar de ocupar un worker cada una. El resto de rutas (imágenes,
+/subir-imagen, /health, ...) se delegan a la app Flask, que se ejecuta en un
+pool de hilos; el análisis pesado sigue en el pool de `trabajos`.
+
+Arranque:
+    gunicorn -k uvicorn.workers.UvicornWorker -w 2 -t 300 --bind 0.0.0.0:8080 asgi:app
+"""
+import io
+import os
+import json
+import asyncio
+import logging
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from groq import AsyncGroq
+from werkzeug.exceptions import HTTPException
+
+import app as alzarea
+import galeria
+import prompts
+
+flask_app = alzarea.app
+wsgi = WSGIMiddleware(flask_app, workers=int(
+    os.environ.get("ASGI_HILOS_WSGI", 10)))
+
+# El cliente asíncrono se crea dentro del event loop de cada worker
+_cliente_async = None
+
+
+def cliente_async():
+    global _cliente_async
+    if _cliente_async is None:
+        _cliente_async = AsyncGroq(api_key=alzarea.GROQ_API_KEY,
+                                   http_client=httpx.AsyncClient(proxies=None))
+    return _cliente_async
+
+
+async def leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body", False):
+            return b"".join(partes)
+
+
+def construir_environ(scope, cuerpo):
+    """Environ WSGI mínimo para abrir un contexto de petición de Flask."""
+    servidor = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(cuerpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(cuerpo),
+        "wsgi.errors": io.StringIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for nombre, valor in scope.get("headers", []):
+        nombre = nombre.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nombre == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = valor
+        elif nombre != "CONTENT_LENGTH":
+            clave = f"HTTP_{nombre}"
+            environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+def cabeceras_cors(scope):
+    # Mismas reglas que flask_cors en app.py (orígenes permitidos + credenciales)
+    origen = dict(scope.get("headers", [])).get(b"origin", b"").decode("latin-1")
+    if origen not in alzarea.frontend_urls:
+        return []
+    return [
+        (b"access-control-allow-origin", origen.encode("latin-1")),
+        (b"access-control-allow-credentials", b"true"),
+        (b"vary", b"Origin"),
+    ]
+
+
+async def enviar_json(send, scope, datos, estado=200):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": estado,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(cuerpo)).encode())] + cabeceras_cors(scope),
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+def preparar_chat(scope, cuerpo):
+    """Valida la petición, prepara la sesión y construye los mensajes para la
+    IA reutilizando la lógica de app.py.
+
+    Bloquea (historial en SQLite, recuperación del catálogo, prompt): se
+    ejecuta con asyncio.to_thread para no detener el event loop.
+    Devuelve (session_id, sesion, mensajes) o lanza HTTPException.
+    """
+    with flask_app.request_context(construir_environ(scope, cuerpo)):
+        mensaje_usuario, session_id = alzarea.leer_mensaje_chat()
+        if not mensaje_usuario:
+            return None, None, None
+        sesion = alzarea.preparar_historial_chat(session_id, mensaje_usuario)
+        return session_id, sesion, alzarea.construir_mensajes(sesion)
+
+
+async def chat(scope, receive, send):
+    try:
+        session_id, sesion, mensajes = await asyncio.to_thread(
+            preparar_chat, scope, await leer_cuerpo(receive))
+    except HTTPException as e:
+        return await enviar_json(send, scope, {"reply": alzarea.MENSAJE_ERROR_CHAT}, e.code)
+    if sesion is None:
+        return await enviar_json(send, scope, {"reply": alzarea.MENSAJE_ERROR_CHAT})
+
+    try:
+        chat_completion = await cliente_async().chat.completions.create(
+            **alzarea.parametros_groq(mensajes))
+        prompts.registrar_uso(
+            mensajes, alzarea.tokens_prompt(chat_completion))
+        respuesta = chat_completion.choices[0].message.content
+        await asyncio.to_thread(alzarea.registrar_respuesta, session_id, respuesta)
+        await enviar_json(send, scope, alzarea.datos_respuesta(respuesta))
+    except Exception as e:
+        logging.error(f"Error al llamar a la API de Groq (asgi): {e}")
+        await enviar_json(send, scope, {"reply": alzarea.MENSAJE_ERROR_CHAT})
+
+
+async def chat_stream(scope, receive, send):
+    try:
+        session_id, sesion, mensajes = await asyncio.to_thread(
+            preparar_chat, scope, await leer_cuerpo(receive))
+    except HTTPException as e:
+        return await enviar_json(send, scope, {"reply": alzarea.MENSAJE_ERROR_CHAT}, e.code)
+    if sesion is None:
+        return await enviar_json(send, scope, {"reply": alzarea.MENSAJE_ERROR_CHAT})
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")] + cabeceras_cors(scope),
+    })
+
+    async def emitir(eventos):
+        await send({"type": "http.response.body", "more_body": True,
+                    "body": "".join(eventos).encode("utf-8")})
+
+    partes = []
+    filtro = galeria.FiltroEtiquetas()
+    try:
+        stream = await cliente_async().chat.completions.create(
+            **alzarea.parametros_groq(mensajes, stream=True))
+        prompts.registrar_uso(mensajes)
+        async for chunk in stream:
+            texto = chunk.choices[0].delta.content if chunk.choices else None
+            if texto:
+                partes.append(texto)
+                eventos = alzarea.eventos_fragmento(filtro, texto)
+                if eventos:
+                    await emitir(eventos)
+    except Exception as e:
+        logging.error(f"Error al llamar a la API de Groq (asgi stream): {e}")
+        await emitir([alzarea.evento_sse("error", {"reply": alzarea.MENSAJE_ERROR_CHAT})])
+    else:
+        respuesta = "".join(partes)
+        await asyncio.to_thread(alzarea.registrar_respuesta, session_id, respuesta)
+        await emitir(alzarea.eventos_cierre(filtro, respuesta))
+    await send({"type": "http.response.body", "body": b""})
+
+
+RUTAS_ASINCRONAS = {
+    "/chat": chat,
+    "/chat/stream": chat_stream,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and scope["method"] == "POST":
+        manejador = RUTAS_ASINCRONAS.get(scope["path"])
+        if manejador is not None:
+            return await manejador(scope, receive, send)
+    # Preflight CORS, rutas de imágenes, /subir-imagen, /health, ...
+    return await wsgi(scope, receive, send)
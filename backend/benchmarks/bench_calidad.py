@@ -0,0 +1,83 @@
+"""Tiempo y veredictos del control de calidad (calidad.py).
+
+Para cada foto se evalúa el original y versiones degradadas a propósito
+(borrosa, oscura, sobreexpuesta, diminuta, panorámica y sin rostro) y se
+informa del tiempo por evaluación y de cuántos rechazos y avisos hay por
+cada motivo.
+
+Lo que importa son los originales de fotos reales de usuarias (de frente y
+de cuerpo entero, como las que se suben al chat): deben pasar todos. Esas
+fotos no están en el repositorio; se pasan como argumentos o en el
+directorio CALIDAD_FOTOS (benchmarks/fotos_personas/ por defecto). Las
+imágenes de imagenes/ son del catálogo y no muestran a nadie: se evalúan
+aparte y solo sirven para ver que una foto sin rostro ya no se rechaza y
+para medir tiempos.
+
+Uso (desde backend/):
+    python benchmarks/bench_calidad.py [fotos de personas...]
+"""
+import os
+import sys
+import time
+import statistics
+
+import cv2
+import numpy as np
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+import calidad  # noqa: E402
+import preprocesado  # noqa: E402
+
+DEGRADACIONES = {
+    "original": lambda img: img,
+    "borrosa": lambda img: cv2.GaussianBlur(img, (0, 0), 6),
+    "oscura": lambda img: (img * 0.15).astype(np.uint8),
+    "sobreexpuesta": lambda img: cv2.convertScaleAbs(img, alpha=1.8, beta=120),
+    "diminuta": lambda img: preprocesado.reducir(img, 160),
+    "panoramica": lambda img: img[: max(1, img.shape[0] // 5)],
+    "sin_rostro": lambda img: np.full_like(img, 128) + (img % 16),
+}
+
+
+def listar(directorio):
+    if not os.path.isdir(directorio):
+        return []
+    return [os.path.join(directorio, nombre) for nombre in sorted(os.listdir(directorio))
+            if nombre.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+
+def medir(titulo, rutas):
+    imagenes = [preprocesado.decodificar_imagen(ruta) for ruta in rutas]
+    print(f"== {titulo} ({len(imagenes)} fotos)")
+    for nombre, degradar in DEGRADACIONES.items():
+        tiempos, aptas, motivos = [], 0, {}
+        for img in imagenes:
+            degradada = degradar(img)
+            inicio = time.perf_counter()
+            evaluacion = calidad.evaluar(degradada)
+            tiempos.append(time.perf_counter() - inicio)
+            aptas += evaluacion["apta"]
+            for frase in evaluacion["problemas"] + [f"(aviso) {a}" for a in evaluacion["avisos"]]:
+                motivos[frase[:48]] = motivos.get(frase[:48], 0) + 1
+        print(f"{nombre:<14} aptas={aptas}/{len(imagenes)}  "
+              f"mediana={statistics.median(tiempos) * 1000:6.1f} ms  "
+              f"máx.={max(tiempos) * 1000:6.1f} ms")
+        for motivo, veces in sorted(motivos.items(), key=lambda m: -m[1]):
+            print(f"    {veces:3d}  {motivo}…")
+
+
+def main():
+    personas = sys.argv[1:] or listar(os.environ.get(
+        "CALIDAD_FOTOS", os.path.join(BASE, "benchmarks", "fotos_personas")))
+    if personas:
+        medir("Fotos de personas: los originales deben pasar todos", personas)
+    else:
+        print("Sin fotos de personas: pásalas como argumentos o en CALIDAD_FOTOS; "
+              "sin ellas no se puede juzgar si el control rechaza fotos válidas.")
+    medir("Catálogo (sin personas): solo tiempos y fotos sin rostro", listar(os.path.join(BASE, "imagenes")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Precisión y tiempo por llamada de los clasificadores de color (colores.py).
+
+Piel: cortes de L* sobre el color robusto (por defecto) y paleta Lab (COLORES_PIEL=paleta).
+Cabello: cadenas de umbrales RGB que había en detection.py y paleta Lab.
+
+La precisión solo se mide con recortes reales etiquetados a mano, organizados
+como <dir>/piel/<clase>/*.jpg y <dir>/cabello/<clase>/*.jpg. Con ellos se
+imprime además, por clase, la mediana de los colores robustos medidos: son los
+valores con los que calibrar PALETA_PIEL y PALETA_CABELLO.
+
+Sin directorio no hay etiquetas de verdad (unos colores de referencia elegidos
+a mano darían una precisión circular), así que solo se mide el tiempo por
+llamada sobre regiones sintéticas del tamaño de un rostro alineado (224x224).
+
+Uso (desde backend/):
+    python benchmarks/bench_colores.py [directorio] [repeticiones]
+"""
+import os
+import sys
+import time
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import colores  # noqa: E402
+
+
+def cabello_umbrales(img, mascara):
+    pixeles = img[mascara == 1]
+    if pixeles.size == 0:
+        return "Indefinido"
+    r, g, b = np.mean(pixeles, axis=0).astype(int)
+    if r < 70 and g < 70 and b < 70:
+        return "Negro"
+    elif r < 110 and g < 100 and b < 90:
+        return "Castaño oscuro"
+    elif 100 <= r <= 150 and 90 <= g <= 140 and 80 <= b <= 160:
+        return "Castaño claro"
+    elif r > 200 and g > 190 and b < 160:
+        return "Rubio"
+    elif r > 130 and g < 110 and b < 100:
+        return "Pelirrojo"
+    elif r > 170 and g > 170 and b > 170:
+        return "Gris / Blanco"
+    return "Indefinido"
+
+
+def regiones_sinteticas(n=20):
+    generador = np.random.default_rng(0)
+    colores_base = generador.uniform(30, 240, size=(n, 3))
+    return [(np.clip(generador.normal(color, 12, size=(224, 224, 3)), 0, 255).astype(np.uint8), None)
+            for color in colores_base]
+
+
+def casos_directorio(directorio):
+    from PIL import Image
+
+    casos = {"piel": [], "cabello": []}
+    for tipo in casos:
+        base = os.path.join(directorio, tipo)
+        for clase in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+            for nombre in sorted(os.listdir(os.path.join(base, clase))):
+                imagen = Image.open(os.path.join(base, clase, nombre)).convert("RGB")
+                casos[tipo].append((np.asarray(imagen), clase))
+    return casos
+
+
+def mascara(region):
+    return np.ones(region.shape[:2], dtype=np.uint8)
+
+
+CLASIFICADORES = {
+    "piel": {
+        "umbrales": lambda region: colores.clasificar_piel(region, "umbrales")["nombre"],
+        "paleta": lambda region: colores.clasificar_piel(region, "paleta")["nombre"],
+    },
+    "cabello": {
+        "umbrales": lambda region: cabello_umbrales(region, mascara(region)),
+        "paleta": lambda region: colores.clasificar_cabello(region, mascara(region))["nombre"],
+    },
+}
+
+
+def tiempo_por_llamada(casos, funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for region, _ in casos:
+            funcion(region)
+        tiempos.append((time.perf_counter() - inicio) / len(casos))
+    return statistics.median(tiempos)
+
+
+def colores_medidos(casos):
+    """Mediana por clase del color robusto de cada recorte, en hexadecimal."""
+    por_clase = {}
+    for region, clase in casos:
+        _, rgb = colores.color_robusto(region.reshape(-1, 3))
+        if rgb is not None:
+            por_clase.setdefault(clase, []).append(rgb)
+    return {clase: "#{:02x}{:02x}{:02x}".format(*np.median(rgbs, axis=0).astype(int))
+            for clase, rgbs in por_clase.items()}
+
+
+def main():
+    directorio = sys.argv[1] if len(sys.argv) > 1 and os.path.isdir(sys.argv[1]) else None
+    repeticiones = int(sys.argv[-1]) if len(sys.argv) > 1 and sys.argv[-1].isdigit() else 5
+
+    if directorio is None:
+        print("Sin recortes etiquetados: solo tiempos (224x224, 20 regiones)")
+        regiones = regiones_sinteticas()
+        for tipo, funciones in CLASIFICADORES.items():
+            for nombre, funcion in funciones.items():
+                tiempo = tiempo_por_llamada(regiones, funcion, repeticiones)
+                print(f"  {tipo:<8} {nombre:<9} {tiempo * 1e6:8.1f} µs/llamada")
+        return
+
+    casos = casos_directorio(directorio)
+    for tipo, funciones in CLASIFICADORES.items():
+        if not casos[tipo]:
+            continue
+        print(f"{tipo} ({len(casos[tipo])} recortes)")
+        for nombre, funcion in funciones.items():
+            aciertos = sum(funcion(region) == clase for region, clase in casos[tipo])
+            tiempo = tiempo_por_llamada(casos[tipo], funcion, repeticiones)
+            print(f"  {nombre:<9} precisión={aciertos / len(casos[tipo]):6.1%}  "
+                  f"{tiempo * 1e6:8.1f} µs/llamada")
+        print("  colores medidos por clase (para calibrar la paleta):")
+        for clase, color in colores_medidos(casos[tipo]).items():
+            print(f"    {clase:<16} {color}")
+
+
+if __name__ == "__main__":
+    main()
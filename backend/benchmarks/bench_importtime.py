@@ -0,0 +1,56 @@
+"""Tiempo de importación y memoria al arrancar: app con y sin la pila de visión.
+
+Ejecuta `python -X importtime` en un proceso nuevo para cada caso y suma el
+tiempo acumulado de los módulos de primer nivel; también informa de la
+memoria residual máxima del proceso tras importar.
+
+- "antes": app + detection importado al arrancar (como hacía app.py)
+- "después": solo app (la visión queda detrás de vision.py)
+
+Uso (desde backend/):
+    python benchmarks/bench_importtime.py [modulos_a_mostrar]
+"""
+import os
+import re
+import sys
+import subprocess
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CASOS = {
+    "antes": "import detection, app",
+    "después": "import app",
+}
+PATRON = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def medir(codigo):
+    script = (f"{codigo}\nimport resource\n"
+              "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)")
+    entorno = dict(os.environ, PRECARGAR_MODELOS="0")
+    proceso = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                             cwd=BASE, env=entorno, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr[-2000:])
+
+    modulos = []
+    for linea in proceso.stderr.splitlines():
+        coincidencia = PATRON.match(linea)
+        # Solo los de primer nivel (sin sangría): su tiempo acumulado incluye a los demás
+        if coincidencia and len(coincidencia.group(3)) == 1:
+            modulos.append((int(coincidencia.group(2)), coincidencia.group(4)))
+    rss_kb = int(proceso.stdout.strip().splitlines()[-1])
+    return modulos, rss_kb
+
+
+def main():
+    mostrar = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    for nombre, codigo in CASOS.items():
+        modulos, rss_kb = medir(codigo)
+        total = sum(t for t, _ in modulos)
+        print(f"{nombre:<8} importación={total / 1e6:6.2f} s  RSS máx.={rss_kb / 1024:7.1f} MB")
+        for tiempo, modulo in sorted(modulos, reverse=True)[:mostrar]:
+            print(f"    {tiempo / 1e3:9.1f} ms  {modulo}")
+
+
+if __name__ == "__main__":
+    main()
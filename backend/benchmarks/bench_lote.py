@@ -0,0 +1,71 @@
+"""Análisis secuencial vs. por lotes de varias fotos.
+
+Secuencial: detection.detect_facial_features imagen por imagen.
+Lote: detection.detect_facial_features_lote (Segformer y edad/género en un
+único tensor). Se mide tiempo real y tiempo de CPU del proceso (todas las
+hebras), y se informa de imágenes por segundo de CPU.
+
+Uso (desde backend/):
+    python benchmarks/bench_lote.py imagen1.jpg imagen2.jpg ... [--repeticiones N]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detection  # noqa: E402
+import modelos  # noqa: E402
+
+
+def medir(funcion, repeticiones):
+    reales, cpu = [], []
+    for _ in range(repeticiones):
+        inicio_real, inicio_cpu = time.perf_counter(), time.process_time()
+        funcion()
+        reales.append(time.perf_counter() - inicio_real)
+        cpu.append(time.process_time() - inicio_cpu)
+    return statistics.median(reales), statistics.median(cpu)
+
+
+def main():
+    argumentos = sys.argv[1:]
+    repeticiones = 3
+    if "--repeticiones" in argumentos:
+        indice = argumentos.index("--repeticiones")
+        repeticiones = int(argumentos[indice + 1])
+        del argumentos[indice:indice + 2]
+    if not argumentos:
+        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        argumentos = [os.path.join(base, "imagenes", n)
+                      for n in ("SOPHIE.jpg", "SOPHIE_2.jpg", "SOPHIE_3.jpg")]
+
+    imagenes = []
+    for ruta in argumentos:
+        with open(ruta, "rb") as f:
+            imagenes.append(f.read())
+
+    modelos.precargar_modelos()
+    # Calentamiento (primeras inferencias de TensorFlow/PyTorch)
+    detection.detect_facial_features_lote(imagenes[:1])
+
+    def secuencial():
+        return [detection.detect_facial_features(imagen) for imagen in imagenes]
+
+    def lote():
+        return detection.detect_facial_features_lote(imagenes)
+
+    n = len(imagenes)
+    for nombre, funcion in (("secuencial", secuencial), ("lote", lote)):
+        real, cpu = medir(funcion, repeticiones)
+        print(f"{nombre:<11} {n} imágenes  real={real:6.2f} s  cpu={cpu:6.2f} s  "
+              f"{n / cpu:5.2f} imágenes/s de CPU")
+
+    resultado = lote()
+    print("\nConsenso:", resultado["consenso"])
+    print("Confianza:", resultado["confianza"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Latencia en frío vs. en caliente de la segmentación de cabello.
+
+Frío: se cargan Segformer y su processor en cada llamada (comportamiento
+anterior al registro de modelos). Caliente: se usa el registro de `modelos`.
+
+Uso (desde backend/):
+    python benchmarks/bench_modelos.py [imagen] [repeticiones]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detection  # noqa: E402
+import modelos  # noqa: E402
+
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def _resumen(nombre, tiempos):
+    print(f"{nombre:<10} media={statistics.mean(tiempos) * 1000:9.1f} ms  "
+          f"min={min(tiempos) * 1000:9.1f} ms  max={max(tiempos) * 1000:9.1f} ms")
+
+
+def main():
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    imagen = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        base, "imagenes", "SOPHIE.jpg")
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    img_rgb = detection.cargar_imagen(imagen)[:, :, ::-1].copy()
+
+    def en_frio():
+        modelos._modelos.pop("segformer", None)
+        detection.detectar_color_cabello_con_segmentacion(img_rgb)
+
+    def en_caliente():
+        detection.detectar_color_cabello_con_segmentacion(img_rgb)
+
+    frio = _medir(en_frio, repeticiones)
+    modelos.obtener_segformer()
+    caliente = _medir(en_caliente, repeticiones)
+
+    print(f"Imagen: {imagen} ({repeticiones} repeticiones)")
+    _resumen("frío", frio)
+    _resumen("caliente", caliente)
+    print(f"Aceleración: x{statistics.mean(frio) / statistics.mean(caliente):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Etapas de analizar_rostro en secuencia vs. concurrentes (orquestador.py).
+
+Mide el tiempo real por foto con las cuatro etapas una tras otra
+(ANALISIS_ETAPAS_HILOS=1) y a la vez, junto con el tiempo medio de cada etapa:
+con el orquestador el total debería acercarse al de la etapa más lenta.
+
+Uso (desde backend/):
+    python benchmarks/bench_orquestador.py [imagen] [repeticiones]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import detection  # noqa: E402
+import modelos  # noqa: E402
+import orquestador  # noqa: E402
+
+
+def medir(img_bgr, repeticiones):
+    orquestador._metricas.clear()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        detection.analizar_rostro(img_bgr)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), orquestador.estadisticas()["etapas"]
+
+
+def main():
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    imagen = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base, "imagenes", "SOPHIE.jpg")
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    img_bgr = detection.cargar_imagen(imagen)
+
+    modelos.precargar_modelos()
+    print(f"Imagen: {imagen} ({repeticiones} repeticiones), hilos: {orquestador.configurar_hilos()}")
+    # Calentamiento: primeras inferencias de cada modelo
+    detection.analizar_rostro(img_bgr)
+
+    hilos = orquestador.HILOS_ETAPAS
+    for nombre, valor in (("secuencial", 1), ("concurrente", max(hilos, 4))):
+        orquestador.HILOS_ETAPAS = valor
+        total, etapas = medir(img_bgr, repeticiones)
+        detalle = "  ".join(f"{etapa}={datos['segundos_medios'] * 1000:.0f}ms"
+                            for etapa, datos in sorted(etapas.items()))
+        print(f"{nombre:<12} total={total * 1000:8.1f} ms  ({detalle})")
+
+
+if __name__ == "__main__":
+    main()
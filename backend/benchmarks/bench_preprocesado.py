@@ -0,0 +1,90 @@
+"""Latencia y memoria de la decodificación según los megapíxeles de entrada.
+
+Anterior: cv2.imdecode a resolución completa, conversión a RGB y
+redimensionado a 512x512 para Segformer (como hacía detection antes).
+Nuevo: preprocesado.decodificar (draft JPEG + EXIF) y preprocesado.piramide.
+
+Con --completo mide además detection.detect_facial_features de extremo a
+extremo (requiere los modelos y una foto real con rostro).
+
+Uso (desde backend/):
+    python benchmarks/bench_preprocesado.py [imagen] [repeticiones] [--completo]
+"""
+import io
+import os
+import sys
+import time
+import statistics
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import preprocesado  # noqa: E402
+
+MEGAPIXELES = [1, 2, 4, 8, 12, 16]
+
+
+def jpeg_de(imagen, megapixeles):
+    """La imagen reescalada a `megapixeles` y codificada como JPEG de móvil."""
+    escala = (megapixeles * 1e6 / (imagen.width * imagen.height)) ** 0.5
+    grande = imagen.resize((round(imagen.width * escala), round(imagen.height * escala)),
+                           Image.BICUBIC)
+    salida = io.BytesIO()
+    grande.save(salida, format="JPEG", quality=90)
+    return salida.getvalue()
+
+
+def anterior(datos):
+    img = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    Image.fromarray(rgb).resize((512, 512))
+    return img.nbytes + rgb.nbytes
+
+
+def nuevo(datos):
+    niveles = preprocesado.piramide(preprocesado.decodificar(datos))
+    return sum(n.nbytes for n in niveles.values())
+
+
+def medir(funcion, datos, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        memoria = funcion(datos)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), memoria
+
+
+def main():
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ruta = argumentos[0] if argumentos else os.path.join(base, "imagenes", "SOPHIE.jpg")
+    repeticiones = int(argumentos[1]) if len(argumentos) > 1 else 5
+    completo = "--completo" in sys.argv
+    imagen = Image.open(ruta).convert("RGB")
+
+    if completo:
+        import detection
+        import modelos
+        modelos.precargar_modelos()
+
+    print(f"{'MP':>4} {'anterior':>12} {'nuevo':>12} {'mem. anterior':>14} "
+          f"{'mem. nueva':>11}" + (f" {'análisis completo':>18}" if completo else ""))
+    for megapixeles in MEGAPIXELES:
+        datos = jpeg_de(imagen, megapixeles)
+        t_anterior, m_anterior = medir(anterior, datos, repeticiones)
+        t_nuevo, m_nuevo = medir(nuevo, datos, repeticiones)
+        linea = (f"{megapixeles:>4} {t_anterior * 1000:>9.1f} ms {t_nuevo * 1000:>9.1f} ms "
+                 f"{m_anterior / 1e6:>11.1f} MB {m_nuevo / 1e6:>8.1f} MB")
+        if completo:
+            inicio = time.perf_counter()
+            detection.detect_facial_features(datos)
+            linea += f" {(time.perf_counter() - inicio) * 1000:>15.0f} ms"
+        print(linea)
+
+
+if __name__ == "__main__":
+    main()
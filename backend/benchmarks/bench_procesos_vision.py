@@ -0,0 +1,75 @@
+"""Memoria del pool de visión frente a N procesos con sus propios modelos.
+
+Arranca procesos_vision.py con VISION_PROCESOS=N, espera a que todos los
+hijos hayan cargado sus modelos y lee /proc/<pid>/smaps_rollup del padre, del
+servidor de fork y de cada hijo (los hijos cuelgan del servidor de fork):
+
+- RSS: memoria residente de cada proceso (cuenta las páginas compartidas en todos)
+- PSS: reparte las páginas compartidas entre los procesos que las usan; la
+  suma de PSS es la memoria real que ocupa el pool
+
+Sin copy-on-write, la suma de PSS sería parecida a la suma de RSS.
+
+Uso (desde backend/, solo Linux):
+    python benchmarks/bench_procesos_vision.py [procesos]
+"""
+import os
+import sys
+import time
+import subprocess
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+
+def memoria(pid):
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0] in ("Rss:", "Pss:"):
+                valores[partes[0][:-1].lower()] = int(partes[1]) / 1024
+    return valores
+
+
+def descendientes(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        hijos = [int(p) for p in f.read().split()]
+    return [d for hijo in hijos for d in [hijo] + descendientes(hijo)]
+
+
+def main():
+    procesos = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    socket = f"/tmp/bench-vision-{os.getpid()}.sock"
+    entorno = dict(os.environ, VISION_SOCKET=socket, VISION_PROCESOS=str(procesos))
+    os.environ["VISION_SOCKET"] = socket
+    import procesos_vision
+
+    padre = subprocess.Popen([sys.executable, "procesos_vision.py"], cwd=BASE, env=entorno)
+    try:
+        inicio = time.perf_counter()
+        while True:
+            time.sleep(2)
+            try:
+                estado = procesos_vision.llamar("estadisticas", espera=5)
+            except procesos_vision.VisionNoDisponible:
+                continue
+            if estado["listos"] >= procesos:
+                break
+        print(f"pool listo en {time.perf_counter() - inicio:.1f}s con {procesos} procesos")
+
+        total_rss = total_pss = 0
+        for pid in [padre.pid] + descendientes(padre.pid):
+            uso = memoria(pid)
+            total_rss += uso["rss"]
+            total_pss += uso["pss"]
+            print(f"  pid {pid:<7} RSS={uso['rss']:8.1f} MB  PSS={uso['pss']:8.1f} MB")
+        print(f"total    RSS={total_rss:8.1f} MB  PSS={total_pss:8.1f} MB "
+              f"(compartido ≈ {total_rss - total_pss:.1f} MB)")
+    finally:
+        padre.terminate()
+        padre.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Tokens del prompt y latencia: catálogo completo vs. selección top-k.
+
+Se generan catálogos sintéticos de distintos tamaños a partir del catálogo real
+y se compara el tamaño estimado del prompt (prompts.estimar_tokens) enviando
+todo el catálogo frente a la selección de `recuperacion`, junto con el tiempo
+de selección por consulta. Si GROQ_API_KEY está definida, mide también la
+latencia real de Groq con ambos prompts.
+
+Uso (desde backend/):
+    python benchmarks/bench_recuperacion.py [k] [repeticiones]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalogo  # noqa: E402
+import prompts  # noqa: E402
+import recuperacion  # noqa: E402
+
+CONSULTAS = [
+    "Busco un vestido largo negro para una boda de noche",
+    "Quiero algo con chaqueta, en azul, para una graduación",
+    "Me gustaría un diseño con espalda abierta y de seda",
+    "Tengo un cóctel en verano, algo corto y floral",
+]
+TAMANOS = [10, 50, 200, 1000]
+
+
+def catalogo_sintetico(base, tamano):
+    """Repite el catálogo real con nombres distintos hasta `tamano` vestidos."""
+    vestidos = []
+    for i in range(tamano):
+        vestido = dict(base.vestidos[i % len(base.vestidos)])
+        if i >= len(base.vestidos):
+            vestido["diseno"] = f"{vestido['diseno']} {i}"
+        vestidos.append(vestido)
+    return catalogo.Catalogo(vestidos)
+
+
+def medir_groq(mensajes, repeticiones):
+    from groq import Groq
+
+    cliente = Groq(api_key=os.environ["GROQ_API_KEY"])
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cliente.chat.completions.create(
+            messages=mensajes, model="llama-3.3-70b-versatile", max_tokens=150)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.mean(tiempos)
+
+
+def main():
+    k = int(sys.argv[1]) if len(sys.argv) > 1 else recuperacion.TOP_K
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    base = catalogo.cargar_catalogo()
+    print(f"Catálogo real: {len(base)} vestidos, k={k}\n")
+    print(f"{'vestidos':>8} {'tokens completo':>16} {'tokens top-k':>13} "
+          f"{'ahorro':>7} {'selección':>12}")
+
+    for tamano in TAMANOS:
+        cat = catalogo_sintetico(base, tamano)
+        indice = recuperacion.IndiceCatalogo(cat)
+        completo = prompts.estimar_tokens(len(cat.texto_prompt()))
+        seleccion = statistics.mean(
+            prompts.estimar_tokens(len(indice.mensaje(c, k)["content"]))
+            for c in CONSULTAS)
+
+        tiempos = []
+        for _ in range(repeticiones):
+            for consulta in CONSULTAS:
+                inicio = time.perf_counter()
+                indice.seleccionar(consulta, k)
+                tiempos.append(time.perf_counter() - inicio)
+        print(f"{tamano:>8} {completo:>16} {seleccion:>13.0f} "
+              f"{1 - seleccion / completo:>6.0%} "
+              f"{statistics.mean(tiempos) * 1000:>9.2f} ms")
+
+    if os.environ.get("GROQ_API_KEY"):
+        indice = recuperacion.IndiceCatalogo(base)
+        consulta = CONSULTAS[0]
+        completo = [{"role": "system", "content": base.texto_prompt()},
+                    {"role": "user", "content": consulta}]
+        reducido = [indice.mensaje(consulta, k),
+                    {"role": "user", "content": consulta}]
+        veces = min(repeticiones, 5)
+        print(f"\nGroq completo: {medir_groq(completo, veces) * 1000:.0f} ms  "
+              f"top-k: {medir_groq(reducido, veces) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
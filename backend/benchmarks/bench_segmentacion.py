@@ -0,0 +1,110 @@
+"""Latencia, memoria y paridad de los backends de Segformer (segmentacion.py).
+
+Cada backend (torch, onnx, onnx-int8) se mide en un proceso propio para que
+la memoria de uno no contamine la del otro:
+
+- carga: segundos hasta tener el segmentador listo
+- latencia: mediana por imagen segmentando en lotes de --lote imágenes
+- RSS tras cargar y RSS máxima del proceso (incluye la inferencia)
+- IoU de la máscara de pelo (clase 13) frente a torch, media y mínima
+
+Uso (desde backend/):
+    python benchmarks/bench_segmentacion.py [imagenes...] [--repeticiones N] [--lote N]
+"""
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import statistics
+import subprocess
+
+import numpy as np
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+import segmentacion  # noqa: E402
+
+
+def rss_actual_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def medir_backend(backend, rutas, repeticiones, lote, salida):
+    imagenes = segmentacion.cargar_imagenes(rutas)
+    inicio = time.perf_counter()
+    segmentador = segmentacion.cargar(backend)
+    carga = time.perf_counter() - inicio
+    rss_carga = rss_actual_mb()
+
+    mascaras = None
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        mascaras = np.concatenate([segmentador.mascaras(imagenes[i:i + lote])
+                                   for i in range(0, len(imagenes), lote)])
+        tiempos.append((time.perf_counter() - inicio) / len(imagenes))
+    np.save(salida, mascaras)
+    return {
+        "carga": carga,
+        "latencia": statistics.median(tiempos),
+        "rss_carga": rss_carga,
+        "rss_max": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def main():
+    argumentos = sys.argv[1:]
+    opciones = {"--repeticiones": 3, "--lote": 1}
+    for opcion in opciones:
+        if opcion in argumentos:
+            indice = argumentos.index(opcion)
+            opciones[opcion] = int(argumentos[indice + 1])
+            del argumentos[indice:indice + 2]
+
+    if "--backend" in argumentos:
+        # Proceso hijo: mide un solo backend y guarda sus máscaras
+        indice = argumentos.index("--backend")
+        backend, salida = argumentos[indice + 1], argumentos[indice + 2]
+        del argumentos[indice:indice + 3]
+        print(json.dumps(medir_backend(backend, argumentos, opciones["--repeticiones"],
+                                       opciones["--lote"], salida)))
+        return
+
+    rutas = argumentos
+    if not rutas:
+        directorio = os.path.join(BASE, "imagenes")
+        rutas = [os.path.join(directorio, nombre) for nombre in sorted(os.listdir(directorio))
+                 if nombre.lower().endswith((".jpg", ".jpeg", ".png"))][:8]
+    segmentacion.exportar(int8=True)
+
+    print(f"{len(rutas)} imágenes, lote={opciones['--lote']}, "
+          f"{opciones['--repeticiones']} repeticiones")
+    referencia = None
+    with tempfile.TemporaryDirectory() as temporal:
+        for backend in segmentacion.BACKENDS:
+            salida = os.path.join(temporal, f"{backend}.npy")
+            proceso = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--backend", backend, salida,
+                 "--repeticiones", str(opciones["--repeticiones"]),
+                 "--lote", str(opciones["--lote"])] + rutas,
+                cwd=BASE, capture_output=True, text=True, check=True)
+            datos = json.loads(proceso.stdout.strip().splitlines()[-1])
+            mascaras = np.load(salida) == segmentacion.CLASE_CABELLO
+            if referencia is None:
+                referencia = mascaras
+            # Solo las imágenes con pelo en la referencia (ver segmentacion.paridad)
+            valores = [segmentacion.iou(a, b) for a, b in zip(referencia, mascaras)
+                       if a.mean() >= segmentacion.MIN_PELO]
+            iou = (f"IoU pelo media={np.mean(valores):.3f} mín.={min(valores):.3f} "
+                   f"({len(valores)} con pelo)" if valores else "IoU pelo: ninguna imagen con pelo")
+            print(f"{backend:<10} carga={datos['carga']:5.1f} s  "
+                  f"latencia={datos['latencia'] * 1000:7.1f} ms/imagen  "
+                  f"RSS={datos['rss_carga']:7.1f} MB (máx. {datos['rss_max']:7.1f} MB)  {iou}")
+
+
+if __name__ == "__main__":
+    main()
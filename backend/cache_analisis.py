@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# Caché de resultados del análisis de imágenes, direccionada por contenido.
+#
+# La clave exacta es el hash de los píxeles decodificados (no de los bytes del
+# archivo), así que el mismo fotograma guardado con otros metadatos coincide.
+# Además cada entrada guarda un hash perceptual (dHash de 64 bits): una copia
+# recomprimida o reescalada de la misma foto queda a pocos bits de distancia y
+# también se reutiliza, pero solo dentro de la misma sesión: dos fotos
+# distintas de personas distintas pueden quedar a pocos bits, y el análisis de
+# una no debe llegar a otra. Los píxeles idénticos sí se comparten entre
+# sesiones. Con CACHE_ANALISIS_RUTA los resultados se guardan
+# además en SQLite y sobreviven a reinicios y se comparten entre workers.
+
+# Bits distintos permitidos entre hashes perceptuales para considerar la misma foto
+DISTANCIA_MAXIMA = int(os.environ.get("CACHE_ANALISIS_DISTANCIA", 4))
+
+
+# numpy y OpenCV se importan al usarse: la caché se crea al arrancar también
+# en los workers que solo atienden el chat (ver vision.py)
+
+
+def clave_pixeles(img):
+    import numpy as np
+
+    sha = hashlib.sha256()
+    sha.update(str(img.shape).encode())
+    sha.update(np.ascontiguousarray(img).data)
+    return sha.hexdigest()
+
+
+def hash_perceptual(img):
+    """dHash: compara cada píxel con su vecino en una miniatura gris de 9x8."""
+    import cv2
+
+    gris = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    miniatura = cv2.resize(gris, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (miniatura[:, 1:] > miniatura[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class CacheAnalisis:
+    def __init__(self, max_entradas=256, ttl=7 * 24 * 3600, ruta=None):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # clave -> (resultados, hash perceptual, creado, sesión), de menos a
+        # más usada
+        self._entradas = OrderedDict()
+        self.aciertos = 0
+        self.aciertos_perceptuales = 0
+        self.fallos = 0
+
+        self._local = threading.local()
+        if ruta:
+            with self._conexion() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS analisis ("
+                    "clave TEXT PRIMARY KEY, phash TEXT NOT NULL, "
+                    "resultados TEXT NOT NULL, creado REAL NOT NULL, sesion TEXT)")
+                columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(analisis)")]
+                if "sesion" not in columnas:
+                    conn.execute("ALTER TABLE analisis ADD COLUMN sesion TEXT")
+            self._cargar_disco()
+
+    def _conexion(self):
+        # Una conexión por hilo, como en conversaciones.AlmacenSQLite
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cargar_disco(self):
+        filas = self._conexion().execute(
+            "SELECT clave, phash, resultados, creado, sesion FROM analisis "
+            "WHERE creado >= ? ORDER BY creado DESC LIMIT ?",
+            (time.time() - self.ttl, self.max_entradas)).fetchall()
+        with self._lock:
+            for clave, phash, resultados, creado, sesion in reversed(filas):
+                self._entradas[clave] = (json.loads(resultados), int(phash, 16), creado, sesion)
+        if filas:
+            logging.info(f"🗂️ {len(filas)} análisis cargados de {self.ruta}")
+
+    def _buscar_disco(self, clave):
+        fila = self._conexion().execute(
+            "SELECT phash, resultados, creado, sesion FROM analisis WHERE clave = ?",
+            (clave,)).fetchone()
+        if fila is None or time.time() - fila[2] > self.ttl:
+            return None
+        return json.loads(fila[1]), int(fila[0], 16), fila[2], fila[3]
+
+    def obtener(self, img, sesion=None):
+        """Resultados guardados para esta imagen, o None.
+
+        Los píxeles idénticos se reconocen en cualquier sesión; una copia casi
+        idéntica (hash perceptual), solo si se guardó en la misma `sesion`.
+        """
+        clave = clave_pixeles(img)
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[2] <= self.ttl:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return dict(entrada[0])
+
+        # Otro worker pudo haberla analizado y guardado en disco
+        if self.ruta:
+            entrada = self._buscar_disco(clave)
+            if entrada is not None:
+                with self._lock:
+                    self._entradas[clave] = entrada
+                    self.aciertos += 1
+                return dict(entrada[0])
+
+        if sesion is None:
+            with self._lock:
+                self.fallos += 1
+            return None
+        phash = hash_perceptual(img)
+        with self._lock:
+            for clave_guardada, (resultados, otro, creado, propia) in reversed(self._entradas.items()):
+                if (propia == sesion and ahora - creado <= self.ttl
+                        and distancia_hamming(phash, otro) <= DISTANCIA_MAXIMA):
+                    self._entradas.move_to_end(clave_guardada)
+                    self.aciertos_perceptuales += 1
+                    return dict(resultados)
+            self.fallos += 1
+        return None
+
+    def guardar(self, img, resultados, sesion=None):
+        clave = clave_pixeles(img)
+        phash = hash_perceptual(img)
+        ahora = time.time()
+        with self._lock:
+            self._entradas[clave] = (dict(resultados), phash, ahora, sesion)
+            self._entradas.move_to_end(clave)
+            self._desalojar(ahora)
+
+        if self.ruta:
+            try:
+                with self._conexion() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO analisis (clave, phash, resultados, creado, sesion) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (clave, f"{phash:016x}", json.dumps(resultados, ensure_ascii=False),
+                         ahora, sesion))
+                    conn.execute("DELETE FROM analisis WHERE creado < ?",
+                                 (ahora - self.ttl,))
+            except sqlite3.Error as e:
+                logging.warning(f"No se pudo guardar el análisis en disco: {e}")
+
+    def _desalojar(self, ahora):
+        # Primero las caducadas, estén donde estén: el orden del dict es de uso,
+        # no de creación, y una entrada vieja muy usada queda al final. Luego
+        # las menos usadas (al principio) si se supera el máximo de entradas
+        caducadas = [clave for clave, (_, _, creado, _) in self._entradas.items()
+                     if ahora - creado > self.ttl]
+        for clave in caducadas:
+            del self._entradas[clave]
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "aciertos": self.aciertos,
+                "aciertos_perceptuales": self.aciertos_perceptuales,
+                "fallos": self.fallos,
+                "disco": self.ruta
+            }
+
+
+def crear_cache():
+    """Caché configurada por variables de entorno.
+
+    CACHE_ANALISIS_MAX (entradas en memoria), CACHE_ANALISIS_TTL (segundos) y
+    CACHE_ANALISIS_RUTA (archivo SQLite; sin ella solo se guarda en memoria).
+    """
+    return CacheAnalisis(
+        max_entradas=int(os.environ.get("CACHE_ANALISIS_MAX", 256)),
+        ttl=int(os.environ.get("CACHE_ANALISIS_TTL", 7 * 24 * 3600)),
+        ruta=os.environ.get("CACHE_ANALISIS_RUTA") or None)
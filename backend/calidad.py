@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+
+# Control de calidad previo al análisis de una foto.
+#
+# RetinaFace, Segformer y MediaPipe tardan segundos; si la foto está movida,
+# a oscuras o no muestra a nadie, solo se descubre al final ("Cuerpo no
+# detectado" o {"Rostro Detectado": False}). Aquí una cascada de comprobaciones
+# baratas (decenas de milisegundos sobre una miniatura en gris) rechaza esas
+# fotos antes y explica al usuario qué cambiar:
+#
+# 1. tamaño y proporción de la imagen
+# 2. exposición: brillo medio y píxeles quemados o negros (histograma)
+# 3. presencia de un rostro de frente (cascada Haar de OpenCV)
+# 4. nitidez: varianza del laplaciano, sobre el rostro si se encontró
+#
+# Los "problemas" impiden el análisis; los "avisos" (primer plano, foto
+# horizontal, varias personas) se devuelven pero la foto se analiza igual.
+#
+# La cascada Haar solo ve caras de frente y pierde las de perfil, inclinadas
+# o pequeñas en una foto de cuerpo entero, y un fondo blanco de estudio quema
+# buena parte de los píxeles sin que la persona esté sobreexpuesta. Por eso no
+# encontrar rostro y el recorte del histograma son avisos: el análisis
+# completo (RetinaFace, MediaPipe) decide. CALIDAD_EXIGIR_ROSTRO=1 vuelve a
+# rechazar las fotos sin rostro.
+
+ACTIVADA = os.environ.get("CALIDAD_ACTIVADA", "1").lower() in ("1", "true", "si", "sí")
+LADO_MIN = int(os.environ.get("CALIDAD_LADO_MIN", 240))
+PROPORCION_MAX = float(os.environ.get("CALIDAD_PROPORCION_MAX", 3.0))
+NITIDEZ_MIN = float(os.environ.get("CALIDAD_NITIDEZ_MIN", 40))
+BRILLO_MIN = float(os.environ.get("CALIDAD_BRILLO_MIN", 55))
+BRILLO_MAX = float(os.environ.get("CALIDAD_BRILLO_MAX", 205))
+# Fracción de píxeles negros (<= 8) o quemados (>= 247) a partir de la que se avisa
+RECORTE_MAX = float(os.environ.get("CALIDAD_RECORTE_MAX", 0.35))
+EXIGIR_ROSTRO = os.environ.get("CALIDAD_EXIGIR_ROSTRO", "0").lower() in ("1", "true", "si", "sí")
+# Lado mayor de la miniatura en gris sobre la que se hacen las comprobaciones
+LADO_ANALISIS = 640
+# Un rostro más alto que esta fracción de la imagen indica un primer plano
+ROSTRO_PRIMER_PLANO = 0.3
+
+# CascadeClassifier no es seguro entre hilos: uno por hilo
+_locales = threading.local()
+_lock = threading.Lock()
+_metricas = {"evaluadas": 0, "rechazadas": 0, "segundos": 0.0, "motivos": {}}
+
+
+def _cascada():
+    import cv2
+
+    if not hasattr(_locales, "cascada"):
+        _locales.cascada = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    return _locales.cascada
+
+
+def _miniatura_gris(img_bgr):
+    import cv2
+
+    gris = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+    alto, ancho = gris.shape
+    escala = LADO_ANALISIS / max(alto, ancho)
+    if escala < 1:
+        gris = cv2.resize(gris, (round(ancho * escala), round(alto * escala)),
+                          interpolation=cv2.INTER_AREA)
+    return gris
+
+
+def nitidez(gris):
+    """Varianza del laplaciano: baja en fotos movidas o desenfocadas."""
+    import cv2
+
+    return float(cv2.Laplacian(gris, cv2.CV_64F).var())
+
+
+def detectar_rostros(gris):
+    """Rostros de frente (x, y, ancho, alto) en la miniatura, de mayor a menor."""
+    import cv2
+
+    rostros = _cascada().detectMultiScale(
+        cv2.equalizeHist(gris), scaleFactor=1.1, minNeighbors=5, minSize=(24, 24))
+    return sorted((tuple(int(v) for v in r) for r in rostros),
+                  key=lambda r: r[2] * r[3], reverse=True)
+
+
+def evaluar(img_bgr):
+    """Evalúa una foto decodificada (BGR) antes del análisis.
+
+    Devuelve {"apta", "problemas", "avisos", "metricas", "milisegundos"}:
+    "problemas" y "avisos" son frases para el usuario; "apta" es False si hay
+    algún problema.
+    """
+    import numpy as np
+
+    inicio = time.perf_counter()
+    problemas, avisos, motivos = [], [], []
+    alto, ancho = img_bgr.shape[:2]
+    metricas = {"ancho": ancho, "alto": alto}
+
+    if min(alto, ancho) < LADO_MIN:
+        motivos.append("tamano")
+        problemas.append("La imagen es muy pequeña: sube la foto original, sin recortar ni reducir.")
+    proporcion = max(alto, ancho) / max(1, min(alto, ancho))
+    if proporcion > PROPORCION_MAX:
+        motivos.append("proporcion")
+        problemas.append("La imagen es demasiado alargada: sube una foto normal, sin recortes ni panorámicas.")
+    elif ancho > alto * 1.2:
+        avisos.append("Una foto vertical muestra mejor el cuerpo completo.")
+
+    gris = _miniatura_gris(img_bgr)
+    brillo = float(gris.mean())
+    histograma = np.bincount(gris.ravel(), minlength=256) / gris.size
+    negros, quemados = float(histograma[:9].sum()), float(histograma[247:].sum())
+    metricas.update(brillo=round(brillo, 1), negros=round(negros, 3), quemados=round(quemados, 3))
+    if brillo < BRILLO_MIN:
+        motivos.append("oscura")
+        problemas.append("La foto está muy oscura: tómala con más luz, de frente a una ventana o a una lámpara.")
+    elif brillo > BRILLO_MAX:
+        motivos.append("sobreexpuesta")
+        problemas.append("La foto tiene demasiada luz: evita el flash directo y el sol de frente.")
+    elif negros > RECORTE_MAX:
+        avisos.append("Hay zonas muy oscuras: con más luz veremos mejor tus colores.")
+    elif quemados > RECORTE_MAX:
+        avisos.append("Hay zonas con demasiada luz: evita el flash directo para que se vean bien tus colores.")
+
+    rostros = detectar_rostros(gris) if not problemas else []
+    metricas["rostros"] = len(rostros)
+    region = gris
+    if rostros:
+        x, y, w, h = rostros[0]
+        region = gris[y:y + h, x:x + w]
+        if h / gris.shape[0] > ROSTRO_PRIMER_PLANO:
+            avisos.append("Parece un primer plano: para la silueta necesitamos verte de cuerpo completo.")
+        if len(rostros) > 1:
+            avisos.append("Aparece más de una persona: analizaremos la que se ve más grande.")
+    elif not problemas:
+        metricas["sin_rostro"] = True
+        if EXIGIR_ROSTRO:
+            motivos.append("sin_rostro")
+            problemas.append("No encontramos tu rostro: sube una foto de frente, con la cara descubierta y sin gafas de sol.")
+        else:
+            avisos.append("No vemos bien tu rostro: el análisis será más preciso con la cara de frente y descubierta.")
+
+    if not problemas:
+        metricas["nitidez"] = round(nitidez(region), 1)
+        if metricas["nitidez"] < NITIDEZ_MIN:
+            motivos.append("borrosa")
+            problemas.append("La foto está borrosa: apoya el móvil o pide a alguien que la tome, y enfoca tu cara.")
+
+    segundos = time.perf_counter() - inicio
+    with _lock:
+        _metricas["evaluadas"] += 1
+        _metricas["rechazadas"] += bool(problemas)
+        _metricas["segundos"] += segundos
+        for motivo in motivos:
+            _metricas["motivos"][motivo] = _metricas["motivos"].get(motivo, 0) + 1
+    return {"apta": not problemas, "problemas": problemas, "avisos": avisos,
+            "metricas": metricas, "milisegundos": round(segundos * 1000, 1)}
+
+
+def mensaje(problemas):
+    """Respuesta para el chat a partir de los problemas encontrados."""
+    return "No puedo analizar bien esta foto. " + " ".join(problemas)
+
+
+def estadisticas():
+    with _lock:
+        return {
+            "activada": ACTIVADA,
+            "evaluadas": _metricas["evaluadas"],
+            "rechazadas": _metricas["rechazadas"],
+            "motivos": dict(_metricas["motivos"]),
+            "ms_medios": round(1000 * _metricas["segundos"] / max(1, _metricas["evaluadas"]), 1)
+        }
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import logging
+import unicodedata
+
+# Catálogo de vestidos compilado a partir de base_vestidos.xlsx.
+#
+# La primera vez se lee el Excel (pandas + openpyxl) y se guarda una
+# instantánea JSON junto con la fecha de modificación y el tamaño del Excel.
+# Los arranques siguientes cargan la instantánea en milisegundos sin importar
+# pandas; si el Excel cambia, la instantánea se invalida y se recompila.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUTA_EXCEL = os.path.join(BASE_DIR, "base_vestidos.xlsx")
+RUTA_SNAPSHOT = os.environ.get(
+    "CATALOGO_SNAPSHOT", os.path.join(BASE_DIR, "cache", "catalogo.json"))
+VERSION_SNAPSHOT = 1
+
+COLUMNAS = {
+    "diseno": "DISEÑO",
+    "descripcion": "DESCRIPCION",
+    "colores": "COLORES",
+    "material": "MATERIAL",
+    "origen": "ORIGEN",
+    "imagen": "IMAGEN",
+}
+PALABRAS_VACIAS = {"a", "de", "del", "con", "y", "e", "en", "el", "la", "las",
+                   "los", "por", "para", "su", "sus", "un", "una"}
+
+
+def normalizar(texto):
+    """Minúsculas sin tildes ni espacios sobrantes."""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def clave_diseno(nombre):
+    return normalizar(nombre).upper()
+
+
+def tokenizar(texto):
+    """Palabras significativas de un campo (con repeticiones), sin el texto
+    entre paréntesis."""
+    texto = re.sub(r"\([^)]*\)", " ", normalizar(texto))
+    return [p for p in re.findall(r"[a-z]+", texto)
+            if p not in PALABRAS_VACIAS and len(p) > 1]
+
+
+def palabras(texto):
+    return set(tokenizar(texto))
+
+
+class Catalogo:
+    def __init__(self, vestidos):
+        self.vestidos = vestidos
+        self.por_diseno = {}
+        self._indices = {"colores": {}, "material": {}, "origen": {}}
+
+        for vestido in vestidos:
+            clave = clave_diseno(vestido["diseno"])
+            self.por_diseno[clave] = vestido
+            for campo, indice in self._indices.items():
+                for palabra in palabras(vestido[campo]):
+                    indice.setdefault(palabra, []).append(clave)
+
+    def __len__(self):
+        return len(self.vestidos)
+
+    def obtener(self, diseno):
+        """Vestido por nombre de diseño (sin distinguir mayúsculas ni tildes)."""
+        return self.por_diseno.get(clave_diseno(diseno))
+
+    def _buscar(self, campo, consulta):
+        # Todas las palabras de la consulta deben aparecer en el campo
+        claves = None
+        for palabra in palabras(consulta):
+            encontrados = set(self._indices[campo].get(palabra, ()))
+            claves = encontrados if claves is None else claves & encontrados
+        return [v for v in self.vestidos
+                if claves and clave_diseno(v["diseno"]) in claves]
+
+    def por_color(self, color):
+        return self._buscar("colores", color)
+
+    def por_material(self, material):
+        return self._buscar("material", material)
+
+    def por_origen(self, origen):
+        return self._buscar("origen", origen)
+
+    @staticmethod
+    def formatear(vestido):
+        return (f"DISEÑO: {vestido['diseno']}\nDESCRIPCIÓN: {vestido['descripcion']}\n"
+                f"COLORES: {vestido['colores']}\nMATERIAL: {vestido['material']}\n"
+                f"ORIGEN: {vestido['origen']}")
+
+    def texto_prompt(self, vestidos=None):
+        """Texto del catálogo (o de `vestidos`) en el formato del prompt."""
+        return "\n\n".join(self.formatear(v) for v in (self.vestidos if vestidos is None else vestidos))
+
+
+def compilar_excel(ruta_excel=RUTA_EXCEL):
+    """Lee el Excel y devuelve la lista de vestidos como dicts de texto."""
+    import pandas as pd
+
+    base = pd.read_excel(ruta_excel)
+    vestidos = []
+    for fila in base.to_dict("records"):
+        vestido = {}
+        for campo, columna in COLUMNAS.items():
+            valor = fila.get(columna)
+            vestido[campo] = "" if valor is None or pd.isna(
+                valor) else str(valor).strip()
+        if vestido["diseno"]:
+            vestidos.append(vestido)
+    return vestidos
+
+
+def _firma(ruta_excel):
+    estado = os.stat(ruta_excel)
+    return {"mtime": estado.st_mtime, "tamano": estado.st_size}
+
+
+def cargar_catalogo(ruta_excel=RUTA_EXCEL, ruta_snapshot=RUTA_SNAPSHOT):
+    """Catálogo desde la instantánea si sigue vigente; si no, desde el Excel."""
+    firma = _firma(ruta_excel)
+    try:
+        with open(ruta_snapshot, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") == VERSION_SNAPSHOT and snapshot.get("origen") == firma:
+            return Catalogo(snapshot["vestidos"])
+    except (OSError, ValueError):
+        pass
+
+    vestidos = compilar_excel(ruta_excel)
+    try:
+        os.makedirs(os.path.dirname(ruta_snapshot), exist_ok=True)
+        temporal = f"{ruta_snapshot}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"version": VERSION_SNAPSHOT, "origen": firma,
+                       "vestidos": vestidos}, f, ensure_ascii=False)
+        # Reemplazo atómico: otros workers nunca leen una instantánea a medias
+        os.replace(temporal, ruta_snapshot)
+        logging.info(f"📦 Catálogo compilado en {ruta_snapshot}")
+    except OSError as e:
+        logging.warning(
+            f"No se pudo guardar la instantánea del catálogo: {e}")
+    return Catalogo(vestidos)
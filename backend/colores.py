@@ -0,0 +1,192 @@
+import os
+
+import numpy as np
+
+# Clasificación de color de piel y cabello en espacio CIELAB.
+#
+# En lugar de una media RGB seguida de cadenas de umbrales, cada región
+# (rostro o máscara de pelo) se reduce a un color robusto: se descartan los
+# píxeles más oscuros y más claros por luminosidad (sombras y brillos) y se
+# toma la mediana del resto en Lab. Ese color se compara de una vez con todos
+# los prototipos de una paleta (distancia ΔE) y las distancias se convierten
+# en una probabilidad por clase.
+#
+# La piel se clasifica por defecto con los cortes de luminosidad que usaba
+# detection.py, pero aplicados al L* del color robusto (no a la media, que
+# sombras y brillos desplazan) y con una probabilidad por clase según la
+# distancia de ese L* a cada intervalo. Las muestras de la escala Monk de
+# PALETA_PIEL son más claras y menos saturadas que la piel fotografiada (una
+# piel clara típica, (224, 187, 160), quedaba en "Medio") y no hay aún recortes
+# reales etiquetados con los que calibrarla. COLORES_PIEL=paleta la activa para
+# compararla con benchmarks/bench_colores.py, que imprime los colores medidos
+# por clase para calibrarla. PALETA_CABELLO tampoco está calibrada: son colores
+# elegidos a mano.
+
+# Percentiles de luminosidad que se descartan por abajo y por arriba
+RECORTE = float(os.environ.get("COLORES_RECORTE", 0.15))
+# Temperatura (en unidades ΔE) del softmax que da las probabilidades
+TEMPERATURA = 6.0
+# Píxeles mínimos para dar una clasificación
+MIN_PIXELES = 20
+# Píxeles que se usan como máximo (muestreo uniforme): la mediana apenas cambia
+# y la conversión a Lab deja de depender del tamaño del recorte
+MAX_PIXELES = 4096
+MODO_PIEL = os.environ.get("COLORES_PIEL", "umbrales")
+# Cortes de luminancia (0.299 R + 0.587 G + 0.114 B, 0-255) entre tonos, de
+# oscuro a claro; se pasan a L* con el gris de esa luminancia (ver LIMITES_PIEL)
+CORTES_PIEL = [40, 80, 100, 150]
+TONOS_PIEL = ["Muy oscuro", "Oscuro", "Medio", "Claro", "Muy claro"]
+# Temperatura (en unidades de L*) del softmax sobre la distancia a cada intervalo
+TEMPERATURA_PIEL = 3.0
+
+# Paletas: clase -> prototipos sRGB, sin calibrar (ver arriba). Piel: escala
+# Monk (MST 1-10) agrupada de dos en dos; cabello: colores elegidos a mano.
+PALETA_PIEL = {
+    "Muy claro": ["#f6ede4", "#f3e7db"],
+    "Claro": ["#f7ead0", "#eadaba"],
+    "Medio": ["#d7bd96", "#a07e56"],
+    "Oscuro": ["#825c43", "#604134"],
+    "Muy oscuro": ["#3a312a", "#292420"],
+}
+PALETA_CABELLO = {
+    "Negro": ["#1c1816", "#2b2624", "#3a3431"],
+    "Castaño oscuro": ["#3f2c22", "#4f3728", "#5a4032"],
+    "Castaño claro": ["#7a5a42", "#8e6a4c", "#a27c5b"],
+    "Rubio": ["#c8a56e", "#dcc08a", "#e6d2a6", "#b89360"],
+    "Pelirrojo": ["#8d3b1f", "#a8502a", "#c0673a"],
+    "Gris / Blanco": ["#9c9a98", "#c4c2bf", "#e3e1dd"],
+}
+
+
+def srgb_a_lab(rgb):
+    """sRGB (uint8 o [0, 1], forma (..., 3)) a CIELAB D65, vectorizado."""
+    rgb = np.asarray(rgb)
+    if np.issubdtype(rgb.dtype, np.integer):
+        rgb = rgb.astype(np.float32) / 255.0
+    else:
+        rgb = rgb.astype(np.float32)
+    lineal = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = lineal @ np.array([[0.4124, 0.2126, 0.0193],
+                             [0.3576, 0.7152, 0.1192],
+                             [0.1805, 0.0722, 0.9505]], dtype=np.float32)
+    xyz /= np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    return np.stack([116 * f[..., 1] - 16,
+                     500 * (f[..., 0] - f[..., 1]),
+                     200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def _hex_a_rgb(color):
+    return [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+class Paleta:
+    """Prototipos de una paleta ya convertidos a Lab, para comparar en bloque."""
+
+    def __init__(self, paleta):
+        self.clases = list(paleta)
+        prototipos = [(i, _hex_a_rgb(c)) for i, clase in enumerate(self.clases)
+                      for c in paleta[clase]]
+        self.clase_de = np.array([i for i, _ in prototipos])
+        self.lab = srgb_a_lab(np.array([rgb for _, rgb in prototipos], dtype=np.uint8))
+
+    def probabilidades(self, lab):
+        """Probabilidad de cada clase para uno o varios colores Lab (N x clases)."""
+        lab = np.atleast_2d(lab)
+        # ΔE76 de cada color a cada prototipo (N x prototipos) y, por clase, el más cercano
+        distancias = np.linalg.norm(lab[:, None, :] - self.lab[None, :, :], axis=-1)
+        por_clase = np.stack([distancias[:, self.clase_de == i].min(axis=1)
+                              for i in range(len(self.clases))], axis=1)
+        logits = -por_clase / TEMPERATURA
+        logits -= logits.max(axis=1, keepdims=True)
+        pesos = np.exp(logits)
+        return pesos / pesos.sum(axis=1, keepdims=True), por_clase
+
+
+PIEL = Paleta(PALETA_PIEL)
+CABELLO = Paleta(PALETA_CABELLO)
+# Intervalos [mínimo, máximo) de L* de cada tono de TONOS_PIEL (62.1, 42.4,
+# 34.0 y 16.1 para los cortes 150, 100, 80 y 40)
+_cortes = srgb_a_lab(np.array([[v, v, v] for v in CORTES_PIEL], dtype=np.uint8))[:, 0]
+LIMITES_PIEL = np.stack([np.concatenate([[0.0], _cortes]),
+                         np.concatenate([_cortes, [100.0]])], axis=1)
+
+
+def color_robusto(pixeles_rgb):
+    """Color representativo de un conjunto de píxeles RGB (N x 3, uint8).
+
+    Devuelve (Lab, RGB) de la mediana tras descartar el RECORTE más oscuro y
+    el más claro por luminosidad, o (None, None) si hay muy pocos píxeles.
+    """
+    pixeles_rgb = np.asarray(pixeles_rgb).reshape(-1, 3)
+    if len(pixeles_rgb) < MIN_PIXELES:
+        return None, None
+    if len(pixeles_rgb) > MAX_PIXELES:
+        pixeles_rgb = pixeles_rgb[::-(-len(pixeles_rgb) // MAX_PIXELES)]
+    lab = srgb_a_lab(pixeles_rgb)
+    bajo, alto = np.quantile(lab[:, 0], [RECORTE, 1 - RECORTE])
+    centrales = (lab[:, 0] >= bajo) & (lab[:, 0] <= alto)
+    if centrales.sum() >= MIN_PIXELES:
+        lab, pixeles_rgb = lab[centrales], pixeles_rgb[centrales]
+    return np.median(lab, axis=0), np.median(pixeles_rgb, axis=0).astype(int).tolist()
+
+
+def clasificar(pixeles_rgb, paleta):
+    """Clase más probable de unos píxeles según `paleta`.
+
+    Devuelve {"nombre", "confianza", "probabilidades", "color"} donde "color"
+    es el RGB robusto; "nombre" es "Indefinido" si no hay píxeles suficientes.
+    """
+    lab, rgb = color_robusto(pixeles_rgb)
+    if lab is None:
+        return {"nombre": "Indefinido", "confianza": 0.0, "probabilidades": {},
+                "color": [0, 0, 0]}
+    probabilidades, _ = paleta.probabilidades(lab)
+    probabilidades = probabilidades[0]
+    mejor = int(np.argmax(probabilidades))
+    return {
+        "nombre": paleta.clases[mejor],
+        "confianza": round(float(probabilidades[mejor]), 3),
+        "probabilidades": {c: round(float(p), 3) for c, p in zip(paleta.clases, probabilidades)},
+        "color": rgb
+    }
+
+
+def clasificar_umbrales_piel(pixeles_rgb):
+    """Tono por el L* del color robusto, con los intervalos de LIMITES_PIEL.
+
+    La probabilidad de cada tono decae con la distancia (en L*) de ese color a
+    su intervalo: dentro del intervalo la distancia es 0, así que la confianza
+    es alta en el centro de un tono y ronda 0.5 junto a un corte.
+    """
+    lab, rgb = color_robusto(pixeles_rgb)
+    if lab is None:
+        return {"nombre": "Indefinido", "confianza": 0.0, "probabilidades": {},
+                "color": [0, 0, 0]}
+    luminosidad = float(lab[0])
+    distancias = np.maximum(0.0, np.maximum(LIMITES_PIEL[:, 0] - luminosidad,
+                                            luminosidad - LIMITES_PIEL[:, 1]))
+    pesos = np.exp(-distancias / TEMPERATURA_PIEL)
+    probabilidades = pesos / pesos.sum()
+    mejor = int(np.argmax(probabilidades))
+    return {
+        "nombre": TONOS_PIEL[mejor],
+        "confianza": round(float(probabilidades[mejor]), 3),
+        "probabilidades": {t: round(float(p), 3) for t, p in zip(TONOS_PIEL, probabilidades)},
+        "color": rgb
+    }
+
+
+def clasificar_piel(rostro_rgb, modo=None):
+    """Tono de piel de un rostro RGB (uint8), sin el relleno negro que deja la
+    alineación de DeepFace. `modo` es "umbrales" o "paleta" (COLORES_PIEL)."""
+    pixeles = rostro_rgb.reshape(-1, 3)
+    pixeles = pixeles[pixeles.max(axis=1) > 10]
+    if (modo or MODO_PIEL) == "paleta":
+        return clasificar(pixeles, PIEL)
+    return clasificar_umbrales_piel(pixeles)
+
+
+def clasificar_cabello(img_rgb, mascara):
+    """Color de pelo de los píxeles de `img_rgb` marcados en `mascara`."""
+    return clasificar(img_rgb[mascara.astype(bool)], CABELLO)
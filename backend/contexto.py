@@ -0,0 +1,180 @@
+import os
+import re
+import unicodedata
+
+import prompts
+from hechos import HechosSesion
+
+# Gestión del contexto enviado a la IA por presupuesto de tokens.
+#
+# Siempre se conservan el prompt de sistema y el mensaje con los datos de la
+# sesión (características detectadas, nombre, evento, estilo, colores). Esos
+# datos se extraen de cada mensaje del usuario al llegar (extraer_datos), junto
+# con la pregunta de la asistente a la que responde: un "Ana" suelto tras
+# "¿cómo te llamas?" también es un nombre.
+#
+# Lo que no encaja en ningún campo (una preferencia fuera de las listas, una
+# fecha) no se pierde al plegar los turnos antiguos: los mensajes del usuario
+# plegados pasan al resumen de la sesión, con la pregunta a la que contestan si
+# son respuestas cortas. El resumen conserva los MAX_RESUMEN caracteres más
+# recientes.
+
+PRESUPUESTO_TOKENS = int(os.environ.get("CONTEXTO_MAX_TOKENS", 4000))
+# Tokens extra por mensaje (rol y separadores del formato de chat)
+TOKENS_POR_MENSAJE = 4
+# Turnos recientes que se conservan siempre, aunque se supere el presupuesto
+TURNOS_MINIMOS = 2
+# Caracteres del resumen de los turnos plegados y de cada una de sus líneas
+MAX_RESUMEN = int(os.environ.get("CONTEXTO_MAX_RESUMEN", 800))
+MAX_LINEA_RESUMEN = 200
+# Una respuesta de hasta estas palabras se resume junto a su pregunta
+PALABRAS_RESPUESTA_CORTA = 4
+
+EVENTOS = ["boda", "graduacion", "gala", "coctel", "fiesta", "bautizo",
+           "comunion", "cena", "cumpleanos", "aniversario", "congreso",
+           "evento de empresa", "evento corporativo", "nochevieja", "quince anos",
+           "xv anos", "pedida", "compromiso", "entrevista", "ceremonia"]
+ESTILOS = ["elegante", "clasico", "moderno", "minimalista", "romantico",
+           "bohemio", "sexy", "sofisticado", "casual", "formal", "informal",
+           "atrevido", "discreto", "largo", "corto", "midi", "vaporoso",
+           "entallado", "holgado", "escote", "espalda abierta", "manga larga",
+           "sin mangas", "dos piezas", "pantalon", "falda", "chaqueta"]
+COLORES = ["negro", "blanco", "rojo", "azul", "verde", "amarillo", "rosa",
+           "morado", "lila", "beige", "dorado", "plateado", "burdeos", "borgona",
+           "gris", "naranja", "marron", "nude", "pastel", "crema", "turquesa",
+           "coral", "mostaza", "fucsia", "celeste", "marino", "rayas", "floral"]
+
+PATRON_NOMBRE = re.compile(
+    r"\b(?:me llamo|mi nombre es|ll[aá]mame)\s+([^\W\d_]+)", re.IGNORECASE)
+PATRON_NOMBRE_SOY = re.compile(r"\bsoy\s+([A-ZÁÉÍÓÚÑ][^\W\d_]+)")
+# Respuesta con solo un nombre (y quizá un apellido) a la pregunta por el nombre
+PATRON_PREGUNTA_NOMBRE = re.compile(r"c[oó]mo te llamas|tu nombre", re.IGNORECASE)
+PATRON_NOMBRE_SUELTO = re.compile(r"^\s*([^\W\d_]+)(?:\s+[^\W\d_]+)?\s*[.!]?\s*$")
+NO_NOMBRES = {"si", "no", "hola", "vale", "ok", "gracias", "claro", "perfecto"}
+PATRON_PREGUNTA = re.compile(r"¿?[^.!?¿\n]*\?")
+
+
+def normalizar(texto):
+    """Minúsculas sin tildes, para comparar palabras clave."""
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokens_mensaje(mensaje):
+    return prompts.estimar_tokens(len(mensaje.get("content") or "")) + TOKENS_POR_MENSAJE
+
+
+def _buscar(texto, palabras):
+    return [p for p in palabras if re.search(rf"\b{p}\b", texto)]
+
+
+def ultima_pregunta(texto):
+    """Última pregunta de un mensaje de la asistente, o None."""
+    preguntas = PATRON_PREGUNTA.findall(texto or "")
+    return preguntas[-1].strip() if preguntas else None
+
+
+def extraer_datos(texto, pregunta=None):
+    """Nombre, evento, estilo y colores mencionados en un mensaje del usuario.
+
+    `pregunta` es el mensaje anterior de la asistente: si preguntaba por el
+    nombre, una respuesta con solo un nombre también cuenta.
+    """
+    normalizado = normalizar(texto)
+    datos = {
+        "estilo": _buscar(normalizado, ESTILOS),
+        "colores": _buscar(normalizado, COLORES)
+    }
+
+    nombre = PATRON_NOMBRE.search(texto) or PATRON_NOMBRE_SOY.search(texto)
+    if nombre:
+        datos["nombre"] = nombre.group(1).capitalize()
+    elif pregunta and PATRON_PREGUNTA_NOMBRE.search(ultima_pregunta(pregunta) or ""):
+        suelto = PATRON_NOMBRE_SUELTO.match(texto)
+        if suelto and normalizar(suelto.group(1)) not in NO_NOMBRES:
+            datos["nombre"] = suelto.group(1).capitalize()
+    if _buscar(normalizado, EVENTOS):
+        # Se guarda la frase completa para no perder fecha o lugar
+        datos["evento"] = texto.strip()[:160]
+    return datos
+
+
+def registrar_mensaje_usuario(hechos, texto, pregunta=None):
+    """Actualiza el registro de la sesión con lo mencionado en `texto`
+    (`pregunta`: mensaje anterior de la asistente, ver extraer_datos)."""
+    datos = extraer_datos(texto, pregunta)
+    cambio = hechos.actualizar(nombre=datos.get("nombre"),
+                               evento=datos.get("evento"))
+    cambio = hechos.agregar("estilo", datos["estilo"]) or cambio
+    cambio = hechos.agregar("colores", datos["colores"]) or cambio
+    return cambio
+
+
+def resumir(turnos):
+    """Líneas de resumen de unos turnos: los mensajes del usuario y, si son
+    respuestas cortas, la pregunta de la asistente a la que contestan."""
+    lineas = []
+    anterior = None
+    for turno in turnos:
+        if turno.get("role") == "assistant":
+            anterior = turno.get("content")
+        elif turno.get("role") == "user":
+            texto = " ".join((turno.get("content") or "").split())[:MAX_LINEA_RESUMEN]
+            pregunta = ultima_pregunta(anterior)
+            if pregunta and len(texto.split()) <= PALABRAS_RESPUESTA_CORTA:
+                lineas.append(f"- A «{pregunta}» respondió: {texto}")
+            elif texto:
+                lineas.append(f"- {texto}")
+            anterior = None
+    return lineas
+
+
+def plegar_en_resumen(hechos, turnos):
+    """Añade `turnos` al resumen de la sesión, conservando las líneas más
+    recientes que caben en MAX_RESUMEN. Devuelve True si cambió."""
+    lineas = (hechos.resumen.split("\n") if hechos.resumen else []) + resumir(turnos)
+    while lineas and len("\n".join(lineas)) > MAX_RESUMEN:
+        lineas.pop(0)
+    return hechos.actualizar(resumen="\n".join(lineas) or None)
+
+
+def compactar(sesion, tokens_fijos=0, presupuesto=None):
+    """Pliega los turnos más antiguos que no caben en el presupuesto.
+
+    `tokens_fijos` son los tokens del prompt de sistema, que siempre se envía,
+    y el mensaje de datos de la sesión también se reserva, con sitio para que
+    el resumen crezca hasta MAX_RESUMEN. Los mensajes de sistema de la sesión
+    nunca se pliegan. Lo que dijo el usuario en los turnos plegados pasa al
+    resumen (ver plegar_en_resumen). Modifica la sesión en el sitio y devuelve
+    los turnos plegados.
+    """
+    presupuesto = presupuesto or PRESUPUESTO_TOKENS
+    turnos = sesion["turnos"]
+    fijados = [t for t in turnos if t.get("role") == "system"]
+    conversacion = [t for t in turnos if t.get("role") != "system"]
+
+    hechos = HechosSesion.desde_sesion(sesion)
+    datos = hechos.mensaje()
+    usados = tokens_fijos + sum(tokens_mensaje(t) for t in fijados)
+    if datos:
+        usados += tokens_mensaje(datos)
+    usados += prompts.estimar_tokens(max(0, MAX_RESUMEN - len(hechos.resumen or "")))
+
+    # Se recorren los turnos del más reciente al más antiguo hasta agotar el presupuesto
+    conservar = 0
+    for turno in reversed(conversacion):
+        coste = tokens_mensaje(turno)
+        if conservar >= TURNOS_MINIMOS and usados + coste > presupuesto:
+            break
+        usados += coste
+        conservar += 1
+
+    plegados = conversacion[:len(conversacion) - conservar]
+    if not plegados:
+        return []
+
+    ids_plegados = {id(t) for t in plegados}
+    sesion["turnos"] = [t for t in turnos if id(t) not in ids_plegados]
+    plegar_en_resumen(hechos, plegados)
+    hechos.guardar_en(sesion)
+    return plegados
@@ -0,0 +1,267 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Almacenes del historial de conversación por sesión.
+#
+# Cada sesión es un dict {"prompt": versión del prompt de sistema, "turnos": [...]}:
+# el prompt de sistema no se copia en la sesión (ver prompts.py).
+#
+# - AlmacenMemoria: LRU + TTL dentro del proceso (por defecto).
+# - AlmacenSQLite: archivo compartido por todos los workers del contenedor, de
+#   modo que una sesión sobrevive aunque la petición caiga en otro worker.
+#
+# Ambos aplican los mismos límites por sesión (mensajes y bytes); al
+# superarlos se descartan los mensajes más antiguos que no sean de sistema.
+#
+# obtener() entrega una copia: quien la modifica durante la llamada a la IA no
+# debe guardarla después, porque pisaría lo que otra petición de la misma
+# sesión haya añadido entretanto. Los cambios se hacen con actualizar(), que
+# relee la sesión y la modifica de forma atómica.
+
+
+def tamano_historial(datos):
+    return len(json.dumps(datos, ensure_ascii=False).encode("utf-8"))
+
+
+def aplicar_limites(sesion, max_mensajes, max_bytes):
+    """Recorta los turnos más antiguos conservando los mensajes de sistema."""
+    turnos = list(sesion["turnos"])
+    tamano = tamano_historial(sesion)
+    while len(turnos) > max_mensajes or tamano > max_bytes:
+        indice = next((i for i, h in enumerate(turnos)
+                       if h.get("role") != "system"), None)
+        if indice is None:
+            break
+        tamano -= tamano_historial(turnos.pop(indice))
+    return dict(sesion, turnos=turnos)
+
+
+# Locks por sesión (repartidos por hash) para las actualizaciones atómicas
+BLOQUEOS_SESION = 64
+
+
+class AlmacenConversaciones(ABC):
+    """Interfaz común: obtener / guardar / actualizar / eliminar / estadisticas."""
+
+    def __init__(self, ttl=3600, max_mensajes=40, max_bytes=256 * 1024):
+        self.ttl = ttl
+        self.max_mensajes = max_mensajes
+        self.max_bytes = max_bytes
+        self._bloqueos = [threading.Lock() for _ in range(BLOQUEOS_SESION)]
+
+    def _bloqueo(self, session_id):
+        return self._bloqueos[hash(session_id) % BLOQUEOS_SESION]
+
+    @abstractmethod
+    def obtener(self, session_id):
+        """Copia de la sesión guardada o None si no existe o ha caducado.
+
+        Modificar la copia no cambia lo guardado hasta llamar a guardar().
+        """
+
+    @abstractmethod
+    def guardar(self, session_id, sesion):
+        """Guarda la sesión aplicando los límites y devuelve la versión guardada."""
+
+    @abstractmethod
+    def actualizar(self, session_id, funcion):
+        """Lee la sesión, le aplica `funcion(sesion)` y guarda el resultado sin
+        que otra actualización de la misma sesión se cuele entre medias.
+
+        `funcion` recibe la sesión guardada (None si no existe o ha caducado)
+        y devuelve la sesión a guardar; se devuelve la versión guardada. Dos
+        peticiones simultáneas de la misma sesión (un mensaje del chat y el
+        análisis de una foto) añaden así sus turnos sin pisarse.
+        """
+
+    @abstractmethod
+    def eliminar(self, session_id):
+        pass
+
+    @abstractmethod
+    def estadisticas(self):
+        pass
+
+    def __contains__(self, session_id):
+        return self.obtener(session_id) is not None
+
+
+class AlmacenMemoria(AlmacenConversaciones):
+    def __init__(self, max_sesiones=1000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sesiones = max_sesiones
+        self._lock = threading.Lock()
+        # session_id -> (sesión, último acceso, bytes)
+        self._sesiones = OrderedDict()
+        self._bytes_totales = 0
+
+    def obtener(self, session_id):
+        with self._lock:
+            entrada = self._sesiones.get(session_id)
+            if entrada is None:
+                return None
+            sesion, acceso, tamano = entrada
+            if time.time() - acceso > self.ttl:
+                self._quitar(session_id)
+                return None
+            self._sesiones[session_id] = (sesion, time.time(), tamano)
+            self._sesiones.move_to_end(session_id)
+        # Como en SQLite, quien la recibe puede modificarla sin tocar lo guardado
+        return copy.deepcopy(sesion)
+
+    def guardar(self, session_id, sesion):
+        sesion = aplicar_limites(sesion, self.max_mensajes, self.max_bytes)
+        tamano = tamano_historial(sesion)
+        with self._lock:
+            self._quitar(session_id)
+            self._sesiones[session_id] = (copy.deepcopy(sesion), time.time(), tamano)
+            self._bytes_totales += tamano
+            self._desalojar()
+        return sesion
+
+    def actualizar(self, session_id, funcion):
+        with self._bloqueo(session_id):
+            return self.guardar(session_id, funcion(self.obtener(session_id)))
+
+    def eliminar(self, session_id):
+        with self._lock:
+            self._quitar(session_id)
+
+    def _quitar(self, session_id):
+        entrada = self._sesiones.pop(session_id, None)
+        if entrada is not None:
+            self._bytes_totales -= entrada[2]
+
+    def _desalojar(self):
+        # Primero las sesiones caducadas (las más antiguas están al principio),
+        # luego las menos usadas si se supera el máximo de sesiones
+        limite = time.time() - self.ttl
+        while self._sesiones:
+            session_id, (_, acceso, _) = next(iter(self._sesiones.items()))
+            if acceso >= limite and len(self._sesiones) <= self.max_sesiones:
+                break
+            self._quitar(session_id)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "backend": "memoria",
+                "sesiones": len(self._sesiones),
+                "max_sesiones": self.max_sesiones,
+                "bytes": self._bytes_totales
+            }
+
+
+class AlmacenSQLite(AlmacenConversaciones):
+    def __init__(self, ruta="conversaciones.db", **kwargs):
+        super().__init__(**kwargs)
+        self.ruta = ruta
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones ("
+                "session_id TEXT PRIMARY KEY, datos TEXT NOT NULL, "
+                "bytes INTEGER NOT NULL, actualizado REAL NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_actualizado ON sesiones(actualizado)")
+
+    def _conexion(self):
+        # Una conexión por hilo; WAL permite lectores concurrentes entre workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _leer(self, conn, session_id):
+        fila = conn.execute(
+            "SELECT datos, actualizado FROM sesiones WHERE session_id = ?",
+            (session_id,)).fetchone()
+        if fila is None or time.time() - fila[1] > self.ttl:
+            return None
+        return json.loads(fila[0])
+
+    def _escribir(self, conn, session_id, sesion):
+        sesion = aplicar_limites(sesion, self.max_mensajes, self.max_bytes)
+        datos = json.dumps(sesion, ensure_ascii=False)
+        ahora = time.time()
+        conn.execute(
+            "INSERT INTO sesiones (session_id, datos, bytes, actualizado) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+            "datos = excluded.datos, bytes = excluded.bytes, "
+            "actualizado = excluded.actualizado",
+            (session_id, datos, len(datos.encode("utf-8")), ahora))
+        conn.execute("DELETE FROM sesiones WHERE actualizado < ?",
+                     (ahora - self.ttl,))
+        return sesion
+
+    def obtener(self, session_id):
+        # Las caducadas se borran al guardar cualquier sesión (ver _escribir)
+        return self._leer(self._conexion(), session_id)
+
+    def guardar(self, session_id, sesion):
+        with self._conexion() as conn:
+            return self._escribir(conn, session_id, sesion)
+
+    def actualizar(self, session_id, funcion):
+        # BEGIN IMMEDIATE toma el lock de escritura antes de leer: los demás
+        # workers esperan (timeout de la conexión) en lugar de leer la versión
+        # que se está a punto de reemplazar
+        with self._bloqueo(session_id):
+            conn = self._conexion()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                sesion = self._escribir(
+                    conn, session_id, funcion(self._leer(conn, session_id)))
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            return sesion
+
+    def eliminar(self, session_id):
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM sesiones WHERE session_id = ?",
+                         (session_id,))
+
+    def estadisticas(self):
+        sesiones, total = self._conexion().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sesiones").fetchone()
+        return {
+            "backend": "sqlite",
+            "ruta": self.ruta,
+            "sesiones": sesiones,
+            "bytes": total,
+            "bytes_archivo": os.path.getsize(self.ruta) if os.path.exists(self.ruta) else 0
+        }
+
+
+def crear_almacen():
+    """Crea el almacén configurado por variables de entorno.
+
+    CONVERSACIONES_BACKEND=memoria|sqlite, CONVERSACIONES_RUTA (sqlite),
+    CONVERSACIONES_MAX_SESIONES, CONVERSACIONES_TTL (segundos),
+    CONVERSACIONES_MAX_MENSAJES y CONVERSACIONES_MAX_BYTES (por sesión).
+    """
+    backend = os.environ.get("CONVERSACIONES_BACKEND", "memoria").lower()
+    limites = {
+        "ttl": int(os.environ.get("CONVERSACIONES_TTL", 3600)),
+        "max_mensajes": int(os.environ.get("CONVERSACIONES_MAX_MENSAJES", 40)),
+        "max_bytes": int(os.environ.get("CONVERSACIONES_MAX_BYTES", 256 * 1024)),
+    }
+    if backend == "sqlite":
+        ruta = os.environ.get("CONVERSACIONES_RUTA", "conversaciones.db")
+        logging.info(f"💬 Historial de conversaciones en SQLite: {ruta}")
+        return AlmacenSQLite(ruta=ruta, **limites)
+    return AlmacenMemoria(
+        max_sesiones=int(os.environ.get("CONVERSACIONES_MAX_SESIONES", 1000)),
+        **limites)
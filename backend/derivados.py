@@ -0,0 +1,192 @@
+import os
+import logging
+import threading
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+# Derivados de las imágenes servidas en /imagenes: anchos fijos en WebP/AVIF.
+#
+# Las imágenes originales pesan entre 200 KB y 1,4 MB y se muestran en un
+# widget de chat de pocos cientos de píxeles. Cada derivado (ancho + formato)
+# se genera la primera vez que se pide, o al construir la imagen de Docker con
+# generar_todos(), y se guarda en disco; el nombre incluye la fecha y el tamaño
+# del original, así que si este cambia el derivado se regenera solo. Un ancho
+# igual o mayor que el del original no genera derivado: se sirve el original
+# (o solo se cambia el formato).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RUTA_CACHE = os.environ.get(
+    "IMAGENES_CACHE", os.path.join(BASE_DIR, "cache", "imagenes"))
+ANCHOS = [int(a) for a in os.environ.get(
+    "IMAGENES_ANCHOS", "320,640,960,1280").split(",")]
+EXTENSIONES = (".jpg", ".jpeg", ".png", ".webp")
+
+# Formato -> (tipo MIME, extensión, opciones de guardado), en orden de preferencia
+FORMATOS = {
+    "avif": ("image/avif", ".avif", {"quality": 55}),
+    "webp": ("image/webp", ".webp", {"quality": 80, "method": 4}),
+}
+FORMATOS_ORIGINALES = {
+    ".jpg": ("image/jpeg", ".jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    ".jpeg": ("image/jpeg", ".jpg", {"quality": 85, "optimize": True, "progressive": True}),
+    ".png": ("image/png", ".png", {"optimize": True}),
+    ".webp": ("image/webp", ".webp", {"quality": 80, "method": 4}),
+}
+
+try:
+    # Pillow 10 no codifica AVIF: lo añade pillow-avif-plugin (requirements.txt).
+    # Sin el plugin solo se ofrece WebP
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+Image.init()
+DISPONIBLES = [f for f in FORMATOS if f.upper() in Image.SAVE]
+
+_locks = {}
+_lock_global = threading.Lock()
+
+
+def _lock(clave):
+    with _lock_global:
+        return _locks.setdefault(clave, threading.Lock())
+
+
+def elegir_formato(accept):
+    """Primer formato moderno que acepta el navegador, o None (el original).
+
+    Se mira la cabecera literal: `*/*` no garantiza que el navegador sepa
+    decodificar WebP o AVIF.
+    """
+    accept = (accept or "").lower()
+    for formato in DISPONIBLES:
+        if FORMATOS[formato][0] in accept:
+            return formato
+    return None
+
+
+def elegir_ancho(pedido):
+    """Menor ancho de ANCHOS que cubre el pedido (o el mayor si lo supera)."""
+    if not pedido or pedido <= 0:
+        return None
+    for ancho in sorted(ANCHOS):
+        if ancho >= pedido:
+            return ancho
+    return max(ANCHOS)
+
+
+@lru_cache(maxsize=1024)
+def _ancho(ruta, mtime_ns, tamano):
+    # Image.open solo lee la cabecera; las orientaciones EXIF 5-8 giran la
+    # imagen 90°, y entonces el ancho mostrado es el alto
+    with Image.open(ruta) as imagen:
+        return imagen.height if imagen.getexif().get(0x0112, 1) > 4 else imagen.width
+
+
+def ancho_original(ruta):
+    """Ancho del original ya orientado; se relee solo si cambian fecha o tamaño."""
+    estado = os.stat(ruta)
+    return _ancho(ruta, estado.st_mtime_ns, estado.st_size)
+
+
+def ruta_derivado(ruta_original, ancho, formato):
+    nombre, extension = os.path.splitext(os.path.basename(ruta_original))
+    _, sufijo, _ = FORMATOS[formato] if formato else FORMATOS_ORIGINALES[extension.lower()]
+    estado = os.stat(ruta_original)
+    version = f"{estado.st_mtime_ns:x}{estado.st_size:x}"
+    directorio = os.path.basename(os.path.dirname(ruta_original))
+    return os.path.join(RUTA_CACHE, directorio,
+                        f"{nombre}-{ancho or 'orig'}-{version}{sufijo}")
+
+
+def generar(ruta_original, ancho, formato):
+    """Ruta del derivado en disco, generándolo si aún no existe."""
+    destino = ruta_derivado(ruta_original, ancho, formato)
+    if os.path.exists(destino):
+        return destino
+
+    # Un solo hilo genera cada derivado; el resto espera y lo reutiliza
+    with _lock(destino):
+        if os.path.exists(destino):
+            return destino
+        extension = os.path.splitext(ruta_original)[1].lower()
+        _, _, opciones = FORMATOS[formato] if formato else FORMATOS_ORIGINALES[extension]
+        with Image.open(ruta_original) as imagen:
+            imagen = ImageOps.exif_transpose(imagen)
+            if ancho and imagen.width > ancho:
+                alto = round(imagen.height * ancho / imagen.width)
+                imagen = imagen.resize((ancho, alto), Image.LANCZOS)
+            if formato is None and extension in (".jpg", ".jpeg") and imagen.mode != "RGB":
+                imagen = imagen.convert("RGB")
+            elif imagen.mode not in ("RGB", "RGBA"):
+                transparente = imagen.mode in ("P", "LA") or "A" in imagen.getbands()
+                imagen = imagen.convert("RGBA" if transparente else "RGB")
+
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            imagen.save(temporal, format=(formato or Image.registered_extensions()[
+                        extension]).upper(), **opciones)
+        # Reemplazo atómico: otro worker nunca sirve un derivado a medias
+        os.replace(temporal, destino)
+    logging.info(f"🖼️ Derivado generado: {destino}")
+    return destino
+
+
+def negociar(ruta_original, accept, ancho_pedido=None):
+    """(ruta, tipo MIME) del derivado que corresponde a la petición, o None
+    si lo mejor es servir el original tal cual."""
+    extension = os.path.splitext(ruta_original)[1].lower()
+    if extension not in EXTENSIONES:
+        return None
+    formato = elegir_formato(accept)
+    ancho = elegir_ancho(ancho_pedido)
+    try:
+        if ancho and ancho >= ancho_original(ruta_original):
+            # El original ya cabe: reescalarlo solo lo recodificaría
+            ancho = None
+    except Exception as e:
+        logging.warning(f"No se pudo leer el tamaño de {ruta_original}: {e}")
+        return None
+    if formato is None and ancho is None:
+        return None
+    if formato == extension.lstrip(".") and ancho is None:
+        return None
+
+    try:
+        ruta = generar(ruta_original, ancho, formato)
+    except Exception as e:
+        logging.warning(f"No se pudo generar el derivado de {ruta_original}: {e}")
+        return None
+    tipo = FORMATOS[formato][0] if formato else FORMATOS_ORIGINALES[extension][0]
+    # Si la conversión no reduce el archivo se sirve el original
+    if ancho is None and os.path.getsize(ruta) >= os.path.getsize(ruta_original):
+        return None
+    return ruta, tipo
+
+
+def generar_todos(directorios=None):
+    """Genera todos los derivados (para ejecutar al construir la imagen)."""
+    directorios = directorios or [os.path.join(BASE_DIR, "imagenes"),
+                                  os.path.join(BASE_DIR, "static", "imagenes")]
+    total = 0
+    for directorio in directorios:
+        if not os.path.isdir(directorio):
+            continue
+        for nombre in sorted(os.listdir(directorio)):
+            if os.path.splitext(nombre)[1].lower() not in EXTENSIONES:
+                continue
+            ruta = os.path.join(directorio, nombre)
+            anchos = [a for a in ANCHOS if a < ancho_original(ruta)]
+            for formato in DISPONIBLES + [None]:
+                for ancho in [None] + anchos:
+                    if formato is None and ancho is None:
+                        continue  # el propio original
+                    generar(ruta, ancho, formato)
+                    total += 1
+    logging.info(f"🖼️ {total} derivados listos en {RUTA_CACHE}")
+    return total
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    generar_todos()
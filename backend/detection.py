@@ -1,14 +1,17 @@
 import cv2
 import math
-import torch
 import numpy as np
 import pandas as pd
 from PIL import Image
 # from deepface import DeepFace
-from transformers import SegformerImageProcessor, SegformerForSemanticSegmentation
 import mediapipe as mp
-import os
 import logging
+import modelos
+import preprocesado
+from preprocesado import decodificar_imagen
+import colores
+import segmentacion
+import orquestador
 
 try:
     from deepface import DeepFace
@@ -28,97 +31,151 @@ def to_serializable(val):
     return val
 
 
-def detectar_y_clasificar_tono_piel(img_path):
+def cargar_imagen(img_path):
+    """Decodifica la imagen una única vez (BGR, como cv2.imread)."""
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"No se pudo cargar la imagen: {img_path}")
+    return img
+
+
+def detectar_rostro(img_bgr):
+    """Ejecuta RetinaFace una sola vez sobre el fotograma completo.
+
+    Devuelve el rostro alineado tal como lo entrega DeepFace (RGB en [0, 1]),
+    el recorte sin alinear del fotograma y la confianza de la detección.
+    Lanza la misma excepción que DeepFace si no hay rostro.
+    """
+    face_obj = DeepFace.extract_faces(
+        img_path=img_bgr, enforce_detection=True, detector_backend="retinaface")[0]
+    area = face_obj['facial_area']
+    x, y = max(area['x'], 0), max(area['y'], 0)
+    recorte = img_bgr[y:y + area['h'], x:x + area['w']]
+    return {
+        "alineado": face_obj['face'],
+        "recorte": recorte,
+        "area": area,
+        "confianza": face_obj.get('confidence')
+    }
+
+
+def preparar_analisis(img_bgr):
+    """Agrupa los arreglos que comparten todos los analizadores de una imagen:
+    la pirámide de resoluciones (ver preprocesado.piramide) y el rostro."""
+    entrada = preprocesado.piramide(img_bgr)
+    entrada["rostro"] = detectar_rostro(img_bgr)
+    return entrada
+
+
+def analizar_edad_genero(face_img):
+    """Edad y género sobre el rostro ya detectado, sin volver a ejecutar RetinaFace."""
+    if face_img.dtype != np.uint8:
+        face_img = (face_img * 255).astype(np.uint8)
+    # DeepFace espera BGR (como cv2.imread); "skip" usa la imagen completa como rostro
+    face_bgr = cv2.cvtColor(face_img, cv2.COLOR_RGB2BGR)
+    return DeepFace.analyze(
+        img_path=face_bgr,
+        actions=['age', 'gender'],
+        enforce_detection=False,
+        detector_backend="skip",
+        silent=True
+    )[0]
+
+
+def analizar_edad_genero_lote(rostros):
+    """Edad y género de varios rostros alineados con una sola llamada a cada
+    modelo (un lote N x 224 x 224 x 3), con el mismo preprocesado que DeepFace.analyze.
+
+    Si la versión instalada de DeepFace no expone lo necesario, se analiza cada
+    rostro por separado.
+    """
+    if not rostros:
+        return []
     try:
-        face_obj = DeepFace.extract_faces(
-            img_path=img_path, enforce_detection=True, detector_backend="retinaface")[0]
-        face_img = face_obj['face']
-
-        if face_img.dtype != np.uint8:
-            face_img = (face_img * 255).astype(np.uint8)
-
-        face_rgb = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-        avg_color = np.mean(face_rgb.reshape(-1, 3), axis=0).astype(int)
-        r, g, b = avg_color
-        luminancia = 0.299 * r + 0.587 * g + 0.114 * b
-
-        if luminancia >= 150:
-            tono = "Muy claro"
-        elif luminancia >= 100:
-            tono = "Claro"
-        elif luminancia >= 80:
-            tono = "Medio"
-        elif luminancia >= 40:
-            tono = "Oscuro"
-        else:
-            tono = "Muy oscuro"
-
-        return avg_color, tono
+        from deepface.modules import preprocessing
+        from deepface.models.demography import Age, Gender
+
+        modelos_deepface = modelos.obtener_deepface()
+        # analyze recibe el rostro en RGB [0, 1] y lo pasa a BGR antes del modelo
+        lote = np.concatenate([
+            preprocessing.resize_image(img=rostro[:, :, ::-1], target_size=(224, 224))
+            for rostro in rostros])
+        edades = modelos_deepface["age"].model.predict(lote, verbose=0)
+        generos = modelos_deepface["gender"].model.predict(lote, verbose=0)
+    except Exception as e:
+        logging.warning(
+            f"Edad/género por lotes no disponible ({e}); se analiza cada rostro")
+        return [analizar_edad_genero(rostro) for rostro in rostros]
+
+    resultados = []
+    for edad, genero in zip(edades, generos):
+        porcentajes = {etiqueta: 100 * float(p)
+                       for etiqueta, p in zip(Gender.labels, genero)}
+        resultados.append({
+            "age": Age.find_apparent_age(edad),
+            "gender": porcentajes,
+            "dominant_gender": max(porcentajes, key=porcentajes.get)
+        })
+    return resultados
+
+
+def clasificar_tono_piel(face_img):
+    """Tono de piel del rostro alineado (RGB, como lo entrega DeepFace) y su
+    confianza (ver colores.py)."""
+    if face_img.dtype != np.uint8:
+        face_img = (face_img * 255).astype(np.uint8)
+    return colores.clasificar_piel(face_img)
+
+
+def detectar_y_clasificar_tono_piel(face_img):
+    try:
+        tono = clasificar_tono_piel(face_img)
+        return tono["color"], tono["nombre"]
     except Exception as e:
         print(f"Error en detección de tono de piel: {str(e)}")
         return None, "No detectado"
 
 
-def detectar_color_cabello_con_segmentacion(img_path, mostrar=True):
+def clasificar_color_cabello(img_array, hair_mask):
+    """Color de los píxeles de pelo (ver colores.py), su nombre, la fracción de
+    la imagen que ocupan (cuánto pelo se ve) y la probabilidad del color."""
+    cabello = colores.clasificar_cabello(img_array, hair_mask)
+    return cabello["color"], cabello["nombre"], float(hair_mask.mean()), cabello["confianza"]
+
+
+def detectar_color_cabello_lote(imgs_rgb):
+    """Segmenta varias imágenes en una sola pasada de Segformer (un tensor
+    N x 3 x 512 x 512) y devuelve (color, nombre, fracción, confianza) de cada una."""
+    if not imgs_rgb:
+        return []
     try:
-        image = Image.open(img_path).convert("RGB").resize((512, 512))
-        processor = SegformerImageProcessor.from_pretrained(
-            "jonathandinu/face-parsing")
-        model = SegformerForSemanticSegmentation.from_pretrained(
-            "jonathandinu/face-parsing")
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        model.to(device)
-
-        inputs = processor(images=image, return_tensors="pt").to(device)
-        with torch.no_grad():
-            outputs = model(**inputs)
-
-        logits = outputs.logits
-        upsampled_logits = torch.nn.functional.interpolate(
-            logits, size=image.size[::-1], mode="bilinear", align_corners=False
-        )
-        mask = upsampled_logits.argmax(dim=1)[0].cpu().numpy()
-
-        hair_mask = (mask == 13).astype(np.uint8)
-        img_array = np.array(image)
-        hair_pixels = img_array[hair_mask == 1]
-
-        if hair_pixels.size == 0:
-            avg_color = [0, 0, 0]
-            color_nombre = "Indefinido"
-        else:
-            avg_color = np.mean(hair_pixels, axis=0).astype(int).tolist()
-            r, g, b = avg_color
-
-            if r < 70 and g < 70 and b < 70:
-                color_nombre = "Negro"
-            elif r < 110 and g < 100 and b < 90:
-                color_nombre = "Castaño oscuro"
-            elif 100 <= r <= 150 and 90 <= g <= 140 and 80 <= b <= 160:
-                color_nombre = "Castaño claro"
-            elif r > 200 and g > 190 and b < 160:
-                color_nombre = "Rubio"
-            elif r > 130 and g < 110 and b < 100:
-                color_nombre = "Pelirrojo"
-            elif r > 170 and g > 170 and b > 170:
-                color_nombre = "Gris / Blanco"
-            else:
-                color_nombre = "Indefinido"
+        images = [Image.fromarray(img).resize((512, 512)) for img in imgs_rgb]
+        # Backend torch u ONNX según SEGMENTACION_BACKEND (ver segmentacion.py)
+        masks = modelos.obtener_segformer().mascaras(images)
 
-        return avg_color, color_nombre
+        return [clasificar_color_cabello(np.array(image),
+                                         (mask == segmentacion.CLASE_CABELLO).astype(np.uint8))
+                for image, mask in zip(images, masks)]
     except Exception as e:
         print(f"Error en detección de color de cabello: {str(e)}")
-        return [0, 0, 0], "Indefinido"
+        return [([0, 0, 0], "Indefinido", 0.0, 0.0) for _ in imgs_rgb]
+
+
+def detectar_color_cabello_con_segmentacion(img_rgb, mostrar=True):
+    avg_color, color_nombre, _, _ = detectar_color_cabello_lote([img_rgb])[0]
+    return avg_color, color_nombre
 
 
 def distancia(p1, p2):
     return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
 
+PUNTOS_COMPLEXION = [0, 1, 2, 11, 12, 23, 24, 25, 26]
+
+
 def estimar_complexion(landmarks):
     try:
-        required_indices = [0, 1, 2, 11, 12, 23, 24, 25, 26]
-        for i in required_indices:
+        for i in PUNTOS_COMPLEXION:
             if i >= len(landmarks) or landmarks[i] is None:
                 return "Silueta no detectada", None
 
@@ -153,17 +210,15 @@ def estimar_complexion(landmarks):
         return "No detectada", None
 
 
-def estimar_complexion_cuerpo(img_path, mostrar=True):
+def estimar_complexion_cuerpo(img_rgb, mostrar=True):
     try:
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"No se pudo cargar la imagen: {img_path}")
+        if img_rgb is None:
+            print("No se recibió la imagen para estimar la complexión")
             return None, "Imagen no cargada", None
 
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        h, w = img.shape[:2]
+        h, w = img_rgb.shape[:2]
 
-        with mp.solutions.pose.Pose(static_image_mode=True, model_complexity=1) as pose:
+        with modelos.obtener_pose().usar() as pose:
             res = pose.process(img_rgb)
 
         if not res.pose_landmarks:
@@ -186,7 +241,9 @@ def estimar_complexion_cuerpo(img_path, mostrar=True):
 
         datos_complexion = {
             "complexion": complexion,
-            "score": score
+            "score": score,
+            # Visibilidad media de los puntos usados: confianza de la estimación
+            "visibilidad": float(np.mean([lm[i].visibility for i in PUNTOS_COMPLEXION]))
         }
 
         if pts[11] is not None and pts[12] is not None:
@@ -207,19 +264,33 @@ def estimar_complexion_cuerpo(img_path, mostrar=True):
         return None, "Error en cálculo", None
 
 
-def analizar_rostro(img_path):
+def analizar_rostro(imagen):
     try:
         if DeepFace is None:
             logging.error("DeepFace no está instalado")
             return None
 
-        result = DeepFace.analyze(
-            img_path=img_path,
-            actions=['age', 'gender'],  # , 'race'],
-            enforce_detection=True,
-            detector_backend="retinaface",   # ✅ fuerza retinaface
-            silent=True
-        )[0]
+        # Asegura que los modelos de edad/género/retinaface estén en memoria
+        modelos.obtener_deepface()
+
+        # Se decodifica la imagen y se ejecuta RetinaFace una sola vez; cada
+        # analizador recibe los arreglos que necesita
+        img_bgr = decodificar_imagen(imagen)
+        entrada = preparar_analisis(img_bgr)
+
+        # Las cuatro etapas son independientes: se ejecutan a la vez (ver orquestador.py)
+        rostro = entrada["rostro"]["alineado"]
+        etapas = orquestador.ejecutar({
+            "edad_genero": (analizar_edad_genero, (rostro,), None),
+            "piel": (detectar_y_clasificar_tono_piel, (rostro,), (None, "No detectado")),
+            "cabello": (detectar_color_cabello_con_segmentacion, (entrada["segmentacion"],),
+                        ([0, 0, 0], "Indefinido"), modelos.obtener_segformer),
+            "complexion": (estimar_complexion_cuerpo, (entrada["pose"],),
+                           (None, "Error en cálculo", None), modelos.obtener_pose),
+        })
+        result = etapas["edad_genero"]
+        if result is None:
+            return None
 
         race_mapping = {
             'white': "Caucásico",
@@ -235,10 +306,9 @@ def analizar_rostro(img_path):
         #     result['dominant_race'], result['dominant_race'])
         raza = 'No Detectada'
 
-        color_rgb, tono_clasificado = detectar_y_clasificar_tono_piel(img_path)
-        color_cabello, cabello_nombre = detectar_color_cabello_con_segmentacion(
-            img_path)
-        body_info, complexion, score = estimar_complexion_cuerpo(img_path)
+        color_rgb, tono_clasificado = etapas["piel"]
+        color_cabello, cabello_nombre = etapas["cabello"]
+        body_info, complexion, score = etapas["complexion"]
 
         return pd.DataFrame([{
             'edad': result['age'],
@@ -258,17 +328,14 @@ def analizar_rostro(img_path):
 
 
 def detect_facial_features(image_data):
-    try:
-        temp_path = "/tmp/temp_image.jpg"  # ✅ usar /tmp
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
-
-        logging.info(f"Imagen guardada temporalmente en {temp_path}")
+    """Analiza una imagen recibida como bytes o como arreglo ya decodificado.
 
-        df = analizar_rostro(temp_path)
-
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    Todo el proceso ocurre en memoria: no se escribe ningún archivo temporal,
+    por lo que peticiones concurrentes no comparten estado en disco.
+    """
+    try:
+        img_bgr = decodificar_imagen(image_data)
+        df = analizar_rostro(img_bgr)
 
         if df is not None:
             pre_resultados = {
@@ -285,28 +352,158 @@ def detect_facial_features(image_data):
                           for k, v in pre_resultados.items()}
 
             return resultados
-
-            # return {
-            #     "Silueta": df['complexion'].iloc[0],
-            #     "Color de Piel": df['tono_piel'].iloc[0],
-            #     "Género": df['genero'].iloc[0],
-            #     "Edad": df['edad'].iloc[0],
-            #     "Color de Cabello": df['color_cabello'].iloc[0],
-            #     "Rostro Detectado": True
-            # }
         else:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                logging.info(f"Imagen temporal eliminada: {temp_path}")
             return {"Rostro Detectado": False}
 
     except Exception as e:
         logging.error(f"❌ Error en detect_facial_features: {e}", exc_info=True)
-        if os.path.exists("/tmp/temp_image.jpg"):
-            os.remove("/tmp/temp_image.jpg")
         return {"Rostro Detectado": False}
 
 
+# Valores que no cuentan como observación al calcular el consenso
+NO_DETECTADOS = {"Indefinido", "No detectado", "No detectada", "Silueta no detectada",
+                 "Cuerpo no detectado", "Imagen no cargada", "Error en cálculo"}
+
+
+def analizar_lote(imagenes):
+    """Analiza varias fotos de la misma persona.
+
+    RetinaFace y MediaPipe Pose procesan una imagen cada vez, pero Segformer y
+    los modelos de edad/género reciben todas las imágenes en un único tensor.
+    Devuelve una lista con, para cada imagen, None si no se detectó rostro o
+    los resultados con la confianza de cada característica.
+    """
+    if DeepFace is None:
+        logging.error("DeepFace no está instalado")
+        return [None] * len(imagenes)
+    modelos.obtener_deepface()
+
+    entradas = []
+    for imagen in imagenes:
+        try:
+            entradas.append(preparar_analisis(decodificar_imagen(imagen)))
+        except Exception as e:
+            if "Face could not be detected" in str(e):
+                logging.warning("⚠️ Rostro no detectado en una imagen del lote")
+            else:
+                logging.error(f"❌ Error preparando una imagen del lote: {e}", exc_info=True)
+            entradas.append(None)
+
+    validas = [entrada for entrada in entradas if entrada is not None]
+    rostros = [entrada["rostro"]["alineado"] for entrada in validas]
+    etapas = orquestador.ejecutar({
+        "edad_genero": (analizar_edad_genero_lote, (rostros,), None),
+        "cabello": (detectar_color_cabello_lote, ([entrada["segmentacion"] for entrada in validas],),
+                    [([0, 0, 0], "Indefinido", 0.0, 0.0)] * len(validas), modelos.obtener_segformer),
+        # Sin tono de piel el resto del lote sigue valiendo: "No detectado" no
+        # cuenta en el consenso
+        "piel": (lambda: [clasificar_tono_piel(rostro) for rostro in rostros], (),
+                 [{"nombre": "No detectado", "confianza": 0.0}] * len(validas)),
+        "complexion": (lambda: [estimar_complexion_cuerpo(entrada["pose"]) for entrada in validas],
+                       (), [(None, "Error en cálculo", None)] * len(validas), modelos.obtener_pose),
+    })
+    if etapas["edad_genero"] is None:
+        return [None] * len(entradas)
+    edades_generos = iter(etapas["edad_genero"])
+    cabellos = iter(etapas["cabello"])
+    tonos = iter(etapas["piel"])
+    complexiones = iter(etapas["complexion"])
+
+    resultados = []
+    for entrada in entradas:
+        if entrada is None:
+            resultados.append(None)
+            continue
+        edad_genero = next(edades_generos)
+        _, cabello_nombre, fraccion_pelo, confianza_cabello = next(cabellos)
+        tono = next(tonos)
+        body_info, complexion, _ = next(complexiones)
+
+        confianza_rostro = float(entrada["rostro"]["confianza"] or 0.5)
+        genero = edad_genero["dominant_gender"]
+        resultados.append({
+            "valores": {
+                "Silueta": complexion,
+                "Color de Piel": tono["nombre"],
+                "Género": 'Mujer' if genero == 'Woman' else 'Hombre',
+                "Edad": to_serializable(edad_genero["age"]),
+                "Color de Cabello": cabello_nombre,
+            },
+            "confianza": {
+                "Silueta": body_info["visibilidad"] if body_info else 0.0,
+                "Color de Piel": confianza_rostro * tono["confianza"],
+                "Género": confianza_rostro * edad_genero["gender"][genero] / 100,
+                "Edad": confianza_rostro,
+                # Con menos de un 5 % de la imagen el color del pelo es poco fiable
+                "Color de Cabello": (confianza_rostro * confianza_cabello
+                                     * min(1.0, fraccion_pelo / 0.05)),
+            }
+        })
+    return resultados
+
+
+def consenso(analisis):
+    """Combina los análisis de un lote ponderando cada valor por su confianza.
+
+    Las características categóricas se eligen por voto ponderado y la edad es la
+    media ponderada. Devuelve (valores, confianza) donde la confianza de cada
+    característica es la fracción del peso total que respalda el valor elegido.
+    """
+    valores = {}
+    confianza = {}
+    validos = [a for a in analisis if a is not None]
+    for caracteristica in ("Silueta", "Color de Piel", "Género", "Edad", "Color de Cabello"):
+        observaciones = [(a["valores"][caracteristica], a["confianza"][caracteristica])
+                         for a in validos
+                         if a["valores"][caracteristica] not in NO_DETECTADOS
+                         and a["confianza"][caracteristica] > 0]
+        if not observaciones:
+            continue
+        total = sum(peso for _, peso in observaciones)
+        if caracteristica == "Edad":
+            valores[caracteristica] = round(sum(v * p for v, p in observaciones) / total)
+            confianza[caracteristica] = round(total / len(observaciones), 3)
+            continue
+        votos = {}
+        for valor, peso in observaciones:
+            votos[valor] = votos.get(valor, 0.0) + peso
+        elegido = max(votos, key=votos.get)
+        valores[caracteristica] = elegido
+        confianza[caracteristica] = round(votos[elegido] / total, 3)
+    return valores, confianza
+
+
+def detect_facial_features_lote(imagenes):
+    """Versión por lotes de detect_facial_features.
+
+    Devuelve {"imagenes": [...], "consenso": {...}, "confianza": {...}}: los
+    resultados de cada imagen (con el mismo formato que detect_facial_features)
+    y las características combinadas de todas ellas.
+    """
+    try:
+        analisis = analizar_lote(imagenes)
+    except Exception as e:
+        logging.error(f"❌ Error en detect_facial_features_lote: {e}", exc_info=True)
+        analisis = [None] * len(imagenes)
+
+    por_imagen = []
+    for resultado in analisis:
+        if resultado is None:
+            por_imagen.append({"Rostro Detectado": False})
+        else:
+            por_imagen.append(dict(resultado["valores"], **{
+                "Rostro Detectado": True,
+                "Confianza": {k: round(v, 3) for k, v in resultado["confianza"].items()}
+            }))
+
+    valores, confianza = consenso(analisis)
+    if valores:
+        valores["Rostro Detectado"] = True
+    else:
+        valores = {"Rostro Detectado": False}
+    return {"imagenes": por_imagen, "consenso": valores, "confianza": confianza}
+
+
 # if __name__ == "__main__":
 #     with open(r"C:\Users\Joaquin\Desktop\pruebas\prueba22.jpg", "rb") as f:
 #         image_bytes = f.read()
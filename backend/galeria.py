@@ -0,0 +1,290 @@
+import os
+import re
+import sys
+import ntpath
+import hashlib
+import logging
+import mimetypes
+from collections import OrderedDict
+from functools import lru_cache
+
+from PIL import Image
+
+from catalogo import clave_diseno
+from derivados import ANCHOS
+
+# Resolución de las etiquetas [MOSTRAR_IMAGEN: ...] a imágenes reales.
+#
+# Al arrancar se indexan los archivos de imagenes/ (y static/imagenes/) con su
+# tamaño; cada diseño se resuelve a su imagen principal y sus variantes
+# (SOPHIE -> SOPHIE.jpg + SOPHIE_2.jpg, SOPHIE_3.jpg). Así la respuesta lleva
+# las URLs exactas y el navegador no tiene que adivinar nombres de archivo.
+#
+# El mismo índice es el manifiesto de /imagenes: cada archivo se resuelve a su
+# ruta y al hash de su contenido una sola vez. Las URLs de los descriptores
+# llevan el hash (SOPHIE.3fa2c1d0e9b8.jpg) y se sirven como inmutables; el hash
+# es también el ETag para las peticiones condicionales.
+#
+# La imagen principal de cada diseño es la de la columna IMAGEN del catálogo;
+# sin ella, el archivo con el nombre del diseño o su primera variante.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIOS = [os.path.join(BASE_DIR, "imagenes"),
+               os.path.join(BASE_DIR, "static", "imagenes")]
+EXTENSIONES = (".jpg", ".jpeg", ".png", ".webp")
+# Diseños resueltos que se recuerdan: los nombres llegan de la IA, que puede
+# pedir cualquiera
+MAX_RESUELTOS = 256
+
+ETIQUETA = "[MOSTRAR_IMAGEN:"
+PATRON_ETIQUETA = re.compile(r"\[MOSTRAR_IMAGEN:\s*([^\]]+)\]", re.IGNORECASE)
+# Una etiqueta sin cerrar más larga que esto se trata como texto normal
+MAX_ETIQUETA = 200
+# nombre.<hash>.ext
+PATRON_VERSIONADO = re.compile(r"^(?P<base>.+)\.(?P<hash>[0-9a-f]{12})(?P<ext>\.[A-Za-z0-9]+)$")
+
+
+@lru_cache(maxsize=1024)
+def _hash(ruta, mtime_ns, tamano):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 16), b""):
+            sha.update(bloque)
+    return sha.hexdigest()[:12]
+
+
+def hash_contenido(ruta):
+    """Hash corto del contenido; se recalcula solo si cambian fecha o tamaño."""
+    estado = os.stat(ruta)
+    return _hash(ruta, estado.st_mtime_ns, estado.st_size)
+
+
+def nombres_etiqueta(grupo):
+    return [d.strip() for d in grupo.split(",") if d.strip()]
+
+
+def extraer_disenos(texto):
+    """Nombres de diseño de todas las etiquetas [MOSTRAR_IMAGEN: ...] del texto."""
+    disenos = []
+    for grupo in PATRON_ETIQUETA.findall(texto or ""):
+        disenos.extend(nombres_etiqueta(grupo))
+    return disenos
+
+
+def separar_cola(texto):
+    """(texto, cola): `cola` es la etiqueta sin cerrar con la que termina el
+    texto (una respuesta cortada), o "" si no la hay."""
+    inicio = texto.rfind("[")
+    if inicio != -1 and FiltroEtiquetas._puede_ser_etiqueta(texto[inicio:]):
+        return texto[:inicio], texto[inicio:]
+    return texto, ""
+
+
+def disenos_cola(cola):
+    """Diseños de una etiqueta sin cerrar si ya está completo su inicio
+    ("[MOSTRAR_IMAGEN: SOPHIE"); un inicio a medias ("[MOST") no tiene."""
+    if not cola.upper().startswith(ETIQUETA):
+        return []
+    return nombres_etiqueta(cola[len(ETIQUETA):])
+
+
+def extraer_disenos(texto):
+    """Nombres de diseño de todas las etiquetas [MOSTRAR_IMAGEN: ...] del texto,
+    incluida una sin cerrar al final."""
+    disenos = []
+    for grupo in PATRON_ETIQUETA.findall(texto or ""):
+        disenos.extend(nombres_etiqueta(grupo))
+    return disenos + disenos_cola(separar_cola(texto or "")[1])
+
+
+def quitar_etiquetas(texto):
+    return separar_cola(PATRON_ETIQUETA.sub("", texto or ""))[0].strip()
+
+
+class FiltroEtiquetas:
+    """Separa las etiquetas de un texto que llega por fragmentos (streaming).
+
+    `alimentar` devuelve el texto que ya se puede mostrar y los diseños de las
+    etiquetas completadas en ese fragmento. Un posible inicio de etiqueta
+    ("[MOS", "[MOSTRAR_IMAGEN: SOPH") se retiene hasta que se cierra o deja de
+    poder serlo, de modo que el usuario nunca ve una etiqueta a medias.
+    """
+
+    def __init__(self):
+        self.pendiente = ""
+
+    @staticmethod
+    def _puede_ser_etiqueta(texto):
+        mayusculas = texto.upper()
+        if len(mayusculas) < len(ETIQUETA):
+            return ETIQUETA.startswith(mayusculas)
+        return (mayusculas.startswith(ETIQUETA) and "]" not in texto
+                and len(texto) <= MAX_ETIQUETA)
+
+    def alimentar(self, fragmento):
+        texto = self.pendiente + fragmento
+        visible = []
+        disenos = []
+        while texto:
+            inicio = texto.find("[")
+            if inicio == -1:
+                visible.append(texto)
+                texto = ""
+                break
+            visible.append(texto[:inicio])
+            texto = texto[inicio:]
+
+            etiqueta = PATRON_ETIQUETA.match(texto)
+            if etiqueta:
+                disenos.extend(nombres_etiqueta(etiqueta.group(1)))
+                texto = texto[etiqueta.end():]
+            elif self._puede_ser_etiqueta(texto):
+                break
+            else:
+                visible.append(texto[0])
+                texto = texto[1:]
+        self.pendiente = texto
+        return "".join(visible), disenos
+
+    def cerrar(self):
+        """Diseños de la etiqueta retenida al terminar el stream, que nunca se
+        cerró. Su texto no se muestra nunca (ver disenos_cola)."""
+        cola, self.pendiente = self.pendiente, ""
+        return disenos_cola(cola)
+
+
+class Galeria:
+    def __init__(self, catalogo=None, directorios=DIRECTORIOS):
+        # Nombre de archivo -> {"ruta", "hash", "tipo"}; se sirve desde el
+        # primer directorio que exista, como hacía la ruta /imagenes
+        self.manifiesto = {}
+        # Nombre de archivo sin extensión (en mayúsculas) -> descriptor
+        self.archivos = {}
+        directorio = next((d for d in directorios if os.path.isdir(d)), None)
+        for nombre in sorted(os.listdir(directorio)) if directorio else []:
+            ruta = os.path.join(directorio, nombre)
+            if not os.path.isfile(ruta):
+                continue
+            self.manifiesto[nombre] = {
+                "ruta": ruta,
+                "hash": hash_contenido(ruta),
+                "tipo": mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+            }
+            base, extension = os.path.splitext(nombre)
+            if extension.lower() in EXTENSIONES:
+                self.archivos.setdefault(
+                    clave_diseno(base), self._describir(nombre, self.manifiesto[nombre]))
+
+        # Imagen indicada en la columna IMAGEN del catálogo, si la hay. Son
+        # rutas de Windows (C:\Users\...\disenos\LIRIA_WHITE.jpg): ntpath
+        # separa tanto "\" como "/". Solo se usa si ese archivo está en la galería.
+        self.principales = {}
+        for vestido in (catalogo.vestidos if catalogo else []):
+            base = imagen_catalogo(vestido)
+            if base in self.archivos:
+                self.principales[clave_diseno(vestido["diseno"])] = base
+        self._resueltos = OrderedDict()
+
+    @staticmethod
+    def url_versionada(nombre, archivo):
+        base, extension = os.path.splitext(nombre)
+        return f"/imagenes/{base}.{archivo['hash']}{extension}"
+
+    def _describir(self, nombre, archivo):
+        descriptor = {"url": self.url_versionada(nombre, archivo), "archivo": nombre,
+                      "bytes": os.path.getsize(archivo["ruta"]), "ancho": None,
+                      "alto": None, "anchos": []}
+        try:
+            # Image.open solo lee la cabecera, no decodifica la imagen
+            with Image.open(archivo["ruta"]) as imagen:
+                descriptor["ancho"], descriptor["alto"] = imagen.size
+            # Anchos con derivado (/imagenes/...?w=ancho), para srcset
+            descriptor["anchos"] = [a for a in sorted(ANCHOS) if a < descriptor["ancho"]]
+        except Exception as e:
+            logging.warning(f"No se pudo leer el tamaño de {nombre}: {e}")
+        return descriptor
+
+    def buscar(self, nombre):
+        """(archivo del manifiesto, versionada) para un nombre pedido en
+        /imagenes. `versionada` es True si el nombre lleva el hash vigente, es
+        decir, si el contenido de esa URL no cambiará nunca."""
+        if nombre in self.manifiesto:
+            return self.manifiesto[nombre], False
+        versionado = PATRON_VERSIONADO.match(nombre)
+        if versionado:
+            archivo = self.manifiesto.get(versionado["base"] + versionado["ext"])
+            if archivo:
+                return archivo, archivo["hash"] == versionado["hash"]
+        return None, False
+
+    def resolver(self, diseno):
+        """Descriptor de la imagen de un diseño con sus variantes, o None."""
+        clave = clave_diseno(diseno)
+        if clave not in self._resueltos:
+            propias = [c for c in self.archivos
+                       if c == clave or c.startswith(f"{clave}_")]
+            principal = self.principales.get(clave)
+            if principal not in propias:
+                principal = clave if clave in propias else (
+                    propias[0] if propias else None)
+
+            descriptor = None
+            if principal is not None:
+                descriptor = dict(
+                    self.archivos[principal], diseno=clave,
+                    variantes=[self.archivos[c] for c in propias if c != principal])
+            self._resueltos[clave] = descriptor
+            if len(self._resueltos) > MAX_RESUELTOS:
+                self._resueltos.popitem(last=False)
+            return descriptor
+        return self._resueltos[clave]
+
+    def resolver_todos(self, disenos):
+        """Descriptores de una lista de diseños, sin repetidos ni desconocidos."""
+        imagenes = []
+        vistos = set()
+        for diseno in disenos:
+            descriptor = self.resolver(diseno)
+            if descriptor is None:
+                logging.warning(f"Diseño sin imagen: {diseno}")
+            elif descriptor["diseno"] not in vistos:
+                vistos.add(descriptor["diseno"])
+                imagenes.append(descriptor)
+        return imagenes
+
+
+def imagen_catalogo(vestido):
+    """Nombre (sin extensión, en mayúsculas) de la columna IMAGEN, o None."""
+    if not vestido.get("imagen"):
+        return None
+    return clave_diseno(os.path.splitext(ntpath.basename(vestido["imagen"]))[0])
+
+
+def comprobar(galeria, catalogo):
+    """Errores de resolución de la galería con el catálogo real: cada diseño
+    debe resolver a alguna imagen y, si tiene columna IMAGEN, a ese archivo."""
+    errores = []
+    for vestido in catalogo.vestidos:
+        descriptor = galeria.resolver(vestido["diseno"])
+        esperado = imagen_catalogo(vestido)
+        obtenido = descriptor and clave_diseno(os.path.splitext(descriptor["archivo"])[0])
+        if descriptor is None:
+            errores.append(f"{vestido['diseno']}: sin imagen en la galería")
+        elif esperado and obtenido != esperado:
+            errores.append(f"{vestido['diseno']}: la columna IMAGEN indica {esperado} "
+                           f"y se resuelve a {obtenido}")
+    return errores
+
+
+if __name__ == "__main__":
+    # Comprobación con base_vestidos.xlsx (se ejecuta al construir la imagen)
+    import catalogo as modulo_catalogo
+
+    logging.basicConfig(level=logging.INFO)
+    catalogo_real = modulo_catalogo.cargar_catalogo()
+    errores = comprobar(Galeria(catalogo_real), catalogo_real)
+    for error in errores:
+        logging.error(f"❌ {error}")
+    if not errores:
+        logging.info(f"✅ {len(catalogo_real)} diseños resueltos en la galería")
+    sys.exit(1 if errores else 0)
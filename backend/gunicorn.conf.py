@@ -0,0 +1,12 @@
+# Configuración de gunicorn que se lee automáticamente desde el directorio de trabajo.
+# Los parámetros de línea de comandos (workers, timeout, bind) tienen prioridad.
+import modelos
+
+
+def post_worker_init(worker):
+    # Con PRECARGAR_MODELOS=1 cada worker carga los modelos al arrancar, en un hilo
+    # aparte para que el heartbeat de gunicorn no lo mate durante la carga.
+    # /health informa cuándo están listos.
+    if modelos.precarga_activada():
+        worker.log.info("Precargando modelos de visión en segundo plano")
+        modelos.precargar_en_segundo_plano()
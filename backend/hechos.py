@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field, asdict
+
+# Datos conocidos de la sesión en un registro con campos fijos, en lugar de
+# buscarlos por texto en el historial. Se actualizan en O(1) y el mensaje de
+# sistema que los describe solo se vuelve a generar cuando cambian.
+#
+# `resumen` guarda lo que dijo el usuario en los turnos que ya no caben en el
+# contexto (ver contexto.compactar), para lo que no encaja en ningún campo.
+
+PREFIJO_CARACTERISTICAS = "Características físicas detectadas del usuario"
+
+
+@dataclass
+class HechosSesion:
+    caracteristicas: dict = field(default_factory=dict)
+    nombre: str = None
+    evento: str = None
+    estilo: list = field(default_factory=list)
+    colores: list = field(default_factory=list)
+    resumen: str = None
+    # Se incrementa con cada cambio; el texto generado se guarda junto a la
+    # versión con la que se generó
+    version: int = 0
+    texto: str = None
+    version_texto: int = -1
+
+    @classmethod
+    def desde_sesion(cls, sesion):
+        return cls(**(sesion.get("hechos") or {}))
+
+    def guardar_en(self, sesion):
+        sesion["hechos"] = asdict(self)
+        return sesion
+
+    def actualizar(self, **campos):
+        """Asigna los campos indicados; devuelve True si algo cambió."""
+        cambio = False
+        for nombre, valor in campos.items():
+            if valor is None or getattr(self, nombre) == valor:
+                continue
+            setattr(self, nombre, valor)
+            cambio = True
+        if cambio:
+            self.version += 1
+        return cambio
+
+    def agregar(self, nombre, valores):
+        """Añade valores nuevos a un campo de lista (estilo, colores)."""
+        lista = getattr(self, nombre)
+        nuevos = [v for v in valores if v not in lista]
+        if nuevos:
+            lista.extend(nuevos)
+            self.version += 1
+        return bool(nuevos)
+
+    def mensaje(self):
+        """Mensaje de sistema con los datos conocidos, o None si no hay ninguno."""
+        if self.version_texto != self.version:
+            self.texto = self._renderizar()
+            self.version_texto = self.version
+        if not self.texto:
+            return None
+        return {"role": "system", "content": self.texto}
+
+    def _renderizar(self):
+        lineas = []
+        if self.caracteristicas:
+            descripcion = ", ".join(
+                [f"{k}: {v}" for k, v in self.caracteristicas.items()])
+            lineas.append(f"{PREFIJO_CARACTERISTICAS}: {descripcion}")
+
+        partes = []
+        if self.nombre:
+            partes.append(f"Nombre: {self.nombre}")
+        if self.evento:
+            partes.append(f"Evento: {self.evento}")
+        if self.estilo:
+            partes.append(f"Estilo preferido: {', '.join(self.estilo)}")
+        if self.colores:
+            partes.append(f"Colores preferidos: {', '.join(self.colores)}")
+        if partes:
+            lineas.append(
+                "Datos ya conocidos del usuario (no vuelvas a pedirlos): " + "; ".join(partes))
+        if self.resumen:
+            lineas.append(f"Lo que dijo el usuario en mensajes anteriores:\n{self.resumen}")
+        return "\n".join(lineas) or None
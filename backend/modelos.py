@@ -0,0 +1,175 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import orquestador
+
+# Registro de modelos por proceso: cada worker de gunicorn carga una sola vez
+# Segformer (face-parsing), los modelos de DeepFace y el grafo de MediaPipe Pose,
+# y los reutiliza en todas las peticiones siguientes.
+
+DEEPFACE_DETECTOR = "retinaface"
+# MediaPipe Pose: 0 (lite), 1 (full) o 2 (heavy); e instancias del grafo por proceso
+POSE_COMPLEJIDAD = int(os.environ.get("POSE_COMPLEJIDAD", 1))
+# (por defecto, una por hilo del pool de análisis)
+POSE_INSTANCIAS = int(os.environ.get(
+    "POSE_INSTANCIAS", os.environ.get("ANALISIS_WORKERS", 1)))
+
+_lock = threading.Lock()
+_modelos = {}
+_tiempos_carga = {}
+
+
+def _cargar_segformer():
+    import segmentacion
+
+    # torch, onnx u onnx-int8 según SEGMENTACION_BACKEND
+    return segmentacion.cargar()
+
+
+def _cargar_deepface():
+    from deepface import DeepFace
+
+    # DeepFace guarda internamente los modelos construidos, así que basta con
+    # construirlos una vez para que analyze/extract_faces los reutilicen
+    return {
+        "age": DeepFace.build_model("Age", task="facial_attribute"),
+        "gender": DeepFace.build_model("Gender", task="facial_attribute"),
+        "detector": DeepFace.build_model(DEEPFACE_DETECTOR, task="face_detector"),
+    }
+
+
+class PoolPose:
+    """Grafos de MediaPipe Pose reutilizables entre peticiones.
+
+    Un grafo no admite llamadas concurrentes a process(), así que cada hilo
+    toma uno libre con `usar()`; se crean bajo demanda hasta `maximo` y, si
+    están todos ocupados, se espera a que se libere uno. Con
+    static_image_mode=True un grafo no arrastra estado entre imágenes.
+    """
+
+    def __init__(self, complejidad=POSE_COMPLEJIDAD, maximo=POSE_INSTANCIAS):
+        self.complejidad = complejidad
+        self.maximo = max(1, maximo)
+        self._condicion = threading.Condition()
+        self._libres = []
+        self._creados = 0
+        # El primero se crea ya, para que la precarga deje el modelo listo
+        self._libres.append(self._crear())
+
+    def _crear(self):
+        import mediapipe as mp
+
+        self._creados += 1
+        return mp.solutions.pose.Pose(static_image_mode=True,
+                                      model_complexity=self.complejidad)
+
+    @contextmanager
+    def usar(self):
+        with self._condicion:
+            while not self._libres and self._creados >= self.maximo:
+                self._condicion.wait()
+            pose = self._libres.pop() if self._libres else self._crear()
+        try:
+            yield pose
+        finally:
+            with self._condicion:
+                self._libres.append(pose)
+                self._condicion.notify()
+
+    def estadisticas(self):
+        with self._condicion:
+            return {"complejidad": self.complejidad, "instancias": self._creados,
+                    "libres": len(self._libres), "maximo": self.maximo}
+
+
+def _cargar_pose():
+    return PoolPose()
+
+
+_CARGADORES = {
+    "segformer": _cargar_segformer,
+    "deepface": _cargar_deepface,
+    "pose": _cargar_pose,
+}
+
+
+def obtener(nombre):
+    """Devuelve el modelo `nombre`, cargándolo la primera vez que se pide."""
+    modelo = _modelos.get(nombre)
+    if modelo is not None:
+        return modelo
+
+    with _lock:
+        modelo = _modelos.get(nombre)
+        if modelo is None:
+            # El reparto de hilos debe estar hecho antes de que arranque TensorFlow
+            orquestador.configurar_hilos()
+            inicio = time.perf_counter()
+            modelo = _CARGADORES[nombre]()
+            _tiempos_carga[nombre] = round(time.perf_counter() - inicio, 3)
+            _modelos[nombre] = modelo
+            logging.info(
+                f"🧠 Modelo '{nombre}' cargado en {_tiempos_carga[nombre]}s (pid {os.getpid()})")
+    return modelo
+
+
+def obtener_segformer():
+    return obtener("segformer")
+
+
+def obtener_deepface():
+    return obtener("deepface")
+
+
+def obtener_pose():
+    return obtener("pose")
+
+
+def precargar_modelos(nombres=None):
+    """Carga por adelantado los modelos indicados (todos por defecto).
+
+    Un fallo en un modelo se registra pero no impide cargar los demás.
+    """
+    for nombre in nombres or _CARGADORES:
+        try:
+            obtener(nombre)
+        except Exception as e:
+            logging.error(
+                f"❌ No se pudo precargar el modelo '{nombre}': {e}", exc_info=True)
+
+
+def modelos_listos():
+    return all(nombre in _modelos for nombre in _CARGADORES)
+
+
+def estado_modelos():
+    estado = {
+        nombre: {
+            "cargado": nombre in _modelos,
+            "segundos_carga": _tiempos_carga.get(nombre)
+        }
+        for nombre in _CARGADORES
+    }
+    if "segformer" in _modelos:
+        estado["segformer"]["backend"] = _modelos["segformer"].backend
+    if "pose" in _modelos:
+        estado["pose"].update(_modelos["pose"].estadisticas())
+    return estado
+
+
+def precarga_activada():
+    # Con VISION_SOCKET los modelos viven en el pool de procesos_vision.py
+    if os.environ.get("VISION_SOCKET"):
+        return False
+    return os.environ.get("PRECARGAR_MODELOS", "0").lower() in ("1", "true", "si", "sí")
+
+
+def precargar_en_segundo_plano(nombres=None):
+    """Lanza la precarga en un hilo para no retrasar el arranque del worker."""
+    hilo = threading.Thread(target=precargar_modelos, args=(nombres,),
+                            name="precarga-modelos", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TiempoAgotado
+
+# Ejecución concurrente de las etapas independientes de un análisis.
+#
+# Edad/género (TensorFlow), color de pelo (Segformer), complexión (MediaPipe)
+# y tono de piel (numpy) no dependen unas de otras y sus núcleos nativos
+# sueltan el GIL, así que se lanzan a la vez en un pool de hilos acotado y el
+# análisis tarda lo que la etapa más lenta. Cada etapa tiene su tiempo máximo,
+# contado desde que empieza a ejecutarse (no mientras espera un hilo libre ni
+# mientras carga su modelo): si lo supera o falla se usa su valor por defecto y
+# el resto del análisis sigue adelante (un hilo ya en marcha no se puede
+# interrumpir; termina en segundo plano).
+#
+# Para que las etapas no se pisen los núcleos, configurar_hilos() reparte los
+# hilos de cómputo del proceso entre TensorFlow y torch / ONNX Runtime, y deja
+# OpenCV en un hilo. Se aplica antes de cargar el primer modelo (ver modelos.py).
+
+ANALISIS_WORKERS = int(os.environ.get("ANALISIS_WORKERS", 1))
+# Hilos del pool de etapas (compartido por los análisis simultáneos del proceso);
+# con 1 las etapas se ejecutan una tras otra en el hilo del análisis
+HILOS_ETAPAS = int(os.environ.get("ANALISIS_ETAPAS_HILOS", 4 * ANALISIS_WORKERS))
+# Tiempo máximo por etapa (ANALISIS_TIMEOUT_<ETAPA> en segundos)
+TIMEOUTS = {
+    etapa: float(os.environ.get(f"ANALISIS_TIMEOUT_{etapa.upper()}", segundos))
+    for etapa, segundos in {"edad_genero": 60, "cabello": 60,
+                            "complexion": 30, "piel": 10}.items()
+}
+TIMEOUT_POR_DEFECTO = 60
+# Espera máxima a que una etapa empiece: hilo libre en el pool y carga de su modelo
+ESPERA_INICIO = float(os.environ.get("ANALISIS_ESPERA_INICIO", 300))
+
+
+def nucleos_disponibles():
+    """Núcleos que puede usar el contenedor: la cuota de CPU del cgroup si la
+    hay y, si no, los núcleos asignados al proceso."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            cuota, periodo = f.read().split()
+        if cuota != "max":
+            return max(1, int(int(cuota) / int(periodo)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Hilos de cómputo de un análisis (los análisis simultáneos se reparten los núcleos)
+HILOS_ANALISIS = int(os.environ.get(
+    "ANALISIS_HILOS", max(1, nucleos_disponibles() // max(1, ANALISIS_WORKERS))))
+
+_executor = None
+_lock = threading.Lock()
+_presupuesto = None
+_metricas = {}
+
+
+def configurar_hilos(total=None):
+    """Reparte `total` hilos de cómputo (HILOS_ANALISIS por defecto) entre las
+    librerías de las etapas que corren a la vez.
+
+    TensorFlow lee TF_NUM_*_THREADS al crear su contexto, así que debe llamarse
+    antes de cargar DeepFace; torch y ONNX Runtime se ajustan en cualquier
+    momento (la sesión ONNX lee el valor al crearse). Sin `total`, no repite el
+    reparto ya hecho en este proceso.
+    """
+    global _presupuesto
+    if total is None:
+        if _presupuesto is not None and _presupuesto["pid"] == os.getpid():
+            return _presupuesto
+        total = HILOS_ANALISIS
+
+    # Mitad para edad/género (TensorFlow) y el resto para Segformer; MediaPipe
+    # gestiona sus propios hilos y OpenCV solo hace operaciones pequeñas
+    hilos_tf = max(1, total // 2)
+    hilos_segmentacion = max(1, total - hilos_tf)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(hilos_tf)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(hilos_segmentacion)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(hilos_segmentacion)
+    if "cv2" in sys.modules:
+        sys.modules["cv2"].setNumThreads(1)
+    if not os.environ.get("SEGMENTACION_HILOS"):
+        import segmentacion
+        segmentacion.HILOS_ONNX = hilos_segmentacion
+
+    _presupuesto = {"pid": os.getpid(), "total": total, "tensorflow": hilos_tf,
+                    "segmentacion": hilos_segmentacion, "opencv": 1}
+    logging.info(f"🧵 Hilos de análisis: {_presupuesto}")
+    return _presupuesto
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=HILOS_ETAPAS, thread_name_prefix="etapa")
+    return _executor
+
+
+def _registrar(etapa, segundos=None):
+    """Suma una ejecución de `etapa` o, sin `segundos`, una espera agotada."""
+    with _lock:
+        metrica = _metricas.setdefault(etapa, {"ejecuciones": 0, "segundos": 0.0, "agotadas": 0})
+        if segundos is None:
+            metrica["agotadas"] += 1
+        else:
+            metrica["ejecuciones"] += 1
+            metrica["segundos"] += segundos
+
+
+def _medida(etapa, funcion, preparar=None, marca=None):
+    """`funcion` cronometrada. `preparar` (la carga del modelo) se ejecuta
+    antes y no cuenta; `marca` recibe el instante en que empieza la etapa."""
+    def ejecutar(*args):
+        try:
+            if preparar is not None:
+                preparar()
+        finally:
+            if marca is not None:
+                marca["inicio"] = time.monotonic()
+                marca["evento"].set()
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            _registrar(etapa, time.perf_counter() - inicio)
+    return ejecutar
+
+
+def ejecutar(etapas):
+    """Ejecuta las etapas {nombre: (funcion, args, por_defecto[, preparar])} a la vez.
+
+    `preparar` es una función opcional sin argumentos (p. ej. la carga del
+    modelo de la etapa) que se ejecuta en el hilo de la etapa antes de
+    `funcion`, sin contar para su tiempo máximo. Devuelve {nombre: resultado};
+    una etapa que lanza una excepción o supera su TIMEOUTS[nombre] devuelve su
+    `por_defecto`.
+    """
+    if HILOS_ETAPAS <= 1:
+        resultados = {}
+        for nombre, (funcion, args, por_defecto, *preparar) in etapas.items():
+            try:
+                resultados[nombre] = _medida(nombre, funcion, *preparar)(*args)
+            except Exception as e:
+                logging.error(f"❌ Error en la etapa '{nombre}': {e}", exc_info=True)
+                resultados[nombre] = por_defecto
+        return resultados
+
+    marcas, futuros = {}, {}
+    for nombre, (funcion, args, _, *preparar) in etapas.items():
+        marcas[nombre] = {"evento": threading.Event(), "inicio": None}
+        futuros[nombre] = _pool().submit(
+            _medida(nombre, funcion, preparar[0] if preparar else None, marcas[nombre]), *args)
+
+    resultados = {}
+    for nombre, futuro in futuros.items():
+        marca = marcas[nombre]
+        try:
+            if not marca["evento"].wait(ESPERA_INICIO):
+                # Aún en la cola del pool o cargando su modelo: si no había
+                # empezado, cancel() la saca de la cola
+                futuro.cancel()
+                raise TiempoAgotado()
+            restante = TIMEOUTS.get(nombre, TIMEOUT_POR_DEFECTO) - (time.monotonic() - marca["inicio"])
+            resultados[nombre] = futuro.result(timeout=max(0.0, restante))
+        except TiempoAgotado:
+            logging.warning(f"⏱️ La etapa '{nombre}' superó su tiempo máximo; se omite")
+            _registrar(nombre)
+            resultados[nombre] = etapas[nombre][2]
+        except Exception as e:
+            logging.error(f"❌ Error en la etapa '{nombre}': {e}", exc_info=True)
+            resultados[nombre] = etapas[nombre][2]
+    return resultados
+
+
+def estadisticas():
+    with _lock:
+        etapas = {
+            etapa: {"ejecuciones": m["ejecuciones"], "agotadas": m["agotadas"],
+                    "segundos_medios": round(m["segundos"] / max(1, m["ejecuciones"]), 3)}
+            for etapa, m in _metricas.items()
+        }
+    return {"hilos_etapas": HILOS_ETAPAS, "timeouts": TIMEOUTS, "espera_inicio": ESPERA_INICIO,
+            "presupuesto": _presupuesto, "etapas": etapas}
@@ -0,0 +1,32 @@
+import gc
+import os
+import time
+import logging
+
+import modelos
+from procesos_vision import PRECARGA_COMPARTIDA
+
+# Precarga del servidor de fork del pool de visión (ver procesos_vision.py).
+#
+# El pool arranca sus hijos con el contexto "forkserver" de multiprocessing y
+# este módulo como precarga: el servidor de fork es un intérprete nuevo, de un
+# solo hilo, que al importarlo carga los modelos de VISION_PRECARGA y congela
+# el recolector. Todos los hijos, también los que se relanzan cuando uno muere,
+# se bifurcan de ese proceso y comparten sus páginas copy-on-write; nunca se
+# bifurca el padre del pool, que tiene hilos en marcha.
+#
+# No se importa desde ningún otro sitio: importarlo carga los modelos.
+
+logging.basicConfig(level=logging.INFO)
+_inicio = time.perf_counter()
+if PRECARGA_COMPARTIDA:
+    modelos.precargar_modelos(PRECARGA_COMPARTIDA)
+# detection (y con él torch, mediapipe, DeepFace...) también queda importado,
+# para que los hijos no lo repitan
+import detection  # noqa: E402,F401
+
+# Los objetos ya creados pasan a la generación permanente: el recolector no
+# vuelve a escribir en sus cabeceras y las páginas siguen compartidas
+gc.freeze()
+logging.info(
+    f"🧠 Servidor de fork del pool listo en {time.perf_counter() - _inicio:.1f}s (pid {os.getpid()})")
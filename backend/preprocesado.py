@@ -0,0 +1,83 @@
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Normalización de las imágenes antes del análisis.
+#
+# Una foto de móvil de 12 MP ocupa ~36 MB decodificada y ningún modelo la
+# necesita a esa resolución. Aquí se decodifica una sola vez, ya reducida: en
+# JPEG, Image.draft() hace que libjpeg escale durante la decodificación
+# (1/2, 1/4 u 1/8), sin llegar a construir el fotograma completo. Después se
+# aplica la orientación EXIF y se genera una pirámide con el tamaño que
+# necesita cada modelo.
+
+# Lado mayor del fotograma de trabajo (detección de rostro)
+LADO_MAX = int(os.environ.get("ANALISIS_LADO_MAX", 1280))
+# MediaPipe Pose localiza a la persona sobre 224x224, pero los puntos salen de
+# un recorte de 256x256 alrededor de ella tomado de este fotograma. Si la
+# persona ocupa solo una parte de la foto, con un fotograma de 256 px ese
+# recorte se ampliaría desde muchos menos píxeles; con 640 la persona suele
+# cubrir los 256 px del recorte sin ampliar
+LADO_POSE = int(os.environ.get("ANALISIS_LADO_POSE", 640))
+# Entrada de Segformer (face-parsing)
+TAMANO_SEGMENTACION = (512, 512)
+
+
+def reducir(img, lado_max):
+    """Reduce un arreglo para que su lado mayor no supere `lado_max`."""
+    alto, ancho = img.shape[:2]
+    escala = lado_max / max(alto, ancho)
+    if escala >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(ancho * escala)), max(1, round(alto * escala))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def decodificar(datos, lado_max=None):
+    """Bytes de la imagen -> arreglo BGR orientado y con el lado mayor <= lado_max."""
+    lado_max = lado_max or LADO_MAX
+    try:
+        imagen = Image.open(io.BytesIO(datos))
+        # Solo tiene efecto en JPEG: elige la escala de decodificación más
+        # pequeña que siga cubriendo lado_max x lado_max
+        imagen.draft("RGB", (lado_max, lado_max))
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode != "RGB":
+            imagen = imagen.convert("RGB")
+        imagen.thumbnail((lado_max, lado_max), Image.BILINEAR)
+    except Exception as e:
+        raise ValueError(f"No se pudo decodificar la imagen recibida: {e}")
+    return cv2.cvtColor(np.asarray(imagen), cv2.COLOR_RGB2BGR)
+
+
+def decodificar_imagen(imagen):
+    """Acepta bytes, un arreglo BGR ya decodificado o una ruta y devuelve el
+    fotograma de trabajo en BGR: orientado según EXIF y con el lado mayor
+    limitado a LADO_MAX."""
+    if isinstance(imagen, np.ndarray):
+        return reducir(imagen, LADO_MAX)
+    if isinstance(imagen, (bytes, bytearray, memoryview)):
+        return decodificar(bytes(imagen))
+    with open(imagen, "rb") as f:
+        return decodificar(f.read())
+
+
+def piramide(img_bgr):
+    """Versiones de la imagen para cada analizador.
+
+    - "bgr": fotograma de trabajo (RetinaFace, recorte del rostro)
+    - "rgb": el mismo fotograma en RGB
+    - "pose": RGB con el lado mayor <= LADO_POSE (MediaPipe Pose)
+    - "segmentacion": RGB de 512x512 (Segformer), reducido del fotograma de
+      trabajo y no del nivel de pose, que puede ser menor y habría que ampliar
+    """
+    rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    return {
+        "bgr": img_bgr,
+        "rgb": rgb,
+        "pose": reducir(rgb, LADO_POSE),
+        "segmentacion": cv2.resize(rgb, TAMANO_SEGMENTACION, interpolation=cv2.INTER_AREA)
+    }
@@ -0,0 +1,296 @@
+import os
+import sys
+import time
+import signal
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.connection import Client, Listener, wait
+
+import modelos
+import orquestador
+
+# Pool de procesos de visión con los modelos compartidos entre procesos.
+#
+# Sin este pool, cada worker de gunicorn que atiende /subir-imagen carga su
+# propia copia de Segformer, DeepFace y MediaPipe, así que la memoria crece con
+# el número de workers. Aquí los pesos se cargan una sola vez en un servidor de
+# fork (contexto "forkserver", ver precarga_vision.py) y los VISION_PROCESOS
+# hijos se bifurcan de él, compartiendo esas páginas copy-on-write. Los hijos
+# toman los análisis de una cola multiprocessing; los workers web son clientes
+# ligeros que envían cada análisis al padre por un socket unix local (ver
+# vision.py).
+#
+# El padre atiende a los clientes con hilos, así que nunca se bifurca a sí
+# mismo: un fork desde un proceso con hilos puede heredar un lock tomado y
+# bloquear al hijo. El servidor de fork es de un solo hilo, y también relanza
+# a los hijos que mueren.
+#
+# Solo se precargan en el servidor de fork los modelos de VISION_PRECARGA
+# (Segformer por defecto). TensorFlow (DeepFace) y MediaPipe arrancan hilos
+# propios que no sobreviven a un fork, de modo que esos modelos se cargan en
+# cada hijo al arrancar; su memoria escala con VISION_PROCESOS, no con los
+# workers web.
+#
+# Los clientes se autentican con VISION_CLAVE (o SECRET_KEY): sin ninguna de
+# las dos el pool no arranca, en lugar de aceptar una clave conocida.
+#
+# Uso: python procesos_vision.py  (MODO_SERVIDOR=pool en arrancar.sh)
+
+SOCKET = os.environ.get("VISION_SOCKET", "/tmp/alzarea-vision.sock")
+PROCESOS = int(os.environ.get("VISION_PROCESOS", 2))
+PRECARGA_COMPARTIDA = [nombre for nombre in os.environ.get(
+    "VISION_PRECARGA", "segformer").split(",") if nombre.strip()]
+# Hilos de cómputo por hijo (ver orquestador.configurar_hilos): por defecto se
+# reparten los núcleos del contenedor
+HILOS_POR_PROCESO = int(os.environ.get(
+    "VISION_HILOS", max(1, orquestador.nucleos_disponibles() // max(1, PROCESOS))))
+# Espera máxima de un cliente por un análisis (como ESPERA_ANALISIS_SEGUNDOS)
+ESPERA_SEGUNDOS = float(os.environ.get("VISION_ESPERA", 280))
+# Pausa tras relanzar un hijo, para no entrar en un bucle si muere al arrancar
+PAUSA_REINICIO = 1.0
+CLAVE = os.environ.get("VISION_CLAVE") or os.environ.get("SECRET_KEY")
+
+# Funciones de detection que se pueden pedir al pool
+FUNCIONES = ("detect_facial_features", "detect_facial_features_lote")
+
+
+class VisionNoDisponible(Exception):
+    """El pool de visión no responde (no arrancado, caído o sin respuesta a tiempo)."""
+
+
+def clave():
+    """Clave de autenticación del socket; sin ella no hay pool."""
+    if not CLAVE:
+        raise VisionNoDisponible(
+            "Falta VISION_CLAVE (o SECRET_KEY) para autenticar el pool de visión")
+    return CLAVE.encode()
+
+
+def _hijo(tareas, resultados, hilos):
+    # Mensajes al padre por `resultados`:
+    #   (None, True, pid)        el hijo terminó de cargar sus modelos
+    #   (tarea_id, None, pid)    el hijo empieza la tarea
+    #   (tarea_id, ok, valor)    resultado (o mensaje de error) de la tarea
+    # Las tareas cuyo cliente ya dejó de esperar se descartan sin ejecutarlas
+    # Ctrl+C y SIGTERM los gestiona el padre, que termina a los hijos
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import detection
+
+    pid = os.getpid()
+    orquestador.configurar_hilos(hilos)
+    modelos.precargar_modelos()
+    logging.info(f"🧩 Proceso de visión listo (pid {pid}, {hilos} hilos)")
+    resultados.put((None, True, pid))
+
+    while True:
+        tarea = tareas.get()
+        if tarea is None:
+            break
+        tarea_id, funcion, args, limite = tarea
+        if time.time() > limite:
+            logging.warning(f"⏱️ Análisis {tarea_id} descartado: superó el tiempo de espera en la cola")
+            continue
+        resultados.put((tarea_id, None, pid))
+        try:
+            resultados.put((tarea_id, True, getattr(detection, funcion)(*args)))
+        except Exception as e:
+            logging.error(f"❌ Error en el análisis {tarea_id}: {e}", exc_info=True)
+            resultados.put((tarea_id, False, str(e)))
+
+
+class PoolVision:
+    """Padre del pool: reparte las tareas entre los hijos y devuelve los resultados.
+
+    Cada conexión de un cliente se atiende en un hilo que encola la tarea y
+    espera su resultado; un hilo recoge las respuestas de los hijos y otro
+    relanza los hijos que mueran y falla la tarea que tuvieran en curso.
+    """
+
+    def __init__(self, procesos=PROCESOS, hilos=HILOS_POR_PROCESO):
+        self.procesos = max(1, procesos)
+        self.hilos = hilos
+        self._contexto = multiprocessing.get_context("forkserver")
+        self._contexto.set_forkserver_preload(["__main__", "precarga_vision"])
+        self._tareas = self._contexto.Queue()
+        self._resultados = self._contexto.Queue()
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self._ids = itertools.count()
+        self._hijos = []
+        # pids de los hijos que ya terminaron de cargar sus modelos
+        self._listos = set()
+        # pid -> tarea que está analizando ese hijo
+        self._en_curso = {}
+        # pids de hijos muertos, por si su aviso de inicio llega después
+        self._muertos = set()
+        self._atendidas = 0
+        self._reinicios = 0
+        self._deteniendo = False
+
+    def _bifurcar(self):
+        hijo = self._contexto.Process(
+            target=_hijo, args=(self._tareas, self._resultados, self.hilos),
+            name="vision", daemon=True)
+        hijo.start()
+        return hijo
+
+    def iniciar(self):
+        self._hijos = [self._bifurcar() for _ in range(self.procesos)]
+        for objetivo in (self._recoger, self._vigilar):
+            threading.Thread(target=objetivo, daemon=True).start()
+
+    def detener(self):
+        self._deteniendo = True
+        for hijo in self._hijos:
+            hijo.terminate()
+
+    def _responder(self, tarea_id, ok, valor):
+        with self._lock:
+            pendiente = self._pendientes.pop(tarea_id, None)
+        if pendiente is not None:
+            pendiente["respuesta"] = (ok, valor)
+            pendiente["evento"].set()
+
+    def _recoger(self):
+        while True:
+            tarea_id, ok, valor = self._resultados.get()
+            if tarea_id is None:
+                self._listos.add(valor)
+                continue
+            if ok is None:
+                with self._lock:
+                    muerto = valor in self._muertos
+                    if not muerto:
+                        self._en_curso[valor] = tarea_id
+                if muerto:
+                    self._responder(tarea_id, False, "El proceso de visión terminó durante el análisis")
+                continue
+            with self._lock:
+                for pid, en_curso in list(self._en_curso.items()):
+                    if en_curso == tarea_id:
+                        del self._en_curso[pid]
+            self._responder(tarea_id, ok, valor)
+
+    def _vigilar(self):
+        while True:
+            # Despierta en cuanto termina cualquier hijo
+            wait([hijo.sentinel for hijo in self._hijos], timeout=5)
+            if self._deteniendo:
+                return
+            reiniciados = False
+            for i, hijo in enumerate(self._hijos):
+                if hijo.is_alive():
+                    continue
+                with self._lock:
+                    self._muertos.add(hijo.pid)
+                    tarea_id = self._en_curso.pop(hijo.pid, None)
+                logging.error(
+                    f"❌ Proceso de visión {hijo.pid} terminado (código {hijo.exitcode}); se relanza")
+                if tarea_id is not None:
+                    self._responder(tarea_id, False, "El proceso de visión terminó durante el análisis")
+                self._listos.discard(hijo.pid)
+                self._hijos[i] = self._bifurcar()
+                self._reinicios += 1
+                reiniciados = True
+            if reiniciados:
+                time.sleep(PAUSA_REINICIO)
+
+    def ejecutar(self, funcion, args):
+        """Encola `detection.funcion(*args)` y espera el resultado de un hijo.
+
+        La tarea lleva la hora límite de la espera: si sigue en la cola cuando
+        vence, el hijo que la saque la descarta. Un análisis ya empezado no se
+        interrumpe, pero su resultado se ignora.
+        """
+        tarea_id = next(self._ids)
+        pendiente = {"evento": threading.Event(), "respuesta": None}
+        with self._lock:
+            self._pendientes[tarea_id] = pendiente
+        self._tareas.put((tarea_id, funcion, args, time.time() + ESPERA_SEGUNDOS))
+        if not pendiente["evento"].wait(ESPERA_SEGUNDOS):
+            with self._lock:
+                self._pendientes.pop(tarea_id, None)
+            return False, "El análisis superó el tiempo de espera"
+        with self._lock:
+            self._atendidas += 1
+        return pendiente["respuesta"]
+
+    def estadisticas(self):
+        with self._lock:
+            en_curso = len(self._pendientes)
+        return {
+            "procesos": self.procesos,
+            "vivos": sum(hijo.is_alive() for hijo in self._hijos),
+            "listos": len(self._listos),
+            "hilos_por_proceso": self.hilos,
+            "en_curso": en_curso,
+            "atendidas": self._atendidas,
+            "reinicios": self._reinicios,
+            "precargados": PRECARGA_COMPARTIDA
+        }
+
+    def atender(self, conexion):
+        with conexion:
+            try:
+                funcion, args = conexion.recv()
+            except EOFError:
+                return
+            if funcion == "estadisticas":
+                conexion.send((True, self.estadisticas()))
+            elif funcion in FUNCIONES:
+                conexion.send(self.ejecutar(funcion, args))
+            else:
+                conexion.send((False, f"Función no permitida: {funcion}"))
+
+    def escuchar(self, direccion=SOCKET):
+        if os.path.exists(direccion):
+            os.unlink(direccion)
+        with Listener(direccion, family="AF_UNIX", authkey=clave()) as listener:
+            logging.info(f"👂 Pool de visión escuchando en {direccion}")
+            while True:
+                try:
+                    conexion = listener.accept()
+                except (OSError, multiprocessing.AuthenticationError) as e:
+                    logging.warning(f"⚠️ Conexión rechazada: {e}")
+                    continue
+                threading.Thread(target=self.atender, args=(conexion,), daemon=True).start()
+
+
+def llamar(funcion, *args, espera=ESPERA_SEGUNDOS):
+    """Cliente: ejecuta `funcion` en el pool y devuelve su resultado.
+
+    Lanza VisionNoDisponible si el pool no responde y RuntimeError si el
+    análisis falló en el hijo.
+    """
+    autenticacion = clave()
+    try:
+        with Client(SOCKET, family="AF_UNIX", authkey=autenticacion) as conexion:
+            conexion.send((funcion, args))
+            if not conexion.poll(espera):
+                raise VisionNoDisponible("Sin respuesta del pool de visión")
+            ok, valor = conexion.recv()
+    except (OSError, EOFError) as e:
+        raise VisionNoDisponible(f"Pool de visión no disponible: {e}")
+    if not ok:
+        raise RuntimeError(valor)
+    return valor
+
+
+def servir():
+    logging.basicConfig(level=logging.INFO)
+    clave()
+    logging.info(f"🧠 Padre del pool de visión (pid {os.getpid()}); los modelos se cargan "
+                 f"en el servidor de fork")
+    pool = PoolVision()
+    pool.iniciar()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        pool.escuchar()
+    finally:
+        pool.detener()
+
+
+if __name__ == "__main__":
+    servir()
@@ -0,0 +1,80 @@
+import hashlib
+import logging
+import threading
+
+# Prompts de sistema internados: cada texto se guarda una sola vez por proceso
+# y las sesiones solo almacenan su versión (hash del contenido). Como todos los
+# workers construyen el mismo prompt a partir de los mismos archivos, la versión
+# coincide entre procesos y puede guardarse en un almacén compartido.
+
+_prompts = {}
+_version_actual = None
+_lock = threading.Lock()
+
+_metricas = {
+    "peticiones": 0,
+    "caracteres": 0,
+    "tokens_estimados": 0,
+    "tokens_reales": 0,
+    "ultima": None
+}
+
+
+def registrar_prompt(texto, actual=True):
+    """Interna `texto` y devuelve su versión; por defecto pasa a ser el actual."""
+    global _version_actual
+    version = hashlib.sha256(texto.encode("utf-8")).hexdigest()[:12]
+    with _lock:
+        _prompts.setdefault(version, texto)
+        if actual:
+            _version_actual = version
+    return version
+
+
+def version_actual():
+    return _version_actual
+
+
+def obtener_prompt(version):
+    """Texto del prompt `version`; si no se conoce (p. ej. el catálogo cambió
+    y la sesión viene de un worker anterior) se usa el actual."""
+    texto = _prompts.get(version)
+    if texto is None:
+        logging.warning(
+            f"Prompt '{version}' desconocido, se usa la versión {_version_actual}")
+        texto = _prompts[_version_actual]
+    return texto
+
+
+def estimar_tokens(caracteres):
+    # Aproximación habitual para modelos tipo Llama: ~4 caracteres por token
+    return max(1, caracteres // 4)
+
+
+def registrar_uso(mensajes, tokens_reales=None):
+    """Acumula tamaño y tokens del payload enviado en una petición a la IA."""
+    caracteres = sum(len(m.get("content") or "") for m in mensajes)
+    uso = {
+        "mensajes": len(mensajes),
+        "caracteres": caracteres,
+        "tokens_estimados": estimar_tokens(caracteres),
+        "tokens_reales": tokens_reales
+    }
+    with _lock:
+        _metricas["peticiones"] += 1
+        _metricas["caracteres"] += caracteres
+        _metricas["tokens_estimados"] += uso["tokens_estimados"]
+        _metricas["tokens_reales"] += tokens_reales or 0
+        _metricas["ultima"] = uso
+    logging.info(
+        f"🧾 Prompt: {uso['mensajes']} mensajes, {caracteres} caracteres, "
+        f"~{uso['tokens_estimados']} tokens (reales: {tokens_reales})")
+    return uso
+
+
+def metricas():
+    with _lock:
+        peticiones = _metricas["peticiones"]
+        return dict(_metricas,
+                    version=_version_actual,
+                    tokens_estimados_medios=_metricas["tokens_estimados"] // peticiones if peticiones else 0)
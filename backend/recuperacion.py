@@ -0,0 +1,105 @@
+import os
+import re
+import math
+from collections import Counter
+
+from catalogo import clave_diseno, tokenizar
+
+# Selección de los vestidos relevantes para cada turno (BM25 sobre el catálogo).
+#
+# En lugar de incluir todo el catálogo en el prompt de sistema, en cada
+# petición se envían solo los `k` diseños que mejor encajan con los datos de la
+# sesión y los últimos mensajes, además de la lista de nombres disponibles para
+# que la IA no invente diseños.
+#
+# Solo compensa si el catálogo es mayor que la selección más grande posible
+# (TOP_K más los diseños que arrastran los conjuntos): con menos vestidos la
+# selección acaba siendo el catálogo entero y la lista de nombres sobra.
+
+TOP_K = int(os.environ.get("CATALOGO_TOP_K", 3))
+# Diseños que siempre se ofrecen juntos (regla del prompt)
+CONJUNTOS = [{"SOPHIE", "LIRIA"}]
+# Tamaño máximo de la selección sin contar los diseños nombrados en la consulta
+MAX_SELECCION = TOP_K + sum(len(c) - 1 for c in CONJUNTOS)
+
+K1 = 1.5
+B = 0.75
+
+
+def compensa(catalogo):
+    """True si el catálogo es mayor que la selección más grande posible."""
+    return len(catalogo) > MAX_SELECCION
+
+
+class IndiceCatalogo:
+    def __init__(self, catalogo):
+        self.catalogo = catalogo
+        self.claves = [clave_diseno(v["diseno"]) for v in catalogo.vestidos]
+        documentos = []
+        for vestido in catalogo.vestidos:
+            texto = " ".join([vestido["diseno"], vestido["descripcion"], vestido["colores"],
+                              vestido["material"], vestido["origen"]])
+            documentos.append(Counter(tokenizar(texto)))
+        self.frecuencias = documentos
+        self.longitudes = [sum(d.values()) for d in documentos]
+        self.longitud_media = (sum(self.longitudes) / len(documentos)) if documentos else 0
+        apariciones = Counter(t for d in documentos for t in d)
+        n = len(documentos)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5))
+                    for t, df in apariciones.items()}
+
+    def puntuar(self, consulta):
+        """Puntuación BM25 de cada diseño para el texto `consulta`."""
+        consulta = set(tokenizar(consulta))
+        puntuaciones = []
+        for frecuencias, longitud in zip(self.frecuencias, self.longitudes):
+            puntuacion = 0.0
+            for termino in consulta:
+                tf = frecuencias.get(termino)
+                if not tf:
+                    continue
+                norma = K1 * (1 - B + B * longitud / (self.longitud_media or 1))
+                puntuacion += self.idf[termino] * tf * (K1 + 1) / (tf + norma)
+            puntuaciones.append(puntuacion)
+        return puntuaciones
+
+    def seleccionar(self, consulta, k=None):
+        """Los `k` vestidos más relevantes, respetando los conjuntos.
+
+        Los diseños nombrados explícitamente en la consulta siempre se incluyen.
+        Si la consulta no coincide con nada se devuelven los primeros del catálogo.
+        """
+        k = k or TOP_K
+        puntuaciones = self.puntuar(consulta)
+        orden = sorted(range(len(self.claves)),
+                       key=lambda i: puntuaciones[i], reverse=True)
+
+        consulta_clave = clave_diseno(consulta)
+        elegidos = [c for c in self.claves
+                    if re.search(rf"\b{re.escape(c)}\b", consulta_clave)]
+        for i in orden:
+            if len(elegidos) >= k:
+                break
+            if self.claves[i] not in elegidos:
+                elegidos.append(self.claves[i])
+
+        for conjunto in CONJUNTOS:
+            if conjunto & set(elegidos):
+                elegidos.extend(c for c in sorted(conjunto)
+                                if c not in elegidos and c in self.catalogo.por_diseno)
+        return [self.catalogo.por_diseno[c] for c in elegidos]
+
+    def mensaje(self, consulta, k=None):
+        """Mensaje de sistema con la selección para este turno."""
+        seleccion = self.seleccionar(consulta, k)
+        if len(seleccion) == len(self.catalogo.vestidos):
+            # Están todos: la lista de nombres no añade nada
+            return {"role": "system",
+                    "content": f"Vestidos disponibles:\n\n{self.catalogo.texto_prompt()}"}
+        disponibles = ", ".join(v["diseno"] for v in self.catalogo.vestidos)
+        return {
+            "role": "system",
+            "content": (f"Diseños disponibles en la base de datos: {disponibles}.\n"
+                        f"Vestidos más relevantes para esta conversación:\n\n"
+                        f"{self.catalogo.texto_prompt(seleccion)}")
+        }
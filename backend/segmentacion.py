@@ -0,0 +1,231 @@
+import os
+import sys
+import logging
+import threading
+
+import numpy as np
+
+# Backends de inferencia de Segformer (face-parsing) para la máscara de pelo.
+#
+# - "torch" (por defecto): transformers + PyTorch en float32.
+# - "onnx": el mismo modelo exportado a ONNX y ejecutado con ONNX Runtime.
+# - "onnx-int8": el ONNX con cuantización dinámica int8 de los pesos de las
+#   MatMul (atención y MLP del encoder, la mayor parte del cómputo), para CPU.
+#
+# El grafo exportado incluye el reescalado de los logits a 512x512 y el argmax,
+# así que todos los backends devuelven lo mismo: etiquetas N x 512 x 512. Antes
+# de usar un backend ONNX conviene comprobar su paridad con torch en la clase
+# pelo (IoU de la máscara): `python segmentacion.py [imagenes...]` exporta los
+# modelos y la mide; benchmarks/bench_segmentacion.py añade latencia y memoria.
+
+SEGFORMER_MODELO = "jonathandinu/face-parsing"
+CLASE_CABELLO = 13
+TAMANO = 512
+BACKENDS = ("torch", "onnx", "onnx-int8")
+BACKEND = os.environ.get("SEGMENTACION_BACKEND", "torch")
+DIRECTORIO_ONNX = os.environ.get("SEGMENTACION_ONNX_DIR", "modelos_onnx")
+# Hilos de ONNX Runtime por sesión (0: los decide ONNX Runtime)
+HILOS_ONNX = int(os.environ.get("SEGMENTACION_HILOS", 0))
+# IoU mínima de la máscara de pelo frente a torch para dar un backend por bueno
+UMBRAL_IOU = float(os.environ.get("SEGMENTACION_UMBRAL_IOU", 0.9))
+# Fracción mínima de pelo en la máscara de torch para que una imagen cuente en
+# la paridad: sin pelo la IoU sale 1.0 sin comprobar nada (logos, prendas)
+MIN_PELO = 0.01
+
+
+def ruta_onnx(int8=False):
+    return os.path.join(DIRECTORIO_ONNX, "face-parsing.int8.onnx" if int8 else "face-parsing.onnx")
+
+
+class SegmentadorTorch:
+    backend = "torch"
+
+    def __init__(self):
+        import torch
+        from transformers import SegformerImageProcessor, SegformerForSemanticSegmentation
+
+        self.processor = SegformerImageProcessor.from_pretrained(SEGFORMER_MODELO)
+        self.model = SegformerForSemanticSegmentation.from_pretrained(SEGFORMER_MODELO)
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model.to(self.device)
+        self.model.eval()
+
+    def mascaras(self, imagenes):
+        """Imágenes RGB de 512x512 (PIL o arreglos) -> etiquetas N x 512 x 512."""
+        import torch
+
+        inputs = self.processor(images=imagenes, return_tensors="pt").to(self.device)
+        with torch.no_grad():
+            logits = self.model(**inputs).logits
+        logits = torch.nn.functional.interpolate(
+            logits, size=(TAMANO, TAMANO), mode="bilinear", align_corners=False)
+        return logits.argmax(dim=1).cpu().numpy()
+
+
+class SegmentadorOnnx:
+    """Segformer exportado, ejecutado con ONNX Runtime en CPU.
+
+    Los bytes del modelo se leen al cargar (y quedan compartidos si el proceso
+    se bifurca, ver procesos_vision.py); la sesión arranca su propio pool de
+    hilos, así que se crea en el primer uso dentro de cada proceso.
+    """
+
+    def __init__(self, ruta, backend="onnx"):
+        from transformers import SegformerImageProcessor
+
+        self.backend = backend
+        self.ruta = ruta
+        self.processor = SegformerImageProcessor.from_pretrained(SEGFORMER_MODELO)
+        with open(ruta, "rb") as f:
+            self._modelo = f.read()
+        self._sesion = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _obtener_sesion(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    import onnxruntime as ort
+
+                    opciones = ort.SessionOptions()
+                    if HILOS_ONNX:
+                        opciones.intra_op_num_threads = HILOS_ONNX
+                    self._sesion = ort.InferenceSession(
+                        self._modelo, opciones, providers=["CPUExecutionProvider"])
+                    self._pid = os.getpid()
+        return self._sesion
+
+    def mascaras(self, imagenes):
+        """Imágenes RGB de 512x512 (PIL o arreglos) -> etiquetas N x 512 x 512."""
+        pixeles = self.processor(images=imagenes, return_tensors="np")["pixel_values"]
+        return self._obtener_sesion().run(None, {"pixel_values": pixeles.astype(np.float32)})[0]
+
+
+def exportar(int8=False):
+    """Exporta Segformer (con reescalado y argmax) a ONNX y, si se pide, su
+    versión int8. No repite los archivos que ya existen; devuelve la ruta."""
+    ruta = ruta_onnx()
+    if not os.path.exists(ruta):
+        import torch
+        from transformers import SegformerForSemanticSegmentation
+
+        class Etiquetas(torch.nn.Module):
+            def __init__(self, modelo):
+                super().__init__()
+                self.modelo = modelo
+
+            def forward(self, pixel_values):
+                logits = self.modelo(pixel_values=pixel_values, return_dict=False)[0]
+                logits = torch.nn.functional.interpolate(
+                    logits, size=(TAMANO, TAMANO), mode="bilinear", align_corners=False)
+                return logits.argmax(dim=1)
+
+        modelo = SegformerForSemanticSegmentation.from_pretrained(SEGFORMER_MODELO).eval()
+        os.makedirs(DIRECTORIO_ONNX, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                Etiquetas(modelo), torch.zeros(1, 3, TAMANO, TAMANO), ruta,
+                input_names=["pixel_values"], output_names=["etiquetas"],
+                dynamic_axes={"pixel_values": {0: "n"}, "etiquetas": {0: "n"}},
+                opset_version=17)
+        logging.info(f"📦 Segformer exportado a {ruta}")
+
+    if not int8:
+        return ruta
+    ruta_int8 = ruta_onnx(int8=True)
+    if not os.path.exists(ruta_int8):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # Solo MatMul: ConvInteger con pesos int8 no está implementado en el
+        # proveedor de CPU de ONNX Runtime
+        quantize_dynamic(ruta, ruta_int8, op_types_to_quantize=["MatMul"],
+                         weight_type=QuantType.QInt8)
+        logging.info(f"📦 Segformer cuantizado (int8) en {ruta_int8}")
+    return ruta_int8
+
+
+def cargar(backend=None):
+    """Segmentador del backend indicado (SEGMENTACION_BACKEND por defecto).
+
+    Si el ONNX no existe todavía se exporta en ese momento (el Dockerfile lo
+    hace al construir la imagen).
+    """
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"SEGMENTACION_BACKEND desconocido: {backend} (opciones: {BACKENDS})")
+    if backend == "torch":
+        return SegmentadorTorch()
+
+    int8 = backend == "onnx-int8"
+    ruta = ruta_onnx(int8)
+    if not os.path.exists(ruta):
+        logging.warning(f"⚠️ {ruta} no existe: se exporta ahora")
+        exportar(int8)
+    return SegmentadorOnnx(ruta, backend)
+
+
+def iou(a, b):
+    """Intersección sobre unión de dos máscaras booleanas (1.0 si ambas vacías)."""
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def paridad(referencia, candidato, imagenes):
+    """IoU de la máscara de pelo de `candidato` frente a `referencia`, por imagen.
+
+    Solo cuentan las imágenes en las que `referencia` encuentra pelo (al menos
+    MIN_PELO de la máscara); el resto se omite.
+    """
+    valores = []
+    for imagen in imagenes:
+        pelo = referencia.mascaras([imagen])[0] == CLASE_CABELLO
+        if pelo.mean() < MIN_PELO:
+            continue
+        valores.append(iou(pelo, candidato.mascaras([imagen])[0] == CLASE_CABELLO))
+    return valores
+
+
+def cargar_imagenes(rutas):
+    from PIL import Image
+
+    return [Image.open(ruta).convert("RGB").resize((TAMANO, TAMANO)) for ruta in rutas]
+
+
+def main():
+    """Exporta los backends ONNX y mide su paridad con torch.
+
+    Uso: python segmentacion.py [--estricto] [imagen ...]
+    Sin imágenes se usan las del catálogo; solo cuentan las que tienen pelo
+    (ver paridad). Con --estricto termina con error si algún backend queda por
+    debajo de UMBRAL_IOU en alguna imagen o si ninguna imagen tiene pelo.
+    """
+    logging.basicConfig(level=logging.INFO)
+    argumentos = sys.argv[1:]
+    estricto = "--estricto" in argumentos
+    rutas = [a for a in argumentos if a != "--estricto"]
+    if not rutas:
+        directorio = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imagenes")
+        rutas = [os.path.join(directorio, nombre) for nombre in sorted(os.listdir(directorio))
+                 if nombre.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+    exportar(int8=True)
+    imagenes = cargar_imagenes(rutas)
+    referencia = cargar("torch")
+    correcto = True
+    for backend in BACKENDS[1:]:
+        valores = paridad(referencia, cargar(backend), imagenes)
+        if not valores:
+            correcto = False
+            print(f"{backend:<10} sin imágenes con pelo: no se puede medir la paridad")
+            continue
+        minimo = min(valores)
+        correcto = correcto and minimo >= UMBRAL_IOU
+        print(f"{backend:<10} IoU pelo media={np.mean(valores):.3f} mínima={minimo:.3f} "
+              f"({len(valores)} de {len(imagenes)} imágenes con pelo, umbral {UMBRAL_IOU})")
+    if estricto and not correcto:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Cola acotada de trabajos en segundo plano para el análisis de imágenes.
+# Los trabajos corren en su propio pool de hilos, de modo que un worker de
+# gunicorn puede devolver el id del trabajo y seguir atendiendo /chat.
+#
+# Con varios workers, la consulta /trabajos/<id> puede llegar a un proceso que
+# no ejecutó el trabajo. Por eso el estado se publica además en un registro
+# compartido (RegistroSQLite, por defecto): cualquier worker puede responder
+# por cualquier trabajo; la ejecución sigue siendo local al worker que lo recibió.
+
+PENDIENTE = "pendiente"
+PROCESANDO = "procesando"
+COMPLETADO = "completado"
+ERROR = "error"
+
+
+class ColaLlena(Exception):
+    """No quedan plazas en la cola: el cliente debe reintentar más tarde."""
+
+
+TERMINADOS = (COMPLETADO, ERROR)
+# Cada cuánto se consulta el registro al esperar un trabajo de otro worker
+INTERVALO_CONSULTA = 0.5
+
+
+class RegistroSQLite:
+    """Estado público de los trabajos en SQLite (WAL), compartido por los workers."""
+
+    def __init__(self, ruta="trabajos.db"):
+        self.ruta = ruta
+        self._local = threading.local()
+        with self._conexion() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trabajos ("
+                "id TEXT PRIMARY KEY, estado TEXT NOT NULL, resultado TEXT, "
+                "error TEXT, creado REAL NOT NULL, terminado REAL)")
+
+    def _conexion(self):
+        # Una conexión por hilo; WAL permite lectores concurrentes entre workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def guardar(self, trabajo):
+        resultado = None
+        if trabajo["resultado"] is not None:
+            resultado = json.dumps(trabajo["resultado"], ensure_ascii=False, default=str)
+        with self._conexion() as conn:
+            conn.execute(
+                "INSERT INTO trabajos (id, estado, resultado, error, creado, terminado) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "estado = excluded.estado, resultado = excluded.resultado, "
+                "error = excluded.error, terminado = excluded.terminado",
+                (trabajo["id"], trabajo["estado"], resultado, trabajo["error"],
+                 trabajo["creado"], trabajo["terminado"]))
+
+    def obtener(self, trabajo_id):
+        fila = self._conexion().execute(
+            "SELECT id, estado, resultado, error, creado, terminado FROM trabajos "
+            "WHERE id = ?", (trabajo_id,)).fetchone()
+        if fila is None:
+            return None
+        return {"id": fila[0], "estado": fila[1],
+                "resultado": json.loads(fila[2]) if fila[2] is not None else None,
+                "error": fila[3], "creado": fila[4], "terminado": fila[5]}
+
+    def purgar(self, limite):
+        # También los que nunca terminaron (p. ej. su worker se reinició)
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM trabajos WHERE COALESCE(terminado, creado) < ?",
+                         (limite,))
+
+
+class ColaTrabajos:
+    def __init__(self, max_workers=1, max_pendientes=4, ttl_resultados=600, registro=None):
+        self.max_workers = max_workers
+        self.max_pendientes = max_pendientes
+        self.ttl_resultados = ttl_resultados
+        self.registro = registro
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="analisis")
+        # Plazas = trabajos en ejecución + trabajos esperando turno
+        self._plazas = threading.BoundedSemaphore(max_workers + max_pendientes)
+        self._lock = threading.Lock()
+        self._trabajos = {}
+
+    def enviar(self, funcion, *args, **kwargs):
+        """Encola `funcion(*args, **kwargs)` y devuelve el id del trabajo.
+
+        Lanza ColaLlena si no hay plazas libres.
+        """
+        if not self._plazas.acquire(blocking=False):
+            raise ColaLlena()
+
+        self._purgar()
+        trabajo_id = uuid.uuid4().hex
+        trabajo = {
+            "id": trabajo_id,
+            "estado": PENDIENTE,
+            "resultado": None,
+            "error": None,
+            "creado": time.time(),
+            "terminado": None,
+            "evento": threading.Event()
+        }
+        with self._lock:
+            self._trabajos[trabajo_id] = trabajo
+        self._publicar(trabajo)
+
+        try:
+            self._executor.submit(self._ejecutar, trabajo,
+                                  funcion, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._trabajos.pop(trabajo_id, None)
+            self._plazas.release()
+            raise
+        return trabajo_id
+
+    def _publicar(self, trabajo):
+        if self.registro is None:
+            return
+        try:
+            self.registro.guardar(trabajo)
+        except Exception as e:
+            logging.error(f"❌ No se pudo publicar el trabajo {trabajo['id']}: {e}", exc_info=True)
+
+    def _ejecutar(self, trabajo, funcion, args, kwargs):
+        trabajo["estado"] = PROCESANDO
+        self._publicar(trabajo)
+        try:
+            trabajo["resultado"] = funcion(*args, **kwargs)
+            trabajo["estado"] = COMPLETADO
+        except Exception as e:
+            logging.error(
+                f"❌ Error en el trabajo {trabajo['id']}: {e}", exc_info=True)
+            trabajo["error"] = str(e)
+            trabajo["estado"] = ERROR
+        finally:
+            trabajo["terminado"] = time.time()
+            # Primero el registro: quien espera en otro worker lo consulta allí
+            self._publicar(trabajo)
+            trabajo["evento"].set()
+            self._plazas.release()
+
+    def _purgar(self):
+        limite = time.time() - self.ttl_resultados
+        with self._lock:
+            vencidos = [tid for tid, t in self._trabajos.items()
+                        if t["terminado"] is not None and t["terminado"] < limite]
+            for tid in vencidos:
+                del self._trabajos[tid]
+        if self.registro is not None:
+            self.registro.purgar(limite)
+
+    def obtener(self, trabajo_id):
+        """Copia del estado público del trabajo (de este worker o del registro
+        compartido), o None si no existe."""
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None:
+            return self.registro.obtener(trabajo_id) if self.registro is not None else None
+        return {k: v for k, v in trabajo.items() if k != "evento"}
+
+    def esperar(self, trabajo_id, timeout=None):
+        """Espera a que termine el trabajo; devuelve True si terminó a tiempo."""
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is not None:
+            return trabajo["evento"].wait(timeout)
+        if self.registro is None:
+            return False
+
+        # Trabajo de otro worker: se consulta el registro hasta que termine
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            trabajo = self.registro.obtener(trabajo_id)
+            if trabajo is None:
+                return False
+            if trabajo["estado"] in TERMINADOS:
+                return True
+            if limite is not None and time.monotonic() >= limite:
+                return False
+            time.sleep(INTERVALO_CONSULTA)
+
+    def estadisticas(self):
+        with self._lock:
+            estados = [t["estado"] for t in self._trabajos.values()]
+        return {
+            "workers": self.max_workers,
+            "max_pendientes": self.max_pendientes,
+            "pendientes": estados.count(PENDIENTE),
+            "procesando": estados.count(PROCESANDO)
+        }
+
+
+def crear_cola(max_workers=1, max_pendientes=4):
+    """Crea la cola con el registro configurado por variables de entorno.
+
+    TRABAJOS_BACKEND=sqlite (por defecto, compartido entre workers) o memoria
+    (solo válido con un único worker) y TRABAJOS_RUTA (sqlite).
+    """
+    registro = None
+    if os.environ.get("TRABAJOS_BACKEND", "sqlite").lower() == "sqlite":
+        ruta = os.environ.get("TRABAJOS_RUTA", "trabajos.db")
+        logging.info(f"🗂️ Estado de los trabajos en SQLite: {ruta}")
+        registro = RegistroSQLite(ruta)
+    return ColaTrabajos(max_workers=max_workers, max_pendientes=max_pendientes,
+                        registro=registro)
@@ -0,0 +1,76 @@
+import os
+import threading
+
+import modelos
+
+# Fachada perezosa del análisis de imágenes.
+#
+# `detection` arrastra torch, transformers, mediapipe, OpenCV y DeepFace
+# (TensorFlow): varios segundos y cientos de MB al importarlo. app.py solo
+# importa esta fachada, de modo que un worker que únicamente atiende /chat
+# nunca carga esas librerías; se importan en el primer análisis (o en la
+# precarga de modelos, si está activada).
+#
+# Con VISION_SOCKET el análisis ni siquiera se hace en este proceso: se envía
+# al pool de procesos de visión (ver procesos_vision.py), que tiene los modelos
+# cargados una sola vez para todos los workers. La decodificación sigue siendo
+# local (solo PIL/OpenCV) porque la caché de análisis trabaja con los píxeles.
+
+REMOTO = bool(os.environ.get("VISION_SOCKET"))
+
+_detection = None
+_lock = threading.Lock()
+
+
+def _modulo():
+    global _detection
+    if _detection is None:
+        with _lock:
+            if _detection is None:
+                import detection
+                _detection = detection
+    return _detection
+
+
+def _ejecutar(funcion, *args):
+    if REMOTO:
+        import procesos_vision
+        return procesos_vision.llamar(funcion, *args)
+    return getattr(_modulo(), funcion)(*args)
+
+
+def cargada():
+    """True si la pila de visión ya está importada en este proceso."""
+    return _detection is not None
+
+
+def estado():
+    """Resumen para /health: dónde se analiza y, con el pool, sus estadísticas."""
+    if not REMOTO:
+        return "cargada" if cargada() else "sin cargar"
+    import procesos_vision
+    try:
+        return procesos_vision.llamar("estadisticas", espera=2)
+    except procesos_vision.VisionNoDisponible as e:
+        return {"error": str(e)}
+
+
+def modelos_listos():
+    if not REMOTO:
+        return modelos.modelos_listos()
+    # Listo cuando todos los hijos del pool han cargado sus modelos
+    pool = estado()
+    return pool.get("listos", 0) >= pool.get("procesos", 1)
+
+
+def decodificar_imagen(imagen):
+    import preprocesado
+    return preprocesado.decodificar_imagen(imagen)
+
+
+def detect_facial_features(imagen):
+    return _ejecutar("detect_facial_features", imagen)
+
+
+def detect_facial_features_lote(imagenes):
+    return _ejecutar("detect_facial_features_lote", imagenes)
@@ -263,6 +263,35 @@ function createDesignImage(nombreArchivo, nombreDiseno) {
     return img;
 }
 
+// Imagen de un diseño ya resuelta por el backend ({url, ancho, alto, variantes})
+function createDescriptorImage(imagen) {
+    const img = document.createElement('img');
+    img.src = `${backendUrl}${imagen.url}`;
+    img.alt = imagen.diseno;
+    // Anchos pre-generados en WebP/AVIF: el navegador elige el que necesita
+    if (imagen.anchos && imagen.anchos.length > 0) {
+        img.srcset = imagen.anchos
+            .map(ancho => `${backendUrl}${imagen.url}?w=${ancho} ${ancho}w`)
+            .concat(`${backendUrl}${imagen.url} ${imagen.ancho}w`)
+            .join(', ');
+        img.sizes = '(max-width: 480px) 90vw, 320px';
+    }
+    // Reserva el espacio antes de que llegue la imagen
+    if (imagen.ancho && imagen.alto) {
+        img.width = imagen.ancho;
+        img.height = imagen.alto;
+        img.style.height = 'auto';
+    }
+    img.style.maxWidth = '100%';
+    img.style.borderRadius = '8px';
+    img.style.marginTop = '5px';
+    img.onerror = function () {
+        console.error(`Error al cargar la imagen: ${img.src}`);
+        this.style.display = 'none';
+    };
+    return img;
+}
+
 // Función para eliminar el mensaje "pensando" si existe
 function removeThinkingMessage() {
     const messagesContainer = document.getElementById('chatbot-messages');
@@ -275,7 +304,7 @@ function removeThinkingMessage() {
 }
 
 // Función para mostrar mensajes con animación de escritura
-function showMessageWithAnimation(messageText, isError = false, disenos = []) {
+function showMessageWithAnimation(messageText, isError = false, disenos = [], imagenes = []) {
     const messagesContainer = document.getElementById('chatbot-messages');
     if (!messagesContainer) return;
 
@@ -299,7 +328,9 @@ function showMessageWithAnimation(messageText, isError = false, disenos = []) {
         } else {
             clearInterval(intervalo);
 
-            if (disenos.length > 0) {
+            if (imagenes.length > 0) {
+                imagenes.forEach(imagen => message.appendChild(createDescriptorImage(imagen)));
+            } else if (disenos.length > 0) {
                 disenos.forEach(nombreDiseno => {
                     const nombreArchivo = mapeoImagenes[nombreDiseno.toUpperCase()] || nombreDiseno;
                     const img = createDesignImage(nombreArchivo, nombreDiseno);
@@ -310,6 +341,103 @@ function showMessageWithAnimation(messageText, isError = false, disenos = []) {
     }, 50);
 }
 
+// El cuerpo de fetch se puede leer por partes (ReadableStream + TextDecoder)
+const streamingDisponible = typeof ReadableStream !== 'undefined'
+    && typeof ReadableStream.prototype.getReader === 'function'
+    && typeof TextDecoder !== 'undefined';
+
+// Respuesta en streaming (SSE sobre POST): muestra los tokens según llegan.
+// Devuelve false, sin enviar nada, si el navegador no permite leer el cuerpo
+// por partes: el turno se envía entonces a /chat. Una vez hecho el POST a
+// /chat/stream el turno ya está en el historial y no se vuelve a enviar.
+async function respondStreaming(text) {
+    if (!streamingDisponible) {
+        return false;
+    }
+    const response = await fetch(`${backendUrl}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: "include",
+        body: JSON.stringify({
+            mensaje: text,
+            sessionId: sessionId
+        })
+    });
+
+    if (!response.ok) {
+        throw new Error(`Error del servidor: ${response.status}`);
+    }
+
+    const messagesContainer = document.getElementById('chatbot-messages');
+    const message = document.createElement('div');
+    message.className = 'bot-message';
+    const textoElem = document.createElement('span');
+    message.appendChild(textoElem);
+
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let textoRecibido = '';
+    let primerToken = true;
+    const imagenesMostradas = new Set();
+    const mostrarImagenes = (imagenes) => {
+        (imagenes || []).forEach(imagen => {
+            if (imagenesMostradas.has(imagen.diseno)) return;
+            imagenesMostradas.add(imagen.diseno);
+            message.appendChild(createDescriptorImage(imagen));
+        });
+    };
+
+    const procesarBuffer = () => {
+        let separador;
+        while ((separador = buffer.indexOf('\n\n')) !== -1) {
+            const bloque = buffer.slice(0, separador);
+            buffer = buffer.slice(separador + 2);
+
+            const evento = (bloque.match(/^event: (.*)$/m) || [])[1];
+            const datos = (bloque.match(/^data: (.*)$/m) || [])[1];
+            if (!evento || !datos) continue;
+            const payload = JSON.parse(datos);
+
+            if (primerToken) {
+                removeThinkingMessage();
+                messagesContainer.appendChild(message);
+                primerToken = false;
+            }
+
+            if (evento === 'token') {
+                // El backend ya retira las etiquetas [MOSTRAR_IMAGEN: ...] del texto
+                textoRecibido += payload.texto;
+                textoElem.textContent = textoRecibido;
+            } else if (evento === 'imagenes') {
+                // Se piden en cuanto se cierra la etiqueta, sin esperar al final
+                mostrarImagenes(payload.imagenes);
+            } else if (evento === 'fin') {
+                textoElem.textContent = payload.texto;
+                mostrarImagenes(payload.imagenes);
+            } else if (evento === 'error') {
+                textoElem.textContent = payload.reply;
+                message.style.color = '#d32f2f';
+            }
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+    };
+
+    if (!response.body) {
+        // Sin cuerpo legible por partes: se procesan todos los eventos al final
+        buffer = await response.text();
+        procesarBuffer();
+        return true;
+    }
+    const reader = response.body.getReader();
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        procesarBuffer();
+    }
+    return true;
+}
+
 // Función principal para procesar respuestas del chatbot
 async function respond(text, isDirectReply = false) {
     try {
@@ -327,6 +455,10 @@ async function respond(text, isDirectReply = false) {
                 messagesContainer.scrollTop = messagesContainer.scrollHeight;
             }
 
+            if (await respondStreaming(text)) {
+                return;
+            }
+
             // Enviar mensaje al backend
             const response = await fetch(`${backendUrl}/chat`, {
                 method: 'POST',
@@ -350,6 +482,10 @@ async function respond(text, isDirectReply = false) {
                 return;
             }
             mensajeTexto = data.reply;
+            if (data.imagenes) {
+                showMessageWithAnimation(data.texto, false, [], data.imagenes);
+                return;
+            }
         }
 
         // Detectar etiquetas [MOSTRAR_IMAGEN: ...]
@@ -460,18 +596,52 @@ async function uploadImageToBackend(file) {
         const formData = new FormData();
         formData.append('imagen', file);
         formData.append('sessionId', sessionId);
+        formData.append('asincrono', '1');
 
-        const response = await fetch(`${backendUrl}/subir-imagen`, {
+        let response = await fetch(`${backendUrl}/subir-imagen`, {
             method: 'POST',
             body: formData,
             credentials: 'include'
         });
 
+        // Servidor ocupado: el backend explica el motivo en "reply"
+        if (response.status === 503) {
+            const ocupado = await response.json();
+            showMessageWithAnimation(ocupado.reply, true);
+            return;
+        }
+
+        // Foto rechazada por el control de calidad: "reply" dice qué cambiar
+        if (response.status === 422) {
+            const rechazada = await response.json();
+            respond(rechazada.reply, true);
+            return;
+        }
+
         if (!response.ok) {
             throw new Error(`Error del servidor: ${response.status}`);
         }
 
-        const data = await response.json();
+        let data = await response.json();
+
+        // La foto se analiza, pero el control de calidad avisa de algo que
+        // conviene mejorar (sin rostro de frente, zonas quemadas, primer plano...)
+        const avisos = (data.calidad && data.calidad.avisos) || [];
+        if (avisos.length) {
+            showMessageWithAnimation(`Ten en cuenta: ${avisos.join(' ')}`, false, []);
+        }
+
+        // El análisis corre en segundo plano: consultar hasta que termine
+        while (response.status === 202 && data.jobId) {
+            await new Promise(resolve => setTimeout(resolve, 1500));
+            response = await fetch(`${backendUrl}/trabajos/${data.jobId}`, {
+                credentials: 'include'
+            });
+            if (!response.ok && response.status !== 202) {
+                throw new Error(`Error del servidor: ${response.status}`);
+            }
+            data = await response.json();
+        }
         if (data.reply) {
             respond(data.reply, true);
         } else {